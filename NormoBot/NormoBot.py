@@ -1,20 +1,39 @@
 ﻿import logging
 from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-import g4f
-from pathlib import Path
-import PyPDF2
 from dotenv import load_dotenv
 import os
 import asyncio
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
 import os
 import logging
+import hashlib
+import json
+import io
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import NamedTuple
+from batch import (SUMMARY_WIDTHS, ArchiveError, BatchItem, BatchProgress, archive_members, format_batch_report,
+                   is_archive, member_name, summary_table, unpack_member)
+from chunking import make_chunks, split_sections
+from extractors import HEAD_SIZE, detect_format, supported_formats
+from findings import Finding, format_findings, merge_findings, parse_findings
+from layout_cleanup import clean_layout
+from llm_pool import LLMPool, Route
+from metrics import SIZE_BUCKETS, TOKEN_BUCKETS, Metrics, serve_metrics
+from pdf_extract import extract_pdf_text, pdf_path, terminate_pool
+from pdf_report import render_pdf
+from profiles import classify
+from prompts import PROMPT_VERSION, analysis_messages, count_tokens, message_tokens, outline_messages
+from revisions import (Delta, Revision, Section, attribute_findings, compare_findings, format_delta,
+                       history_entry, plan_revision, split_revision_sections)
+from rules import RuleReport, run_rules
+from scheduler import AnalysisScheduler, QueueFullError
+from standards import check_references, get_index
+from streaming import ProgressMessage
+from tiered_cache import TieredCache, content_key, normalize_text
+from webhook import ChatOrderedProcessor, serve_webhook
 
 
 # Настройка логирования
@@ -24,19 +43,157 @@ logger = logging.getLogger(__name__)
 # Конфигурация
 CONFIG = {
     "llm_model": "gpt-4.1-mini",  # Проверьте, поддерживается ли эта модель в g4f
+    "llm_provider": None,  # Провайдер g4f для llm_model (None — выбор g4f)
+    "llm_fallbacks": [],  # Резервные маршруты по порядку: {"model": ..., "provider": ... или None}
+    "breaker_failures": 3,  # Ошибок подряд, после которых маршрут временно отключается
+    "breaker_reset": 60,  # Через сколько секунд отключённый маршрут получает пробный запрос
+    "hedge_requests": False,  # Дублировать запрос в следующий маршрут, если ответа нет дольше p95
+    "hedge_min_delay": 5,  # Минимальная задержка перед дублированием запроса в секундах
     "retry_attempts": 3,
-    "retry_interval": 5,
+    "retry_interval": 2,  # Базовая пауза между попытками: удваивается с каждой попыткой, со случайным разбросом
+    "retry_max_interval": 30,  # Максимальная пауза между попытками в секундах
     "llm_timeout": 120,
     "max_file_size": 20 * 1024 * 1024,  # 20 MB
+    "max_text_chars": 500000,  # Текст документа сверх этого числа символов не извлекается
+    "clean_layout": True,  # Удалять колонтитулы, номера страниц и переносы из текста документа
     "telegram_timeout": 60,  # Таймаут для запросов к Telegram API
-    "max_message_length": 4000  # Максимальная длина сообщения в символах
+    "max_message_length": 4000,  # Максимальная длина сообщения в символах
+    "pdf_font_path": r"C:\Windows\Fonts\times.ttf",  # Шрифт Times New Roman для PDF-отчётов
+    "pdf_font_bold_path": r"C:\Windows\Fonts\timesbd.ttf",
+    "cache_max_entries": 256,  # Размер LRU-кэша результатов анализа в памяти
+    "cache_db_path": "normobot_cache.sqlite3",  # Дисковый кэш (None — только память)
+    "cache_ttl": 7 * 24 * 3600,  # Время жизни записи кэша в секундах
+    "cache_max_disk_entries": 5000,  # Максимум записей кэша на диске
+    "text_index_max_entries": 32,  # Извлечённых текстов документов в памяти (по file_unique_id)
+    "memory_download_threshold": 8 * 1024 * 1024,  # Файлы до этого размера скачиваются только в память
+    "temp_dir": None,  # Каталог для файлов крупнее порога (None — системный)
+    "extract_workers": os.cpu_count() or 1,  # Процессов для извлечения текста из PDF (0 — поток вместо пула)
+    "pdf_pages_per_task": 20,  # Минимум страниц PDF на одну задачу пула
+    "max_pdf_pages": 500,  # Страницы сверх лимита не обрабатываются
+    "extract_timeout": 60,  # Таймаут извлечения текста из одного документа в секундах
+    "max_concurrent_analyses": 4,  # Одновременных анализов LLM (не больше одного на чат)
+    "max_queued_analyses": 50,  # Длина очереди ожидающих анализов; сверх неё запросы отклоняются
+    "max_concurrent_updates": 32,  # Одновременно обрабатываемых обновлений (разных чатов; в одном чате — по очереди)
+    "max_pending_updates": 256,  # Принятых в обработку обновлений, включая ожидающие своей очереди в чате
+    "webhook_url": None,  # Публичный HTTPS-адрес бота для вебхука (None — long polling)
+    "webhook_listen": "0.0.0.0",  # Адрес HTTP-сервера вебхука
+    "webhook_port": 8443,
+    "webhook_path": "/telegram",
+    "webhook_secret": None,  # Секрет заголовка X-Telegram-Bot-Api-Secret-Token (None — TELEGRAM_WEBHOOK_SECRET из .env)
+    "shutdown_timeout": 600,  # Сколько секунд при остановке дорабатывать начатые и ожидающие проверки
+    "batch_max_members": 40,  # Документов в одном ZIP-архиве не больше
+    "batch_max_unpacked_size": 100 * 1024 * 1024,  # Суммарный размер распакованных документов архива
+    "batch_workers": 4,  # Документов архива, проверяемых одновременно
+    "chunk_threshold": 30000,  # ТЗ длиннее (в символах) анализируется по частям
+    "chunk_max_chars": 12000,  # Максимальный размер фрагмента при анализе по частям
+    "chunk_workers": 4,  # Одновременных запросов к LLM при анализе одного ТЗ по частям
+    "max_concurrent_llm_requests": 16,  # Одновременных запросов к LLM на весь бот (анализы, части ТЗ, документы архивов)
+    "stream_responses": True,  # Показывать ответ LLM по мере генерации
+    "stream_edit_interval": 2.0,  # Минимальный интервал между правками сообщения в секундах
+    "rules_structure_min_chars": 1500,  # Структура проверяется правилами только у ТЗ не короче этого
+    "rules_only": False,  # Только локальная проверка правилами, без LLM
+    "domain_profile": None,  # Профиль проверки: battery, electrical, software, generic (None — по тексту ТЗ)
+    "incremental_revisions": True,  # Новую редакцию ТЗ в том же чате проверять только по изменённым разделам
+    "revision_min_chars": 3000,  # ТЗ короче проверяются заново целиком
+    "revision_min_unchanged": 0.5,  # Доля неизменных разделов, при которой документ считается новой редакцией
+    "metrics_host": "127.0.0.1",  # Адрес HTTP-эндпоинта метрик Prometheus
+    "metrics_port": None,  # Порт эндпоинта метрик (None — не запускать)
+    "metrics_log_interval": 300  # Период записи снимка метрик в журнал в секундах (0 — не писать)
 }
 
+# Ответы-заглушки при ошибках LLM (в кэш не попадают)
+LLM_FAILURE_MESSAGE = "Не удалось получить ответ от LLM. Попробуйте позже."
+LLM_UNRECOGNIZED_MESSAGE = "Ответ LLM не распознан."
+
+# Повторов извлечения PDF, если пул процессов остановлен из-за другого документа
+EXTRACT_POOL_RETRIES = 2
+
+
+class CheckResult(NamedTuple):
+    """Результат проверки текста ТЗ (check_text)."""
+    rule_findings: list[Finding]  # замечания локальной проверки правилами
+    findings: list[Finding]  # замечания LLM
+    report: str  # текст отчёта: замечания правил и ответ LLM, при отказе LLM — текст ошибки
+    llm_failed: bool
+
+
 class NormalControllerBot:
-    def __init__(self, token: str):
+    def __init__(self, token: str | None):
         self.token = token
-        self.application = Application.builder().token(self.token).read_timeout(CONFIG["telegram_timeout"]).write_timeout(CONFIG["telegram_timeout"]).build()
-        self.setup_handlers()
+        # Без токена Telegram не используется (normo_cli.py): только извлечение текста, анализ и PDF
+        self.application = None if token is None else Application.builder().token(self.token).read_timeout(CONFIG["telegram_timeout"]).write_timeout(CONFIG["telegram_timeout"]).concurrent_updates(ChatOrderedProcessor(CONFIG["max_concurrent_updates"], CONFIG["max_pending_updates"])).post_init(self._start_metrics).post_shutdown(self._stop_metrics).build()
+        self.analysis_cache = TieredCache(
+            "analysis",
+            max_entries=CONFIG["cache_max_entries"],
+            db_path=CONFIG["cache_db_path"],
+            ttl=CONFIG["cache_ttl"],
+            max_disk_entries=CONFIG["cache_max_disk_entries"],
+        )
+        # Индекс извлечённых текстов: file_unique_id или хэш содержимого -> текст и число страниц
+        self.text_index = TieredCache(
+            "text",
+            max_entries=CONFIG["text_index_max_entries"],
+            db_path=CONFIG["cache_db_path"],
+            ttl=CONFIG["cache_ttl"],
+            max_disk_entries=CONFIG["cache_max_disk_entries"],
+        )
+        # История проверок по чатам: разделы последнего ТЗ (хэши) и замечания к ним
+        self.revision_history = TieredCache(
+            "history",
+            max_entries=CONFIG["cache_max_entries"],
+            db_path=CONFIG["cache_db_path"],
+            ttl=CONFIG["cache_ttl"],
+            max_disk_entries=CONFIG["cache_max_disk_entries"],
+        )
+        self._extract_pool = None
+        self._extract_closed = False
+        self.metrics = Metrics()
+        self.llm_pool = self._make_llm_pool()
+        # Общий лимит запросов к LLM: архив занимает один слот планировщика, но его документы
+        # и части длинных ТЗ запрашивают LLM параллельно
+        self.llm_slots = asyncio.Semaphore(CONFIG["max_concurrent_llm_requests"])
+        self._metrics_server = None
+        self._metrics_task = None
+        self.scheduler = AnalysisScheduler(CONFIG["max_concurrent_analyses"], CONFIG["max_queued_analyses"])
+        if self.application is not None:
+            self.setup_handlers()
+
+    def _make_llm_pool(self) -> LLMPool:
+        """Пул маршрутов LLM: основная модель llm_model/llm_provider, затем llm_fallbacks по порядку."""
+        specs = [{"model": CONFIG["llm_model"], "provider": CONFIG["llm_provider"]}, *CONFIG["llm_fallbacks"]]
+        routes = [
+            Route(spec["model"], spec.get("provider"), CONFIG["breaker_failures"], CONFIG["breaker_reset"])
+            for spec in specs
+        ]
+        return LLMPool(
+            routes,
+            attempts=CONFIG["retry_attempts"] + 1,
+            timeout=CONFIG["llm_timeout"],
+            backoff_base=CONFIG["retry_interval"],
+            backoff_max=CONFIG["retry_max_interval"],
+            hedge=CONFIG["hedge_requests"],
+            hedge_min_delay=CONFIG["hedge_min_delay"],
+            metrics=self.metrics,
+        )
+
+    async def _start_metrics(self, application: Application):
+        """Запуск эндпоинта метрик и периодической записи снимка в журнал."""
+        if CONFIG["metrics_port"] is not None:
+            self._metrics_server = await serve_metrics(self.metrics, CONFIG["metrics_host"], CONFIG["metrics_port"])
+        if CONFIG["metrics_log_interval"]:
+            self._metrics_task = asyncio.create_task(self._log_metrics(CONFIG["metrics_log_interval"]))
+
+    async def _stop_metrics(self, application: Application):
+        if self._metrics_task is not None:
+            self._metrics_task.cancel()
+        if self._metrics_server is not None:
+            self._metrics_server.close()
+            await self._metrics_server.wait_closed()
+
+    async def _log_metrics(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            logger.info(f"Метрики: {json.dumps(self.metrics.snapshot(), ensure_ascii=False)}")
 
     def setup_handlers(self):
         """Настройка обработчиков команд и сообщений."""
@@ -48,7 +205,7 @@ class NormalControllerBot:
         """Обработчик команды /start."""
         await update.message.reply_text(
             "Привет! Я нормоконтролёр для проверки технических заданий. "
-            "Отправьте текст ТЗ или прикрепите файл (PDF, TXT). "
+            f"Отправьте текст ТЗ или прикрепите файл ({supported_formats()}). "
             "Я проверю документ на соответствие ГОСТам."
         )
 
@@ -56,330 +213,678 @@ class NormalControllerBot:
         """Обработчик текстовых сообщений с ТЗ."""
         text = update.message.text
         logger.info("Получен текст для анализа")
-        await update.message.reply_text("Проверяю ваше техническое задание...")
-        analysis = await self.analyze_tz(text)
-        await self.send_analysis(update, analysis)
+        self.metrics.inc("normobot_updates_total", kind="text")
+        await self.enqueue_analysis(update, context, text)
 
     async def handle_document(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обработчик документов (PDF, TXT)."""
+        """Обработчик документов (PDF, DOCX, ODT, RTF, TXT) и ZIP-архивов с ними."""
         document = update.message.document
+        self.metrics.inc("normobot_updates_total", kind="document")
+        if document.file_size is not None:
+            self.metrics.observe("normobot_document_bytes", document.file_size, SIZE_BUCKETS)
         if document.file_size > CONFIG["max_file_size"]:
             await update.message.reply_text("Файл слишком большой. Максимальный размер: 20 МБ.")
             return
+        if is_archive(document.mime_type, document.file_name or ""):
+            logger.info(f"Получен архив: {document.file_name}")
+            admitted = asyncio.Event()
+            context.application.create_task(
+                self._run_scheduled(update, lambda: self.review_archive(update, document), admitted.set), update=update
+            )
+            await admitted.wait()
+            return
 
-        file = await document.get_file()
-        file_path = f"temp_{document.file_id}"
         try:
-            logger.info(f"Скачивание файла: {document.file_name}")
-            await file.download_to_drive(file_path)
-            file_text = self.extract_text_from_file(file_path, document.mime_type)
+            file_text = await self.get_document_text(document)
             message_text = update.message.text or ""  # Текст сообщения, если есть
             combined_text = f"{message_text}\n\n{file_text}" if message_text else file_text
             logger.info("Текст из файла и сообщения объединён")
-            await update.message.reply_text("Проверяю ваше техническое задание...")
-            analysis = await self.analyze_tz(combined_text)
-            await self.send_analysis(update, analysis)
         except Exception as e:
             logger.error(f"Ошибка обработки файла: {e}")
-            await update.message.reply_text("Ошибка при обработке файла. Попробуйте отправить другой файл (PDF или TXT).")
-        finally:
-            if Path(file_path).exists():
-                Path(file_path).unlink()
-                logger.info(f"Временный файл {file_path} удалён")
+            await update.message.reply_text(f"Ошибка при обработке файла. Попробуйте отправить другой файл ({supported_formats()}).")
+            return
+        await self.enqueue_analysis(update, context, combined_text)
+
+    async def enqueue_analysis(self, update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
+        """
+        Передача анализа планировщику в фоновой задаче, чтобы не блокировать обработку обновлений.
+        Обработчик возвращается, когда планировщик принял анализ (слот или место в очереди): до этого
+        ChatOrderedProcessor не начинает следующее обновление чата, поэтому анализы одного чата
+        встают в очередь в порядке поступления сообщений.
+        """
+        admitted = asyncio.Event()
+        context.application.create_task(self._run_scheduled_analysis(update, text, admitted.set), update=update)
+        await admitted.wait()
+
+    async def _run_scheduled_analysis(self, update: Update, text: str, on_admitted=None):
+        """Анализ ТЗ через планировщик (_run_scheduled)."""
+        async def job():
+            profile, report = self._check_rules(text)
+            if CONFIG["rules_only"]:
+                await self.send_analysis(update, self._format_precheck(report) or "Замечаний не выявлено.")
+                return
+            precheck = await self._send_precheck(update, report)
+            status = await update.message.reply_text("Проверяю ваше техническое задание...")
+            progress = self._progress_message(status)
+            analysis = await self.analyze_tz(text, progress, report, update.effective_chat.id, profile)
+            if precheck:
+                analysis = f"{precheck}\n\n{analysis}"
+            await self.send_analysis(update, analysis, progress)
+
+        await self._run_scheduled(update, job, on_admitted)
+
+    async def _run_scheduled(self, update: Update, job, on_admitted=None):
+        """
+        Выполнение job (анализ ТЗ или архива) с учётом глобального лимита, очереди и правила «один анализ на чат».
+        on_admitted вызывается, когда планировщик принял job или отказал (очередь заполнена).
+        """
+        async def on_queued(position: int):
+            await update.message.reply_text(
+                f"Ваше ТЗ поставлено в очередь на проверку, позиция: {position}. "
+                "Проверка начнётся автоматически."
+            )
 
-    def extract_text_from_file(self, file_path: str, mime_type: str) -> str:
-        """Извлечение текста из файла (PDF или TXT)."""
         try:
-            file_ext = Path(file_path).suffix.lower()
-            if mime_type == "application/pdf" or file_ext == ".pdf":
-                with open(file_path, "rb") as f:
-                    reader = PyPDF2.PdfReader(f)
-                    text = ""
-                    for page in reader.pages:
-                        extracted = page.extract_text()
-                        if extracted:
-                            text += extracted
-                    logger.info("Текст успешно извлечён из PDF")
-                    return text
-            elif mime_type == "text/plain" or file_ext == ".txt":
-                with open(file_path, "r", encoding="utf-8") as f:
-                    return f.read()
+            await self.scheduler.run(update.effective_chat.id, job, on_queued, on_admitted)
+        except QueueFullError as e:
+            if on_admitted is not None:
+                on_admitted()
+            logger.warning(f"Запрос отклонён: {e}")
+            await update.message.reply_text("Сейчас слишком много проверок. Попробуйте отправить ТЗ через несколько минут.")
+        except Exception as e:
+            logger.error(f"Ошибка анализа: {e}", exc_info=True)
+            await update.message.reply_text("Ошибка при проверке ТЗ. Попробуйте позже.")
+
+    async def review_archive(self, update: Update, document):
+        """
+        Пакетная проверка ZIP-архива с ТЗ. Документы распаковываются по одному во временный
+        каталог и проверяются параллельно (не больше batch_workers) обычным путём
+        extract_text_from_file -> analyze_tz; ход проверки показывается в сообщении о статусе.
+        Результат — один PDF со сводной таблицей и замечаниями по каждому документу.
+        """
+        status = await update.message.reply_text("Получен архив, распаковываю...")
+        with self._download_buffer(document.file_size) as buffer, \
+                tempfile.TemporaryDirectory(dir=CONFIG["temp_dir"]) as directory:
+            with self.metrics.timer("download"):
+                file = await document.get_file()
+                await file.download_to_memory(buffer)
+            try:
+                archive = zipfile.ZipFile(buffer)
+                members = archive_members(archive, CONFIG["batch_max_members"], CONFIG["batch_max_unpacked_size"])
+            except zipfile.BadZipFile:
+                await status.edit_text("Файл не является ZIP-архивом или повреждён.")
+                return
+            except ArchiveError as e:
+                await status.edit_text(str(e))
+                return
+            with archive:
+                logger.info(f"Пакетная проверка: {len(members)} документов в архиве {document.file_name}")
+                await status.edit_text(f"В архиве документов: {len(members)}. Проверяю...")
+                progress = BatchProgress(status, len(members), CONFIG["stream_edit_interval"])
+                semaphore = asyncio.Semaphore(CONFIG["batch_workers"])
+                with self.metrics.timer("batch"):
+                    items = await asyncio.gather(*(
+                        self._review_member(archive, info, index, directory, semaphore, progress)
+                        for index, info in enumerate(members, 1)
+                    ))
+
+        pdf = await asyncio.to_thread(self.create_pdf, format_batch_report(items), summary_table(items), SUMMARY_WIDTHS)
+        checked = sum(1 for item in items if item.findings is not None)
+        filename = f"batch_{update.message.chat_id}_{update.message.message_id}.pdf"
+        await update.message.reply_document(
+            pdf, filename=filename, caption=f"Сводный отчёт: проверено документов {checked} из {len(items)}."
+        )
+        logger.info(f"Сводный отчёт {filename} отправлен")
+
+    async def _review_member(self, archive: zipfile.ZipFile, info: zipfile.ZipInfo, index: int, directory: str,
+                             semaphore: asyncio.Semaphore, progress: BatchProgress) -> BatchItem:
+        """Проверка одного документа архива; ошибка в нём не прерывает проверку остальных."""
+        name = member_name(info)
+        async with semaphore:
+            path = None
+            try:
+                path = await asyncio.to_thread(unpack_member, archive, info, directory, index, CONFIG["max_file_size"])
+                text = await self.extract_text_from_file(path, "")
+                if not text.strip():
+                    raise ArchiveError("текст не извлечён")
+                result = await self.check_text(text)
+                if result.llm_failed:
+                    item = BatchItem(name, len(text), None, result.report, "LLM недоступна")
+                else:
+                    findings = len(result.rule_findings) + len(result.findings)
+                    item = BatchItem(name, len(text), findings, result.report, "проверен")
+            except Exception as e:
+                logger.warning(f"Документ {name} из архива не проверен: {e}")
+                item = BatchItem(name, 0, None, f"Документ не проверен: {e}", f"ошибка: {e}"[:80])
+            finally:
+                if path is not None:
+                    os.remove(path)
+        self.metrics.inc("normobot_batch_documents_total", result="ok" if item.findings is not None else "error")
+        await progress.advance(name)
+        return item
+
+    async def check_text(self, text: str) -> CheckResult:
+        """
+        Проверка текста ТЗ без Telegram (документы архива, normo_cli.py): профиль, правила,
+        анализ LLM (кроме rules_only) и текст отчёта с замечаниями правил и LLM.
+        """
+        profile, report = self._check_rules(text)
+        analysis = "" if CONFIG["rules_only"] else await self.analyze_tz(text, report=report, profile=profile)
+        if self._is_llm_failure(analysis):
+            return CheckResult(report.findings, [], analysis, True)
+        details = "\n\n".join(part for part in (self._format_precheck(report), analysis) if part)
+        return CheckResult(report.findings, parse_findings(analysis), details, False)
+
+    async def get_document_text(self, document) -> str:
+        """
+        Текст документа: из индекса по file_unique_id без скачивания,
+        иначе скачивание и поиск по хэшу содержимого, иначе извлечение.
+        """
+        unique_key = f"fuid:{document.file_unique_id}"
+        entry = await self.text_index.aget(unique_key)
+        if entry is not None:
+            logger.info(f"Текст файла {document.file_name} взят из индекса ({entry['pages']} стр.), скачивание пропущено")
+            return entry["text"]
+
+        logger.info(f"Скачивание файла: {document.file_name}")
+        with self._download_buffer(document.file_size) as buffer:
+            with self.metrics.timer("download"):
+                file = await document.get_file()
+                await file.download_to_memory(buffer)
+            buffer.seek(0)
+
+            digest = hashlib.sha256()
+            for block in iter(lambda: buffer.read(1024 * 1024), b""):
+                digest.update(block)
+            hash_key = f"sha256:{digest.hexdigest()}"
+            entry = await self.text_index.aget(hash_key)
+            if entry is None:
+                buffer.seek(0)
+                text, pages = await self.extract_document(buffer, document.mime_type, document.file_name or "")
+                entry = {"text": text, "pages": pages}
+                await self.text_index.aset(hash_key, entry)
             else:
-                raise ValueError("Неподдерживаемый формат файла. Используйте PDF или TXT.")
+                logger.info(f"Текст файла {document.file_name} найден по хэшу содержимого ({entry['pages']} стр.)")
+        await self.text_index.aset(unique_key, entry)
+        return entry["text"]
+
+    def _download_buffer(self, file_size: int | None):
+        """
+        Буфер для скачивания: BytesIO для файлов до порога,
+        иначе SpooledTemporaryFile, который уходит на диск только при превышении порога.
+        """
+        threshold = CONFIG["memory_download_threshold"]
+        if file_size is not None and file_size <= threshold:
+            return io.BytesIO()
+        return tempfile.SpooledTemporaryFile(max_size=threshold, dir=CONFIG["temp_dir"])
+
+    def _get_extract_pool(self):
+        """Пул процессов для извлечения текста из PDF (создаётся при первом обращении)."""
+        if self._extract_pool is None and CONFIG["extract_workers"] > 0:
+            self._extract_pool = ProcessPoolExecutor(max_workers=CONFIG["extract_workers"])
+        return self._extract_pool
+
+    async def _terminate_extract_pool(self, pool) -> bool:
+        """
+        Остановка пула извлечения с завершением рабочих процессов, если он ещё текущий.
+        Возвращает False, если пул уже заменён (его остановил другой документ).
+        """
+        if pool is None or pool is not self._extract_pool:
+            return False
+        self._extract_pool = None
+        await asyncio.to_thread(terminate_pool, pool)
+        return True
+
+    async def _extract_pdf(self, path: str) -> tuple[str, int]:
+        """
+        Извлечение текста PDF в общем пуле процессов. Пул останавливается целиком, когда документ
+        превышает extract_timeout или рабочий процесс падает; диапазоны других документов в этом пуле
+        при этом отменяются или завершаются с BrokenProcessPool, и их извлечение повторяется в новом пуле.
+        """
+        for attempt in range(EXTRACT_POOL_RETRIES + 1):
+            pool = self._get_extract_pool()
+            try:
+                return await extract_pdf_text(
+                    path,
+                    pool,
+                    workers=CONFIG["extract_workers"] or 1,
+                    min_pages=CONFIG["pdf_pages_per_task"],
+                    max_pages=CONFIG["max_pdf_pages"],
+                    timeout=CONFIG["extract_timeout"],
+                )
+            except TimeoutError:
+                # Зависшие диапазоны страниц заняли бы рабочие процессы и для следующих документов:
+                # пул останавливается, следующий документ получит новый
+                if await self._terminate_extract_pool(pool):
+                    logger.error("Пул извлечения текста остановлен после превышения времени и будет пересоздан")
+                raise
+            except (asyncio.CancelledError, BrokenProcessPool) as e:
+                # Отмена самой задачи (остановка бота) пробрасывается как есть
+                if pool is None or asyncio.current_task().cancelling():
+                    raise
+                if await self._terminate_extract_pool(pool):
+                    logger.error("Пул извлечения текста завершился аварийно и будет пересоздан")
+                if attempt == EXTRACT_POOL_RETRIES or self._extract_closed:
+                    raise BrokenProcessPool("пул извлечения текста остановлен во время обработки документа") from e
+                logger.warning("Пул извлечения текста остановлен во время обработки документа, повтор в новом пуле")
+
+    async def extract_text_from_file(self, file_path: str, mime_type: str) -> str:
+        """Извлечение текста из файла (форматы extractors.py)."""
+        with open(file_path, "rb") as f:
+            text, _ = await self.extract_document(f, mime_type, file_path)
+        return text
+
+    async def extract_document(self, stream, mime_type: str, file_name: str = "") -> tuple[str, int]:
+        """
+        Извлечение текста и числа страниц из бинарного потока. Формат определяется по первым
+        байтам, MIME-типу и расширению (extractors.py). PDF обрабатывается в пуле процессов,
+        остальные форматы читаются потоком в отдельном потоке до max_text_chars символов.
+        """
+        try:
+            head = stream.read(HEAD_SIZE)
+            stream.seek(0)
+            extractor = detect_format(head, mime_type, file_name)
+            if extractor is None:
+                raise ValueError(f"Неподдерживаемый формат файла. Используйте {supported_formats()}.")
+            self.metrics.inc("normobot_document_format_total", format=extractor.name)
+            max_chars = CONFIG["max_text_chars"]
+            with self.metrics.timer("extract"):
+                if extractor.extract is None:
+                    async with pdf_path(stream, CONFIG["temp_dir"]) as path:
+                        text, pages = await self._extract_pdf(path)
+                else:
+                    async with asyncio.timeout(CONFIG["extract_timeout"]):
+                        text, pages = await asyncio.to_thread(extractor.extract, stream, max_chars)
+            logger.info(f"Текст успешно извлечён из {extractor.name.upper()} ({pages} стр., {len(text)} символов)")
+            if CONFIG["clean_layout"]:
+                text = await asyncio.to_thread(self._clean_layout, text)
+            if len(text) >= max_chars:
+                logger.warning(f"Документ длиннее {max_chars} символов, остаток не проверяется")
+            return text[:max_chars], pages
         except Exception as e:
             logger.error(f"Ошибка извлечения текста: {e}")
             raise
 
-    async def analyze_tz(self, text: str) -> str:
-        """Анализ ТЗ с использованием LLM."""
-        prompt = """
-        ### Промпт для нормоконтроля технического задания
-
-        ### Роль
-        Вы — нормоконтролер, специализирующийся на проверке технических заданий (ТЗ) на соответствие ГОСТам и лучшим практикам технической документации.
-
-        ### Задача
-        Проанализируйте предоставленное техническое задание, выявите ошибки, несоответствия или отклонения от требуемых стандартов и предложите исправления в формате: «Было / Замечание / Должно быть».
-
-        ### Инструкции
-
-        #### Проверка структуры
-        Убедитесь, что проектная (конструкторская) документация на разработку аккумуляторной батареи для электроавтомобиля содержит все необходимые разделы в соответствии с ГОСТ 15.016-2016 и другими применимыми нормативными документами, включая, но не ограничиваясь:
-        - ГОСТ 15.016-2016 — Система разработки и постановки продукции на производство. Проектная документация  
-        - ГОСТ Р 53778-2010 — Аккумуляторные батареи. Общие технические условия  
-        - ГОСТ Р 52350.11-2005 — Безопасность электрического оборудования. Требования к аккумуляторным батареям  
-        - ГОСТ 12.2.007.0-75 — Электробезопасность  
-        - ГОСТ 30804.4.2-2013 и ГОСТ 30804.4.3-2013 — Электромагнитная совместимость  
-        - ГОСТ 12.1.044-89 — Пожарная безопасность  
-        - Правила устройства электроустановок (ПУЭ)  
-        - НПБ 105-03 — Нормы пожарной безопасности для аккумуляторных помещений  
-        - ISO 12405 и/или IEC 62660 (при использовании международных стандартов)
-
-        Типичные обязательные разделы документации включают:
-
-        - Введение  
-        - Наименование, основание и сроки разработки  
-        - Цель разработки, наименование и обозначение изделия  
-        - Технические требования к изделию  
-        - Требования к сырью и материалам  
-        - Требования к консервации, упаковке и маркировке  
-        - Требования к учебно-тренировочным средствам (при необходимости)  
-        - Специальные требования (безопасность, экология, электромагнитная совместимость)  
-        - Требования к документации  
-        - Этапы выполнения разработки с указанием сроков и ответственных  
-        - Порядок выполнения и приемки этапов разработки  
-        - Примечания и дополнительные указания  
-
-        Проверьте наличие всех обязательных разделов, отметьте отсутствие необходимых и наличие избыточных разделов, а также соответствие содержания требованиям нормативных документов и специфике разработки АКБ для электроавтомобиля.
-
-        #### Проверка содержания
-        Проверьте, что все указанные стандарты ГОСТ и нормативные документы актуальны и правильно указаны. Убедитесь, что требования конкретны, измеримы, достижимы, релевантны и ограничены по времени (SMART). Проверьте отсутствие противоречивых или неоднозначных утверждений. Подтвердите, что все технические параметры указаны точно и полно, включая:
-        - Номинальное напряжение аккумулятора и отдельных элементов (например, 12 В на элемент, 192 В на батарею из 16 элементов)
-        - Емкость аккумулятора (в ампер-часах), определяющая запас энергии
-        - Тип аккумуляторов (свинцово-кислотные, литий-ионные и др.) и их конструктивные особенности
-        - Количество и схема соединения элементов (последовательное, параллельное подключение)
-        - Ток заряда и разряда, включая максимальные пиковые токи и пусковые токи оборудования
-        - Требования к качеству электропитания — стабильность напряжения и частоты, допустимые отклонения
-        - Рабочая температура и условия эксплуатации аккумуляторов
-        - Требования к системам контроля и безопасности — наличие систем мониторинга состояния (PCM), защита от перегрузок и коротких замыканий
-        - Требования к производственной документации — чертежи, спецификации, инструкции по эксплуатации
-        - Испытания и контроль качества — проверка емкости, напряжения, надежности и безопасности
-        - Требования к монтажу и обслуживанию, включая условия установки и вентиляции аккумуляторных помещений
-        - Сроки изготовления и поставки
-        - Соответствие нормативам и стандартам (например, ГОСТ, ПУЭ, НПБ 105-03)
-        1. Требования к габаритам и массе аккумуляторной батареи — размеры, вес, что важно для интеграции в конструкцию автомобиля.
-        2. Условия транспортировки и хранения — температурные режимы, влажность, вибрации и удары.
-        3. Энергоэффективность и коэффициент полезного действия батареи.
-        4. Срок службы и циклы заряда-разряда — гарантийные показатели долговечности.
-        5. Требования к системе охлаждения — тип, эффективность, способы реализации.
-        6. Электромагнитная совместимость (EMC) — требования к помехозащищенности и излучению.
-        7. Требования к программному обеспечению систем управления батареей (BMS) — алгоритмы управления, диагностика и обновление ПО.
-        8. Требования к утилизации и экологической безопасности — материалы, возможность переработки.
-        9. Требования к маркировке и идентификации элементов и сборок.
-        10. Требования к документации по безопасности при аварийных ситуациях — инструкции по действиям при возгорании, утечках и т.п.
-        11. Требования к совместимости с другими системами автомобиля — интерфейсы, протоколы обмена данными.
-        12. Требования к испытаниям на вибрацию, удар, коррозию и другие механические воздействия.
-
-
-        Проверка максимизации емкости АКБ относительно массы и актуальности технологии:
-
-        1. Оцените используемую технологию производства аккумуляторных элементов с точки зрения удельной емкости (емкость на единицу массы, Ач/кг).  
-        2. Проверьте соответствие выбранных материалов и химических составов современным достижениям в области аккумуляторных технологий (например, литий-ионные, твердотельные, литий-железо-фосфатные и др.).  
-        3. Проанализируйте конструктивные решения, влияющие на снижение массы батареи при сохранении или увеличении емкости (например, использование легких корпусов, оптимизация толщины электродов, компоновка элементов).  
-        4. Оцените технологию сборки и контроля качества, обеспечивающую максимальную плотность энергии и минимальные потери.  
-        5. Проверьте наличие данных по испытаниям и подтверждению удельной емкости, включая сравнительный анализ с аналогичными технологиями на рынке.  
-        6. Оцените актуальность технологии с учетом последних тенденций и инноваций в области аккумуляторных систем для электромобилей (например, исследования и внедрение новых материалов, технологий производства, систем управления батареей).  
-        7. Проверьте соответствие технологии требованиям безопасности, долговечности и экологичности при максимальной емкости и минимальной массе.  
-        8. Оцените перспективы масштабирования и серийного производства с сохранением заявленных параметров.
-
-        Внешнии характеристики точнее устойчивость к ним
-        Чек-лист проверки АКБ по температуре эксплуатации, вибрации и механическим воздействиям
-
-        1. Температура эксплуатации
-        -   Указан диапазон рабочих температур (минимальная, максимальная, оптимальная).  
-        -   Диапазон температур соответствует условиям эксплуатации электроавтомобиля (климатические зоны, сезонные колебания).  
-        -   Присутствуют данные по устойчивости к экстремальным температурам (низкие и высокие температуры).  
-        -   Описаны системы терморегуляции и охлаждения, их эффективность и характеристики.  
-        -   Приведены результаты испытаний на работоспособность и безопасность при различных температурах.  
-        -   Оценено влияние температуры на емкость, срок службы, безопасность и скорость заряда/разряда.  
-        -   Указаны требования к хранению и транспортировке с учетом температурных ограничений.  
-        -   Соответствие температурных параметров требованиям нормативных документов (ГОСТ, ISO, IEC и др.).
-
-         2. Вибрация
-        -   Указаны параметры вибрационных испытаний (частотные диапазоны, амплитуды).  
-        -   Проведены испытания на вибрационную устойчивость в соответствии с эксплуатационными условиями автомобиля.  
-        -   Описаны конструктивные решения и методы защиты от вибраций.  
-        -   Приведены результаты испытаний и сертификаций по вибрационной прочности.  
-        -   Оценено влияние вибраций на безопасность, надежность и срок службы АКБ.  
-        -   Соответствие вибрационных параметров требованиям нормативных документов (ГОСТ, ISO, IEC и др.).
-
-         3. Механические воздействия
-        -   Описаны виды механических воздействий, которым подвергается АКБ (удары, сотрясения, вибрации).  
-        -   Проведены испытания на ударопрочность и механическую прочность.  
-        -   Описаны конструктивные меры по повышению механической устойчивости (корпус, крепления, амортизация).  
-        -   Приведены результаты испытаний и сертификаций по механической прочности.  
-        -   Оценено влияние механических воздействий на безопасность, надежность и срок службы АКБ.  
-        -   Соответствие механических параметров требованиям нормативных документов (ГОСТ, ISO, IEC и др.).
-
-
-
-        #### Проверка оформления
-        Убедитесь, что документ соответствует требованиям оформления:
-        - Шрифт, отступы, нумерация разделов
-        - Правильные подписи и ссылки на рисунки, таблицы и схемы в тексте
-
-        #### Проверка языка и ясности
-        Убедитесь, что язык документа ясен, лаконичен и подходит для целевой аудитории. Проверьте, что все технические термины определены и используются корректно.
-
-        ### Формат ответа
-        Для каждой выявленной ошибки укажите:
-        - Было: [цитата или описание ошибки]
-        - Замечание: [объяснение, почему это ошибка, со ссылкой на стандарт или лучшую практику]
-        - Должно быть: [предложение по исправлению]
-
-        ### Примеры
-        #### Ошибка в структуре
-        - Было: В документе отсутствует раздел «Требования к документации»
-        - Замечание: Согласно ГОСТ 15.016-2016, ТЗ должно включать раздел о требованиях к документации, описывающий необходимые документы и их формат
-        - Должно быть: Добавить раздел «Требования к документации» с указанием необходимых документов в соответствии с ГОСТ Р 15.301
-
-        #### Ошибка в содержании (неуказанные параметры)
-        - Было: Отсутствует информация о токе разряда аккумулятора
-        - Замечание: Ток разряда, включая максимальные пиковые токи, обязателен для определения эксплуатационных характеристик (ГОСТ 15.016-2016, раздел технических требований)
-        - Должно быть: Указать: «Ток разряда — 120 А, максимальный пиковый ток — 150 А»
-
-        #### Ошибка в ссылках
-        - Было: Указан ГОСТ 12345-2000
-        - Замечание: ГОСТ 12345-2000 устарел и заменен ГОСТ 12345-2015. Необходимо использовать актуальную версию стандарта
-        - Должно быть: Обновить ссылку на ГОСТ 12345-2015
-
-        #### Ошибка в ясности
-        - Было: «Аккумулятор должен быть надежным»
-        - Замечание: Формулировка неконкретна, не указаны параметры надежности (например, срок службы)
-        - Должно быть: «Срок службы аккумулятора не менее 2 лет при соблюдении условий эксплуатации»
-
-        ### Дополнительные замечания
-        Если конкретные детали стандарта неизвестны, опирайтесь на общие лучшие практики для технической документации. Приоритет отдавайте ясности, точности и полноте при проверке.
-
-        ### Итоговый результат
-        После анализа всего документа составьте полный список выявленных ошибок и предложенных исправлений.
-
-        Текст ТЗ:
-        {text}
-        """.format(text=text)
-        logger.info("Отправка запроса к LLM")
-        response = await self._llm_request(prompt)
+    def _clean_layout(self, text: str) -> str:
+        """Очистка текста документа (layout_cleanup.py); размер до и после — в журнал и метрики."""
+        result = clean_layout(text)
+        sizes = {"raw": (len(text), count_tokens(text)), "clean": (len(result.text), count_tokens(result.text))}
+        for stage, (chars, tokens) in sizes.items():
+            self.metrics.observe("normobot_document_text_chars", chars, SIZE_BUCKETS, stage=stage)
+            self.metrics.observe("normobot_document_tokens", tokens, TOKEN_BUCKETS, stage=stage)
+        logger.info(
+            f"Очистка текста: символов {sizes['raw'][0]} -> {sizes['clean'][0]}, "
+            f"токенов {sizes['raw'][1]} -> {sizes['clean'][1]}, удалено повторяющихся строк: "
+            f"{result.removed_lines}, склеено переносов: {result.joined_hyphens}"
+        )
+        return result.text
+
+    @staticmethod
+    def _format_precheck(report: RuleReport) -> str:
+        """Замечания локальной проверки в формате ответа бота."""
+        if not report.findings:
+            return ""
+        return "Автоматическая проверка по правилам:\n\n" + format_findings(report.findings)
+
+    async def _send_precheck(self, update: Update, report: RuleReport) -> str:
+        """
+        Немедленная отправка замечаний локальной проверки. Если они не помещаются
+        в одно сообщение, возвращается текст для добавления к итоговому ответу.
+        """
+        precheck = self._format_precheck(report)
+        if precheck and len(precheck) <= CONFIG["max_message_length"]:
+            await update.message.reply_text(precheck)
+            return ""
+        return precheck
+
+    def _progress_message(self, status) -> ProgressMessage | None:
+        """Сообщение о ходе проверки для потокового режима (None, если он выключен)."""
+        if not CONFIG["stream_responses"]:
+            return None
+        return ProgressMessage(status, CONFIG["stream_edit_interval"], CONFIG["max_message_length"])
+
+    def _select_profile(self, text: str) -> str:
+        """Профиль предметной области: CONFIG["domain_profile"] или определённый по тексту ТЗ (profiles.py)."""
+        if CONFIG["domain_profile"] is not None:
+            profile = CONFIG["domain_profile"]
+        else:
+            profile, scores = classify(text)
+            logger.info(f"Профиль ТЗ: {profile}, оценки: {scores}")
+        self.metrics.inc("normobot_profile_total", profile=profile)
+        return profile
+
+    def _check_rules(self, text: str) -> tuple[str, RuleReport]:
+        """Профиль ТЗ и локальная проверка правилами для него (параметры АКБ — только для профиля battery)."""
+        profile = self._select_profile(text)
+        return profile, run_rules(text, CONFIG["rules_structure_min_chars"], profile)
+
+    async def analyze_tz(self, text: str, progress: ProgressMessage | None = None,
+                         report: RuleReport | None = None, chat_id: int | None = None,
+                         profile: str | None = None) -> str:
+        """
+        Анализ ТЗ с использованием LLM (с кэшированием по содержимому).
+        progress получает ответ по мере генерации (кроме анализа по частям).
+        То, что уже проверено локальными правилами (report), в промпт не включается,
+        а чек-листы берутся только из профиля предметной области документа.
+        Если в чате chat_id уже проверялась предыдущая редакция того же ТЗ,
+        заново проверяются только изменённые разделы (см. _analyze_revision).
+        profile и report передаются, если уже получены (_check_rules), иначе определяются здесь.
+        """
+        if profile is None:
+            profile = self._select_profile(text)
+        if report is None:
+            report = run_rules(text, CONFIG["rules_structure_min_chars"], profile)
+        context = content_key(PROMPT_VERSION, get_index().version, CONFIG["llm_model"], profile)
+        self.metrics.observe("normobot_document_chars", len(text), SIZE_BUCKETS)
+        history_key = None
+        sections = None
+        if chat_id is not None and CONFIG["incremental_revisions"] and len(text) >= CONFIG["revision_min_chars"]:
+            history_key = f"chat:{chat_id}"
+            sections = split_revision_sections(text)
+
+        cache_key = content_key(normalize_text(text), PROMPT_VERSION, get_index().version, CONFIG["llm_model"], profile)
+        response = await self.analysis_cache.aget(cache_key)
+        self.metrics.inc("normobot_analysis_cache_total", result="miss" if response is None else "hit")
+        if response is not None:
+            logger.info(f"Результат анализа взят из кэша: {self.analysis_cache.stats()}")
+            complete = True
+        else:
+            revision = None
+            if history_key is not None:
+                history = await self.revision_history.aget(history_key)
+                revision = plan_revision(history, context, sections, CONFIG["revision_min_unchanged"])
+            with self.metrics.timer("analyze"):
+                if revision is not None:
+                    return await self._analyze_revision(revision, report, profile, history_key, context)
+                if len(text) > CONFIG["chunk_threshold"]:
+                    response, complete = await self._analyze_chunked(text, report, profile)
+                else:
+                    messages = analysis_messages(text, profile, report.structure_checked, report.parameters_checked,
+                                                 [status.describe() for status in report.standards])
+                    logger.info("Отправка запроса к LLM")
+                    response = await self._llm_request(messages, progress)
+                    complete = not self._is_llm_failure(response)
+            if complete:
+                await self.analysis_cache.aset(cache_key, response)
+        if history_key is not None and complete:
+            await self._remember_revision(history_key, context, sections, parse_findings(response))
         return response
 
-    async def _llm_request(self, prompt: str) -> str:
-        """Запрос к LLM с повторными попытками."""
-        model = CONFIG["llm_model"]
-        for attempt in range(CONFIG["retry_attempts"] + 1):
+    async def _remember_revision(self, key: str, context: str, sections: list[Section], findings: list[Finding]):
+        """Запись проверенной редакции в историю чата; без распознанных замечаний сравнивать не с чем."""
+        if not findings:
+            await self.revision_history.aset(key, None)
+            return
+        await self.revision_history.aset(key, history_entry(context, sections, attribute_findings(findings, sections)))
+
+    async def _analyze_revision(self, revision: Revision, report: RuleReport, profile: str,
+                                history_key: str, context: str) -> str:
+        """
+        Повторная проверка новой редакции ТЗ: в LLM отправляются только изменённые и новые
+        разделы, замечания к остальным берутся из истории чата. Ответ — отчёт об изменениях
+        (исправленные, новые и оставшиеся замечания). История обновляется, только если
+        проверены все изменённые разделы.
+        """
+        sections = revision.sections
+        changed = [sections[i] for i in revision.changed]
+        logger.info(f"Повторная проверка: изменено разделов {len(changed)} из {len(sections)}")
+        self.metrics.inc("normobot_revision_sections_total", len(changed), state="changed")
+        self.metrics.inc("normobot_revision_sections_total", len(sections) - len(changed), state="reused")
+        semaphore = asyncio.Semaphore(CONFIG["chunk_workers"])
+        chunks = make_chunks([(section.title, section.text) for section in changed], CONFIG["chunk_max_chars"])
+        responses = await asyncio.gather(*(
+            self._chunk_request(titles, chunk, report, profile, semaphore) for titles, chunk in chunks
+        ))
+
+        groups = []
+        unparsed = []
+        failed = 0
+        for response in responses:
+            if self._is_llm_failure(response):
+                failed += 1
+                continue
+            found = parse_findings(response)
+            if found:
+                groups.append(found)
+            elif response:
+                unparsed.append(response)
+        if responses and failed == len(responses):
+            return LLM_FAILURE_MESSAGE
+
+        current = merge_findings(*groups)
+        delta = compare_findings(revision.previous, current)
+        reused = [finding for group in revision.reused for finding in group]
+        parts = [
+            format_delta(Delta(delta.resolved, reused + delta.still_open, delta.new), len(changed), len(sections)),
+            *unparsed,
+        ]
+        if failed:
+            parts.append(f"Внимание: {failed} из {len(responses)} частей документа проверить не удалось. Повторите запрос позже.")
+        else:
+            findings = list(revision.reused)
+            for i, group in zip(revision.changed, attribute_findings(current, changed)):
+                findings[i] = group
+            await self.revision_history.aset(history_key, history_entry(context, sections, findings))
+        return "\n\n".join(parts)
+
+    @staticmethod
+    def _is_llm_failure(response: str) -> bool:
+        """Является ли ответ заглушкой об ошибке LLM."""
+        return response in (LLM_FAILURE_MESSAGE, LLM_UNRECOGNIZED_MESSAGE)
+
+    async def _cached_request(self, messages: list[dict], key: str, semaphore: asyncio.Semaphore) -> str:
+        """Запрос к LLM для части документа: ответ кэшируется по ключу части, число запросов ограничено semaphore."""
+        cached = await self.analysis_cache.aget(key)
+        if cached is not None:
+            return cached
+        async with semaphore:
+            response = await self._llm_request(messages)
+        if not self._is_llm_failure(response):
+            await self.analysis_cache.aset(key, response)
+        return response
+
+    def _chunk_request(self, titles: list[str], chunk: str, report: RuleReport, profile: str,
+                       semaphore: asyncio.Semaphore):
+        """Запрос анализа фрагмента ТЗ (структура проверяется отдельно, по перечню заголовков)."""
+        return self._cached_request(
+            analysis_messages(chunk, profile, structure_checked=True, parameters_checked=report.parameters_checked,
+                              standards=[status.describe() for status in check_references(chunk)], titles=titles),
+            content_key(normalize_text(chunk), PROMPT_VERSION, get_index().version, CONFIG["llm_model"], "chunk",
+                        profile, str(report.parameters_checked)),
+            semaphore,
+        )
+
+    async def _analyze_chunked(self, text: str, report: RuleReport, profile: str) -> tuple[str, bool]:
+        """
+        Анализ длинного ТЗ по частям (map-reduce): фрагменты по разделам и перечень
+        заголовков для проверки структуры анализируются параллельно, затем замечания
+        объединяются без повторов. Если структура уже проверена правилами, перечень
+        заголовков в LLM не отправляется. Возвращает ответ и признак, что проверены все части.
+        """
+        sections = split_sections(text)
+        chunks = make_chunks(sections, CONFIG["chunk_max_chars"])
+        logger.info(f"Анализ по частям: {len(sections)} разделов, {len(chunks)} фрагментов")
+        semaphore = asyncio.Semaphore(CONFIG["chunk_workers"])
+
+        requests = []
+        if not report.structure_checked:
+            titles = [title for title, _ in sections]
+            requests.append(self._cached_request(
+                outline_messages(titles),
+                content_key("\n".join(titles), PROMPT_VERSION, CONFIG["llm_model"], "outline"),
+                semaphore,
+            ))
+        for titles, chunk in chunks:
+            requests.append(self._chunk_request(titles, chunk, report, profile, semaphore))
+        responses = await asyncio.gather(*requests)
+
+        groups = []
+        unparsed = []
+        failed = 0
+        for response in responses:
+            if self._is_llm_failure(response):
+                failed += 1
+                continue
+            found = parse_findings(response)
+            if found:
+                groups.append(found)
+            elif response:
+                unparsed.append(response)
+        if failed == len(responses):
+            return LLM_FAILURE_MESSAGE, False
+
+        merged = merge_findings(*groups)
+        logger.info(f"Анализ по частям завершён: {sum(map(len, groups))} замечаний, после объединения {len(merged)}")
+        parts = [format_findings(merged), *unparsed]
+        if failed:
+            parts.append(f"Внимание: {failed} из {len(responses)} частей документа проверить не удалось. Повторите запрос позже.")
+        return "\n\n".join(part for part in parts if part), failed == 0
+
+    async def _llm_request(self, messages: list[dict], progress: ProgressMessage | None = None) -> str:
+        """
+        Запрос к LLM через пул маршрутов (llm_pool.LLMPool): переключение на резервные
+        маршруты, размыкатели и паузы между попытками. С progress ответ читается потоком
+        и запрос не дублируется. Одновременно выполняется не больше max_concurrent_llm_requests запросов.
+        """
+        self.metrics.observe("normobot_prompt_chars", sum(len(message["content"]) for message in messages), SIZE_BUCKETS)
+        for role, tokens in message_tokens(messages).items():
+            self.metrics.observe("normobot_prompt_tokens", tokens, TOKEN_BUCKETS, role=role)
+
+        async def call(route: Route) -> str:
+            if progress is not None:
+                progress.reset()
+                return await self._llm_stream(route, messages, progress)
+            response = await asyncio.to_thread(route.create, messages)
+            if isinstance(response, dict):
+                return response.get("choices", [{}])[0].get("message", {}).get("content", "").strip()
+            elif isinstance(response, str):
+                return response.strip()
+            else:
+                logger.warning(f"Неожиданный тип ответа от LLM ({route.name}): {type(response)}")
+                return LLM_UNRECOGNIZED_MESSAGE
+
+        try:
+            async with self.llm_slots:
+                return await self.llm_pool.run(call, hedge=progress is None,
+                                               mode="stream" if progress is not None else "plain")
+        except Exception as e:
+            logger.error(f"Не удалось получить ответ LLM: {e!r}; маршруты: {self.llm_pool.health()}")
+            self.metrics.inc("normobot_llm_failures_total")
+            return LLM_FAILURE_MESSAGE
+
+    async def _llm_stream(self, route: Route, messages: list[dict], progress: ProgressMessage) -> str:
+        """
+        Потоковый запрос к маршруту LLM (stream=True): генератор читается в отдельном потоке,
+        фрагменты передаются в цикл событий и в progress по мере поступления.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        finished = object()
+        stopped = False
+
+        def produce():
             try:
-                async with asyncio.timeout(CONFIG["llm_timeout"]):
-                    response = await asyncio.to_thread(
-                        g4f.ChatCompletion.create,
-                        model=model,
-                        messages=[{"role": "user", "content": prompt}]
-                    )
-                    if isinstance(response, dict):
-                        return response.get("choices", [{}])[0].get("message", {}).get("content", "").strip()
-                    elif isinstance(response, str):
-                        return response.strip()
-                    else:
-                        logger.warning(f"Неожиданный тип ответа от LLM: {type(response)}")
-                        return "Ответ LLM не распознан."
+                for chunk in route.create(messages, stream=True):
+                    if stopped:
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, chunk)
             except Exception as e:
-                logger.exception(f"Ошибка LLM (попытка {attempt + 1}/{CONFIG['retry_attempts']}): {e}")
-                if attempt < CONFIG["retry_attempts"]:
-                    await asyncio.sleep(CONFIG["retry_interval"])
-                else:
-                    return "Не удалось получить ответ от LLM. Попробуйте позже."
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, finished)
 
-    async def send_analysis(self, update: Update, analysis: str):
-        """Отправка анализа: текстом или PDF в зависимости от длины."""
-        if len(analysis) <= CONFIG["max_message_length"]:
-            await update.message.reply_text(analysis, parse_mode="Markdown")
-        else:
-            pdf_path = "analysis.pdf"
-            self.create_pdf(analysis, pdf_path)
-            await update.message.reply_text(
-                f"Ответ слишком длинный ({len(analysis)} символов), отправляю в виде файла."
-            )
-            with open(pdf_path, "rb") as f:
-                await update.message.reply_document(f)
-            os.remove(pdf_path)
-            logger.info(f"PDF-файл {pdf_path} отправлен и удалён")
+        producer = asyncio.ensure_future(asyncio.to_thread(produce))
+        parts = []
+        try:
+            while (item := await queue.get()) is not finished:
+                if isinstance(item, Exception):
+                    raise item
+                # Помимо текста провайдеры g4f могут отдавать служебные объекты
+                if isinstance(item, str) and item:
+                    parts.append(item)
+                    await progress.feed(item)
+        finally:
+            # При таймауте или ошибке поток дочитывает генератор только до следующего фрагмента
+            stopped = True
+        await producer
+        return "".join(parts).strip()
+
+    async def send_analysis(self, update: Update, analysis: str, progress: ProgressMessage | None = None):
+        """
+        Отправка анализа: текстом или PDF в зависимости от длины.
+        Короткий ответ в потоковом режиме заменяет собой сообщение о ходе проверки.
+        """
+        with self.metrics.timer("send", format="text" if len(analysis) <= CONFIG["max_message_length"] else "pdf"):
+            if len(analysis) <= CONFIG["max_message_length"]:
+                if progress is not None and await progress.finish(analysis):
+                    return
+                await update.message.reply_text(analysis, parse_mode="Markdown")
+            else:
+                # Рендеринг в памяти и в отдельном потоке: ReportLab не блокирует цикл событий,
+                # а у каждого ответа своё имя файла
+                pdf = await asyncio.to_thread(self.create_pdf, analysis)
+                await update.message.reply_text(
+                    f"Ответ слишком длинный ({len(analysis)} символов), отправляю в виде файла."
+                )
+                filename = f"analysis_{update.message.chat_id}_{update.message.message_id}.pdf"
+                await update.message.reply_document(pdf, filename=filename)
+                logger.info(f"PDF-файл {filename} отправлен")
 
 
     logger = logging.getLogger(__name__)
 
-    def create_pdf(self, text: str, path: str):
+    def create_pdf(self, text: str, table: list[list[str]] | None = None,
+                   column_widths: list[float] | None = None) -> bytes:
         """
-        Создание PDF‑файла из текста с поддержкой кириллицы
-        на базе шрифтов Times New Roman из Windows.
+        Создание PDF‑файла в памяти из текста с поддержкой кириллицы
+        на базе шрифтов Times New Roman (по умолчанию из Windows, см. pdf_font_path).
+        Шрифты регистрируются один раз на процесс (pdf_report.register_fonts).
+        table выводится перед текстом (сводный отчёт по архиву).
         """
         try:
-            # Пути к шрифтам в Windows
-            font_path = r"C:\Windows\Fonts\times.ttf"
-            font_bold_path = r"C:\Windows\Fonts\timesbd.ttf"
-            if not os.path.exists(font_path) or not os.path.exists(font_bold_path):
-                raise FileNotFoundError("Шрифты Times New Roman не найдены по указанным путям")
-
-            # Регистрируем шрифты
-            pdfmetrics.registerFont(TTFont("TimesNewRoman", font_path))
-            pdfmetrics.registerFont(TTFont("TimesNewRoman-Bold", font_bold_path))
-
-            # Создаём canvas и устанавливаем шрифт
-            c = canvas.Canvas(path, pagesize=letter)
-            width, height = letter
-            margin = 40
-            line_height = 15
-            max_width = width - 2 * margin
-
-            # Здесь можно менять на "TimesNewRoman-Bold" для заголовков
-            c.setFont("TimesNewRoman", 12)
-
-            y = height - margin
-            for raw_line in text.split("\n"):
-                words = raw_line.split(" ")
-                current = ""
-                for word in words:
-                    test_line = (current + " " + word).strip()
-                    if pdfmetrics.stringWidth(test_line, "TimesNewRoman", 12) > max_width:
-                        c.drawString(margin, y, current)
-                        y -= line_height
-                        current = word
-                        if y < margin:
-                            c.showPage()
-                            c.setFont("TimesNewRoman", 12)
-                            y = height - margin
-                    else:
-                        current = test_line
-
-                c.drawString(margin, y, current)
-                y -= line_height
-                if y < margin:
-                    c.showPage()
-                    c.setFont("TimesNewRoman", 12)
-                    y = height - margin
-
-            c.save()
-            logger.info(f"PDF-файл создан: {path}")
+            buffer = io.BytesIO()
+            with self.metrics.timer("create_pdf"):
+                render_pdf(text, buffer, CONFIG["pdf_font_path"], CONFIG["pdf_font_bold_path"], table, column_widths)
+            logger.info(f"PDF-файл создан: {buffer.tell()} байт")
+            return buffer.getvalue()
 
         except Exception as e:
             logger.error(f"Ошибка создания PDF: {e}", exc_info=True)
             raise
 
 
+    def close(self):
+        """Остановка пула извлечения текста (после run или работы без Telegram)."""
+        self._extract_closed = True
+        if self._extract_pool is not None:
+            self._extract_pool.shutdown(cancel_futures=True)
+            self._extract_pool = None
+
     def run(self):
-        """Запуск бота."""
+        """
+        Запуск бота: long polling или, если задан webhook_url, HTTP-сервер вебхука (webhook.py).
+        В обоих режимах при остановке дорабатываются начатые и ожидающие в очереди проверки.
+        """
         try:
-            logger.info("Запуск бота")
-            self.application.run_polling()
+            if CONFIG["webhook_url"]:
+                logger.info("Запуск бота в режиме вебхука")
+                asyncio.run(serve_webhook(
+                    self.application,
+                    CONFIG["webhook_url"],
+                    CONFIG["webhook_listen"],
+                    CONFIG["webhook_port"],
+                    CONFIG["webhook_path"],
+                    CONFIG["webhook_secret"] or os.getenv("TELEGRAM_WEBHOOK_SECRET"),
+                    CONFIG["shutdown_timeout"],
+                ))
+            else:
+                logger.info("Запуск бота")
+                self.application.run_polling()
         except Exception as e:
             logger.error(f"Ошибка при запуске бота: {e}")
             raise
+        finally:
+            self.close()
 
 # Загрузка токена из .env файла
 load_dotenv()
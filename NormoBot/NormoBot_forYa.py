@@ -1,387 +1,789 @@
 ﻿import json
+import logging
+import time
 import traceback
 from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-import g4f
-from pathlib import Path
-import PyPDF2
 import os
 import asyncio
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
+import hashlib
+import io
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import NamedTuple
+from batch import (SUMMARY_WIDTHS, ArchiveError, BatchItem, BatchProgress, archive_members, format_batch_report,
+                   is_archive, member_name, summary_table, unpack_member)
+from chunking import make_chunks, split_sections
+from extractors import HEAD_SIZE, detect_format, supported_formats
+from findings import Finding, format_findings, merge_findings, parse_findings
+from job_queue import JobQueue
+from layout_cleanup import clean_layout
+from llm_pool import LLMPool, Route
+from metrics import SIZE_BUCKETS, TOKEN_BUCKETS, Metrics
+from pdf_extract import extract_pdf_text, pdf_path, terminate_pool
+from profiles import classify
+from prompts import PROMPT_VERSION, analysis_messages, count_tokens, message_tokens, outline_messages
+from revisions import (Delta, Revision, Section, attribute_findings, compare_findings, format_delta,
+                       history_entry, plan_revision, split_revision_sections)
+from rules import RuleReport, run_rules
+from standards import check_references, get_index
+from streaming import ProgressMessage
+from tiered_cache import TieredCache, content_key, normalize_text
+from tracing import Tracer
 
 # Конфигурация
 CONFIG = {
     "llm_model": "gpt-4.1-mini",
+    "llm_provider": None,
+    "llm_fallbacks": [],
+    "breaker_failures": 3,
+    "breaker_reset": 60,
+    "hedge_requests": False,
+    "hedge_min_delay": 5,
     "retry_attempts": 3,
-    "retry_interval": 5,
+    "retry_interval": 2,
+    "retry_max_interval": 30,
     "llm_timeout": 120,
     "max_file_size": 20 * 1024 * 1024,
+    "max_text_chars": 500000,
+    "clean_layout": True,
     "telegram_timeout": 60,
-    "max_message_length": 4000
+    "max_message_length": 4000,
+    "cache_max_entries": 256,
+    "cache_db_path": "/tmp/normobot_cache.sqlite3",
+    "cache_ttl": 7 * 24 * 3600,
+    "cache_max_disk_entries": 5000,
+    "text_index_max_entries": 32,
+    "memory_download_threshold": 8 * 1024 * 1024,
+    "temp_dir": "/tmp",
+    "extract_workers": os.cpu_count() or 1,
+    "pdf_pages_per_task": 20,
+    "max_pdf_pages": 500,
+    "extract_timeout": 60,
+    "chunk_threshold": 30000,
+    "chunk_max_chars": 12000,
+    "chunk_workers": 4,
+    "max_concurrent_llm_requests": 16,
+    "batch_max_members": 40,
+    "batch_max_unpacked_size": 100 * 1024 * 1024,
+    "batch_workers": 4,
+    "stream_responses": True,
+    "stream_edit_interval": 2.0,
+    "rules_structure_min_chars": 1500,
+    "rules_only": False,
+    "domain_profile": None,
+    "incremental_revisions": True,
+    "revision_min_chars": 3000,
+    "revision_min_unchanged": 0.5,
+    "async_jobs": False,
+    "job_db_path": "/tmp/normobot_jobs.sqlite3",
+    "job_lease": 900,
+    "job_max_attempts": 2,
+    "job_retention": 2 * 24 * 3600,
+    "worker_time_budget": 540,
+    "trace_level": "INFO",
+    "trace_capacity": 64
 }
 
+LLM_FAILURE_PREFIX = "Не удалось получить ответ от LLM"
+LLM_UNRECOGNIZED_MESSAGE = "Ответ LLM не распознан."
+EXTRACT_POOL_RETRIES = 2
+
+
+class CheckResult(NamedTuple):
+    rule_findings: list[Finding]
+    findings: list[Finding]
+    report: str
+    llm_failed: bool
+
+
 class NormalControllerBot:
     def __init__(self, token: str):
         self.token = token
         self.application = Application.builder().token(self.token).read_timeout(CONFIG["telegram_timeout"]).write_timeout(CONFIG["telegram_timeout"]).build()
+        self.analysis_cache = TieredCache(
+            "analysis",
+            max_entries=CONFIG["cache_max_entries"],
+            db_path=CONFIG["cache_db_path"],
+            ttl=CONFIG["cache_ttl"],
+            max_disk_entries=CONFIG["cache_max_disk_entries"],
+        )
+        self.text_index = TieredCache(
+            "text",
+            max_entries=CONFIG["text_index_max_entries"],
+            db_path=CONFIG["cache_db_path"],
+            ttl=CONFIG["cache_ttl"],
+            max_disk_entries=CONFIG["cache_max_disk_entries"],
+        )
+        self.revision_history = TieredCache(
+            "history",
+            max_entries=CONFIG["cache_max_entries"],
+            db_path=CONFIG["cache_db_path"],
+            ttl=CONFIG["cache_ttl"],
+            max_disk_entries=CONFIG["cache_max_disk_entries"],
+        )
+        self._extract_pool = None
+        self._extract_closed = False
+        self.metrics = Metrics()
+        self.llm_pool = self._make_llm_pool()
+        self.llm_slots = asyncio.Semaphore(CONFIG["max_concurrent_llm_requests"])
+        # update_id -> ошибка обработки: process_update не пробрасывает исключения обработчиков,
+        # а handle_document и _review сами отвечают пользователю об ошибке
+        self.update_errors = {}
         self.setup_handlers()
     
+    def _make_llm_pool(self) -> LLMPool:
+        specs = [{"model": CONFIG["llm_model"], "provider": CONFIG["llm_provider"]}, *CONFIG["llm_fallbacks"]]
+        routes = [
+            Route(spec["model"], spec.get("provider"), CONFIG["breaker_failures"], CONFIG["breaker_reset"])
+            for spec in specs
+        ]
+        return LLMPool(
+            routes,
+            attempts=CONFIG["retry_attempts"] + 1,
+            timeout=CONFIG["llm_timeout"],
+            backoff_base=CONFIG["retry_interval"],
+            backoff_max=CONFIG["retry_max_interval"],
+            hedge=CONFIG["hedge_requests"],
+            hedge_min_delay=CONFIG["hedge_min_delay"],
+            metrics=self.metrics,
+        )
+
     async def initialize(self):
         await self.application.initialize()
         await self.application.start()
+
+    async def shutdown(self):
+        self._extract_closed = True
+        if self._extract_pool is not None:
+            self._extract_pool.shutdown(wait=False, cancel_futures=True)
+            self._extract_pool = None
+        if self.application.running:
+            await self.application.stop()
+        await self.application.shutdown()
     
     def setup_handlers(self):
         self.application.add_handler(CommandHandler("start", self.start))
         self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_text))
         self.application.add_handler(MessageHandler(filters.Document.ALL, self.handle_document))
+        self.application.add_error_handler(self.on_error)
+
+    async def on_error(self, update: object, context: ContextTypes.DEFAULT_TYPE):
+        error = "".join(traceback.format_exception(context.error))
+        print(json.dumps({"message": "Ошибка обработчика", "error": error}, ensure_ascii=False))
+        if isinstance(update, Update):
+            self.update_errors[update.update_id] = error
 
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(
             "Привет! Я нормоконтролёр для проверки технических заданий. "
-            "Отправьте текст ТЗ или прикрепите файл (PDF, TXT)."
+            f"Отправьте текст ТЗ или прикрепите файл ({supported_formats()})."
         )
 
     async def handle_text(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         text = update.message.text
-        await update.message.reply_text("Проверяю ваше техническое задание...")
-        analysis = await self.analyze_tz(text)
-        await self.send_analysis(update, analysis)
+        self.metrics.inc("normobot_updates_total", kind="text")
+        await self._review(update, text)
 
     async def handle_document(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         document = update.message.document
+        self.metrics.inc("normobot_updates_total", kind="document")
+        if document.file_size is not None:
+            self.metrics.observe("normobot_document_bytes", document.file_size, SIZE_BUCKETS)
         if document.file_size > CONFIG["max_file_size"]:
             await update.message.reply_text("Файл слишком большой. Максимальный размер: 20 МБ.")
             return
-        file = await document.get_file()
-        file_path = f"/tmp/temp_{document.file_id}"
+        if is_archive(document.mime_type, document.file_name or ""):
+            await self.review_archive(update, document)
+            return
         try:
-            await file.download_to_drive(file_path)
-            file_text = self.extract_text_from_file(file_path, document.mime_type)
+            file_text = await self.get_document_text(document)
             message_text = update.message.text or ""
             combined_text = f"{message_text}\n\n{file_text}" if message_text else file_text
-            await update.message.reply_text("Проверяю ваше техническое задание...")
-            analysis = await self.analyze_tz(combined_text)
-            await self.send_analysis(update, analysis)
+            await self._review(update, combined_text)
         except Exception as e:
-            await update.message.reply_text("Ошибка при обработке файла. Попробуйте отправить другой файл (PDF или TXT).")
-        finally:
-            if Path(file_path).exists():
-                Path(file_path).unlink()
+            self.update_errors[update.update_id] = f"{e}\n{traceback.format_exc()}"
+            await update.message.reply_text(f"Ошибка при обработке файла. Попробуйте отправить другой файл ({supported_formats()}).")
+
+    async def _review(self, update: Update, text: str):
+        profile, report = self._check_rules(text)
+        if CONFIG["rules_only"]:
+            await self.send_analysis(update, self._format_precheck(report) or "Замечаний не выявлено.")
+            return
+        precheck = await self._send_precheck(update, report)
+        status = await update.message.reply_text("Проверяю ваше техническое задание...")
+        progress = self._progress_message(status)
+        analysis = await self.analyze_tz(text, progress, report, update.effective_chat.id, profile)
+        if self._is_llm_failure(analysis):
+            self.update_errors[update.update_id] = analysis
+        if precheck:
+            analysis = f"{precheck}\n\n{analysis}"
+        await self.send_analysis(update, analysis, progress)
+
+    async def review_archive(self, update: Update, document):
+        status = await update.message.reply_text("Получен архив, распаковываю...")
+        with self._download_buffer(document.file_size) as buffer, \
+                tempfile.TemporaryDirectory(dir=CONFIG["temp_dir"]) as directory:
+            with self.metrics.timer("download"):
+                file = await document.get_file()
+                await file.download_to_memory(buffer)
+            try:
+                archive = zipfile.ZipFile(buffer)
+                members = archive_members(archive, CONFIG["batch_max_members"], CONFIG["batch_max_unpacked_size"])
+            except zipfile.BadZipFile:
+                await status.edit_text("Файл не является ZIP-архивом или повреждён.")
+                return
+            except ArchiveError as e:
+                await status.edit_text(str(e))
+                return
+            with archive:
+                await status.edit_text(f"В архиве документов: {len(members)}. Проверяю...")
+                progress = BatchProgress(status, len(members), CONFIG["stream_edit_interval"])
+                semaphore = asyncio.Semaphore(CONFIG["batch_workers"])
+                with self.metrics.timer("batch"):
+                    items = await asyncio.gather(*(
+                        self._review_member(archive, info, index, directory, semaphore, progress)
+                        for index, info in enumerate(members, 1)
+                    ))
+        pdf = await asyncio.to_thread(self.create_pdf, format_batch_report(items), summary_table(items), SUMMARY_WIDTHS)
+        checked = sum(1 for item in items if item.findings is not None)
+        await update.message.reply_document(
+            pdf, filename=f"batch_{update.message.chat_id}_{update.message.message_id}.pdf",
+            caption=f"Сводный отчёт: проверено документов {checked} из {len(items)}.",
+        )
+
+    async def _review_member(self, archive: zipfile.ZipFile, info: zipfile.ZipInfo, index: int, directory: str,
+                             semaphore: asyncio.Semaphore, progress: BatchProgress) -> BatchItem:
+        name = member_name(info)
+        async with semaphore:
+            path = None
+            try:
+                path = await asyncio.to_thread(unpack_member, archive, info, directory, index, CONFIG["max_file_size"])
+                text = await self.extract_text_from_file(path, "")
+                if not text.strip():
+                    raise ArchiveError("текст не извлечён")
+                result = await self.check_text(text)
+                if result.llm_failed:
+                    item = BatchItem(name, len(text), None, result.report, "LLM недоступна")
+                else:
+                    findings = len(result.rule_findings) + len(result.findings)
+                    item = BatchItem(name, len(text), findings, result.report, "проверен")
+            except Exception as e:
+                item = BatchItem(name, 0, None, f"Документ не проверен: {e}", f"ошибка: {e}"[:80])
+            finally:
+                if path is not None:
+                    os.remove(path)
+        self.metrics.inc("normobot_batch_documents_total", result="ok" if item.findings is not None else "error")
+        await progress.advance(name)
+        return item
+
+    async def check_text(self, text: str) -> CheckResult:
+        profile, report = self._check_rules(text)
+        analysis = "" if CONFIG["rules_only"] else await self.analyze_tz(text, report=report, profile=profile)
+        if self._is_llm_failure(analysis):
+            return CheckResult(report.findings, [], analysis, True)
+        details = "\n\n".join(part for part in (self._format_precheck(report), analysis) if part)
+        return CheckResult(report.findings, parse_findings(analysis), details, False)
+
+    async def get_document_text(self, document) -> str:
+        unique_key = f"fuid:{document.file_unique_id}"
+        entry = await self.text_index.aget(unique_key)
+        if entry is not None:
+            return entry["text"]
+        with self._download_buffer(document.file_size) as buffer:
+            with self.metrics.timer("download"):
+                file = await document.get_file()
+                await file.download_to_memory(buffer)
+            buffer.seek(0)
+            digest = hashlib.sha256()
+            for block in iter(lambda: buffer.read(1024 * 1024), b""):
+                digest.update(block)
+            hash_key = f"sha256:{digest.hexdigest()}"
+            entry = await self.text_index.aget(hash_key)
+            if entry is None:
+                buffer.seek(0)
+                text, pages = await self.extract_document(buffer, document.mime_type, document.file_name or "")
+                entry = {"text": text, "pages": pages}
+                await self.text_index.aset(hash_key, entry)
+        await self.text_index.aset(unique_key, entry)
+        return entry["text"]
 
-    def extract_text_from_file(self, file_path: str, mime_type: str) -> str:
+    def _download_buffer(self, file_size: int | None):
+        threshold = CONFIG["memory_download_threshold"]
+        if file_size is not None and file_size <= threshold:
+            return io.BytesIO()
+        return tempfile.SpooledTemporaryFile(max_size=threshold, dir=CONFIG["temp_dir"])
+
+    def _get_extract_pool(self):
+        if self._extract_pool is None and CONFIG["extract_workers"] > 0:
+            self._extract_pool = ProcessPoolExecutor(max_workers=CONFIG["extract_workers"])
+        return self._extract_pool
+
+    async def _terminate_extract_pool(self, pool) -> bool:
+        if pool is None or pool is not self._extract_pool:
+            return False
+        self._extract_pool = None
+        await asyncio.to_thread(terminate_pool, pool)
+        return True
+
+    async def _extract_pdf(self, path: str) -> tuple[str, int]:
+        # Пул останавливается целиком (таймаут, упавший процесс): документы, чьи диапазоны
+        # были в нём, повторяют извлечение в новом пуле
+        for attempt in range(EXTRACT_POOL_RETRIES + 1):
+            pool = self._get_extract_pool()
+            try:
+                return await extract_pdf_text(
+                    path,
+                    pool,
+                    workers=CONFIG["extract_workers"] or 1,
+                    min_pages=CONFIG["pdf_pages_per_task"],
+                    max_pages=CONFIG["max_pdf_pages"],
+                    timeout=CONFIG["extract_timeout"],
+                )
+            except TimeoutError:
+                await self._terminate_extract_pool(pool)
+                raise
+            except (asyncio.CancelledError, BrokenProcessPool) as e:
+                if pool is None or asyncio.current_task().cancelling():
+                    raise
+                await self._terminate_extract_pool(pool)
+                if attempt == EXTRACT_POOL_RETRIES or self._extract_closed:
+                    raise BrokenProcessPool("пул извлечения текста остановлен во время обработки документа") from e
+
+    async def extract_text_from_file(self, file_path: str, mime_type: str) -> str:
+        with open(file_path, "rb") as f:
+            text, _ = await self.extract_document(f, mime_type, file_path)
+        return text
+
+    async def extract_document(self, stream, mime_type: str, file_name: str = "") -> tuple[str, int]:
         try:
-            file_ext = Path(file_path).suffix.lower()
-            if mime_type == "application/pdf" or file_ext == ".pdf":
-                with open(file_path, "rb") as f:
-                    reader = PyPDF2.PdfReader(f)
-                    text = ""
-                    for page in reader.pages:
-                        extracted = page.extract_text()
-                        if extracted:
-                            text += extracted
-                    return text
-            elif mime_type == "text/plain" or file_ext == ".txt":
-                with open(file_path, "r", encoding="utf-8") as f:
-                    return f.read()
-            else:
-                raise ValueError("Неподдерживаемый формат файла. Используйте PDF или TXT.")
+            head = stream.read(HEAD_SIZE)
+            stream.seek(0)
+            extractor = detect_format(head, mime_type, file_name)
+            if extractor is None:
+                raise ValueError(f"Неподдерживаемый формат файла. Используйте {supported_formats()}.")
+            self.metrics.inc("normobot_document_format_total", format=extractor.name)
+            with self.metrics.timer("extract"):
+                if extractor.extract is None:
+                    async with pdf_path(stream, CONFIG["temp_dir"]) as path:
+                        text, pages = await self._extract_pdf(path)
+                else:
+                    async with asyncio.timeout(CONFIG["extract_timeout"]):
+                        text, pages = await asyncio.to_thread(extractor.extract, stream, CONFIG["max_text_chars"])
+            if CONFIG["clean_layout"]:
+                text = await asyncio.to_thread(self._clean_layout, text)
+            return text[:CONFIG["max_text_chars"]], pages
         except Exception as e:
             raise
 
-    async def analyze_tz(self, text: str) -> str:
-        prompt = """
-        ### Промпт для нормоконтроля технического задания
-
-        ### Роль
-        Вы — нормоконтролер, специализирующийся на проверке технических заданий (ТЗ) на соответствие ГОСТам и лучшим практикам технической документации.
-
-        ### Задача
-        Проанализируйте предоставленное техническое задание, выявите ошибки, несоответствия или отклонения от требуемых стандартов и предложите исправления в формате: «Было / Замечание / Должно быть».
-
-        ### Инструкции
-
-        #### Проверка структуры
-        Убедитесь, что проектная (конструкторская) документация на разработку аккумуляторной батареи для электроавтомобиля содержит все необходимые разделы в соответствии с ГОСТ 15.016-2016 и другими применимыми нормативными документами, включая, но не ограничиваясь:
-        - ГОСТ 15.016-2016 — Система разработки и постановки продукции на производство. Проектная документация  
-        - ГОСТ Р 53778-2010 — Аккумуляторные батареи. Общие технические условия  
-        - ГОСТ Р 52350.11-2005 — Безопасность электрического оборудования. Требования к аккумуляторным батареям  
-        - ГОСТ 12.2.007.0-75 — Электробезопасность  
-        - ГОСТ 30804.4.2-2013 и ГОСТ 30804.4.3-2013 — Электромагнитная совместимость  
-        - ГОСТ 12.1.044-89 — Пожарная безопасность  
-        - Правила устройства электроустановок (ПУЭ)  
-        - НПБ 105-03 — Нормы пожарной безопасности для аккумуляторных помещений  
-        - ISO 12405 и/или IEC 62660 (при использовании международных стандартов)
-
-        Типичные обязательные разделы документации включают:
-        - Введение  
-        - Наименование, основание и сроки разработки  
-        - Цель разработки, наименование и обозначение изделия  
-        - Технические требования к изделию  
-        - Требования к сырью и материалам  
-        - Требования к консервации, упаковке и маркировке  
-        - Требования к учебно-тренировочным средствам (при необходимости)  
-        - Специальные требования (безопасность, экология, электромагнитная совместимость)  
-        - Требования к документации  
-        - Этапы выполнения разработки с указанием сроков и ответственных  
-        - Порядок выполнения и приемки этапов разработки  
-        - Примечания и дополнительные указания  
-
-        Проверьте наличие всех обязательных разделов, отметьте отсутствие необходимых и наличие избыточных разделов, а также соответствие содержания требованиям нормативных документов и специфике разработки АКБ для электроавтомобиля.
-
-        #### Проверка содержания
-        Проверьте, что все указанные стандарты ГОСТ и нормативные документы актуальны и правильно указаны. Убедитесь, что требования конкретны, измеримы, достижимы, релевантны и ограничены по времени (SMART). Проверьте отсутствие противоречивых или неоднозначных утверждений. Подтвердите, что все технические параметры указаны точно и полно, включая:
-        - Номинальное напряжение аккумулятора и отдельных элементов (например, 12 В на элемент, 192 В на батарею из 16 элементов)
-        - Емкость аккумулятора (в ампер-часах), определяющая запас энергии
-        - Тип аккумуляторов (свинцово-кислотные, литий-ионные и др.) и их конструктивные особенности
-        - Количество и схема соединения элементов (последовательное, параллельное подключение)
-        - Ток заряда и разряда, включая максимальные пиковые токи и пусковые токи оборудования
-        - Требования к качеству электропитания — стабильность напряжения и частоты, допустимые отклонения
-        - Рабочая температура и условия эксплуатации аккумуляторов
-        - Требования к системам контроля и безопасности — наличие систем мониторинга состояния (PCM), защита от перегрузок и коротких замыканий
-        - Требования к производственной документации — чертежи, спецификации, инструкции по эксплуатации
-        - Испытания и контроль качества — проверка емкости, напряжения, надежности и безопасности
-        - Требования к монтажу и обслуживанию, включая условия установки и вентиляции аккумуляторных помещений
-        - Сроки изготовления и поставки
-        - Соответствие нормативам и стандартам (например, ГОСТ, ПУЭ, НПБ 105-03)
-        1. Требования к габаритам и массе аккумуляторной батареи — размеры, вес, что важно для интеграции в конструкцию автомобиля.
-        2. Условия транспортировки и хранения — температурные режимы, влажность, вибрации и удары.
-        3. Энергоэффективность и коэффициент полезного действия батареи.
-        4. Срок службы и циклы заряда-разряда — гарантийные показатели долговечности.
-        5. Требования к системе охлаждения — тип, эффективность, способы реализации.
-        6. Электромагнитная совместимость (EMC) — требования к помехозащищенности и излучению.
-        7. Требования к программному обеспечению систем управления батареей (BMS) — алгоритмы управления, диагностика и обновление ПО.
-        8. Требования к утилизации и экологической безопасности — материалы, возможность переработки.
-        9. Требования к маркировке и идентификации элементов и сборок.
-        10. Требования к документации по безопасности при аварийных ситуациях — инструкции по действиям при возгорании, утечках и т.п.
-        11. Требования к совместимости с другими системами автомобиля — интерфейсы, протоколы обмена данными.
-        12. Требования к испытаниям на вибрацию, удар, коррозию и другие механические воздействия.
-
-        Проверка максимизации емкости АКБ относительно массы и актуальности технологии:
-        1. Оцените используемую технологию производства аккумуляторных элементов с точки зрения удельной емкости (емкость на единицу массы, Ач/кг).  
-        2. Проверьте соответствие выбранных материалов и химических составов современным достижениям в области аккумуляторных технологий (например, литий-ионные, твердотельные, литий-железо-фосфатные и др.).  
-        3. Проанализируйте конструктивные решения, влияющие на снижение массы батареи при сохранении или увеличении емкости (например, использование легких корпусов, оптимизация толщины электродов, компоновка элементов).  
-        4. Оцените технологию сборки и контроля качества, обеспечивающую максимальную плотность энергии и минимальные потери.  
-        5. Проверьте наличие данных по испытаниям и подтверждению удельной емкости, включая сравнительный анализ с аналогичными технологиями на рынке.  
-        6. Оцените актуальность технологии с учетом последних тенденций и инноваций в области аккумуляторных систем для электромобилей (например, исследования и внедрение новых материалов, технологий производства, систем управления батареей).  
-        7. Проверьте соответствие технологии требованиям безопасности, долговечности и экологичности при максимальной емкости и минимальной массе.  
-        8. Оцените перспективы масштабирования и серийного производства с сохранением заявленных параметров.
-
-        Чек-лист проверки АКБ по температуре эксплуатации, вибрации и механическим воздействиям:
-        1. Температура эксплуатации
-        - Указан диапазон рабочих температур (минимальная, максимальная, оптимальная).  
-        - Диапазон температур соответствует условиям эксплуатации электроавтомобиля (климатические зоны, сезонные колебания).  
-        - Присутствуют данные по устойчивости к экстремальным температурам (низкие и высокие температуры).  
-        - Описаны системы терморегуляции и охлаждения, их эффективность и характеристики.  
-        - Приведены результаты испытаний на работоспособность и безопасность при различных температурах.  
-        - Оценено влияние температуры на емкость, срок службы, безопасность и скорость заряда/разряда.  
-        - Указаны требования к хранению и транспортировке с учетом температурных ограничений.  
-        - Соответствие температурных параметров требованиям нормативных документов (ГОСТ, ISO, IEC и др.).
-        2. Вибрация
-        - Указаны параметры вибрационных испытаний (частотные диапазоны, амплитуды).  
-        - Проведены испытания на вибрационную устойчивость в соответствии с эксплуатационными условиями автомобиля.  
-        - Описаны конструктивные решения и методы защиты от вибраций.  
-        - Приведены результаты испытаний и сертификаций по вибрационной прочности.  
-        - Оценено влияние вибраций на безопасность, надежность и срок службы АКБ.  
-        - Соответствие вибрационных параметров требованиям нормативных документов (ГОСТ, ISO, IEC и др.).
-        3. Механические воздействия
-        - Описаны виды механических воздействий, которым подвергается АКБ (удары, сотрясения, вибрации).  
-        - Проведены испытания на ударопрочность и механическую прочность.  
-        - Описаны конструктивные меры по повышению механической устойчивости (корпус, крепления, амортизация).  
-        - Приведены результаты испытаний и сертификаций по механической прочности.  
-        - Оценено влияние механических воздействий на безопасность, надежность и срок службы АКБ.  
-        - Соответствие механических параметров требованиям нормативных документов (ГОСТ, ISO, IEC и др.).
-
-        #### Проверка оформления
-        Убедитесь, что документ соответствует требованиям оформления:
-        - Шрифт, отступы, нумерация разделов
-        - Правильные подписи и ссылки на рисунки, таблицы и схемы в тексте
-
-        #### Проверка языка и ясности
-        Убедитесь, что язык документа ясен, лаконичен и подходит для целевой аудитории. Проверьте, что все технические термины определены и используются корректно.
-
-        ### Формат ответа
-        Для каждой выявленной ошибки укажите:
-        - Было: [цитата или описание ошибки]
-        - Замечание: [объяснение, почему это ошибка, со ссылкой на стандарт или лучшую практику]
-        - Должно быть: [предложение по исправлению]
-
-        ### Примеры
-        #### Ошибка в структуре
-        - Было: В документе отсутствует раздел «Требования к документации»
-        - Замечание: Согласно ГОСТ 15.016-2016, ТЗ должно включать раздел о требованиях к документации, описывающий необходимые документы и их формат
-        - Должно быть: Добавить раздел «Требования к документации» с указанием необходимых документов в соответствии с ГОСТ Р 15.301
-
-        #### Ошибка в содержании (неуказанные параметры)
-        - Было: Отсутствует информация о токе разряда аккумулятора
-        - Замечание: Ток разряда, включая максимальные пиковые токи, обязателен для определения эксплуатационных характеристик (ГОСТ 15.016-2016, раздел технических требований)
-        - Должно быть: Указать: «Ток разряда — 120 А, максимальный пиковый ток — 150 А»
-
-        #### Ошибка в ссылках
-        - Было: Указан ГОСТ 12345-2000
-        - Замечание: ГОСТ 12345-2000 устарел и заменен ГОСТ 12345-2015. Необходимо использовать актуальную версию стандарта
-        - Должно быть: Обновить ссылку на ГОСТ 12345-2015
-
-        #### Ошибка в ясности
-        - Было: «Аккумулятор должен быть надежным»
-        - Замечание: Формулировка неконкретна, не указаны параметры надежности (например, срок службы)
-        - Должно быть: «Срок службы аккумулятора не менее 2 лет при соблюдении условий эксплуатации»
-
-        ### Дополнительные замечания
-        Если конкретные детали стандарта неизвестны, опирайтесь на общие лучшие практики для технической документации. Приоритет отдавайте ясности, точности и полноте при проверке.
-
-        ### Итоговый результат
-        После анализа всего документа составьте полный список выявленных ошибок и предложенных исправлений.
-
-        Текст ТЗ:
-        {text}
-        """.format(text=text)
-        response = await self._llm_request(prompt)
+    def _clean_layout(self, text: str) -> str:
+        result = clean_layout(text)
+        for stage, value in (("raw", text), ("clean", result.text)):
+            self.metrics.observe("normobot_document_text_chars", len(value), SIZE_BUCKETS, stage=stage)
+            self.metrics.observe("normobot_document_tokens", count_tokens(value), TOKEN_BUCKETS, stage=stage)
+        return result.text
+
+    @staticmethod
+    def _format_precheck(report: RuleReport) -> str:
+        if not report.findings:
+            return ""
+        return "Автоматическая проверка по правилам:\n\n" + format_findings(report.findings)
+
+    async def _send_precheck(self, update: Update, report: RuleReport) -> str:
+        precheck = self._format_precheck(report)
+        if precheck and len(precheck) <= CONFIG["max_message_length"]:
+            await update.message.reply_text(precheck)
+            return ""
+        return precheck
+
+    def _progress_message(self, status) -> ProgressMessage | None:
+        if not CONFIG["stream_responses"]:
+            return None
+        return ProgressMessage(status, CONFIG["stream_edit_interval"], CONFIG["max_message_length"])
+
+    def _select_profile(self, text: str) -> str:
+        profile = CONFIG["domain_profile"] or classify(text)[0]
+        self.metrics.inc("normobot_profile_total", profile=profile)
+        return profile
+
+    def _check_rules(self, text: str) -> tuple[str, RuleReport]:
+        profile = self._select_profile(text)
+        return profile, run_rules(text, CONFIG["rules_structure_min_chars"], profile)
+
+    async def analyze_tz(self, text: str, progress: ProgressMessage | None = None,
+                         report: RuleReport | None = None, chat_id: int | None = None,
+                         profile: str | None = None) -> str:
+        if profile is None:
+            profile = self._select_profile(text)
+        if report is None:
+            report = run_rules(text, CONFIG["rules_structure_min_chars"], profile)
+        context = content_key(PROMPT_VERSION, get_index().version, CONFIG["llm_model"], profile)
+        self.metrics.observe("normobot_document_chars", len(text), SIZE_BUCKETS)
+        history_key = None
+        sections = None
+        if chat_id is not None and CONFIG["incremental_revisions"] and len(text) >= CONFIG["revision_min_chars"]:
+            history_key = f"chat:{chat_id}"
+            sections = split_revision_sections(text)
+
+        cache_key = content_key(normalize_text(text), PROMPT_VERSION, get_index().version, CONFIG["llm_model"], profile)
+        response = await self.analysis_cache.aget(cache_key)
+        self.metrics.inc("normobot_analysis_cache_total", result="miss" if response is None else "hit")
+        if response is not None:
+            complete = True
+        else:
+            revision = None
+            if history_key is not None:
+                history = await self.revision_history.aget(history_key)
+                revision = plan_revision(history, context, sections, CONFIG["revision_min_unchanged"])
+            with self.metrics.timer("analyze"):
+                if revision is not None:
+                    return await self._analyze_revision(revision, report, profile, history_key, context)
+                if len(text) > CONFIG["chunk_threshold"]:
+                    response, complete = await self._analyze_chunked(text, report, profile)
+                else:
+                    messages = analysis_messages(text, profile, report.structure_checked, report.parameters_checked,
+                                                 [status.describe() for status in report.standards])
+                    response = await self._llm_request(messages, progress)
+                    complete = not self._is_llm_failure(response)
+            if complete:
+                await self.analysis_cache.aset(cache_key, response)
+        if history_key is not None and complete:
+            await self._remember_revision(history_key, context, sections, parse_findings(response))
         return response
 
-    async def _llm_request(self, prompt: str) -> str:
-        model = CONFIG["llm_model"]
-        for attempt in range(CONFIG["retry_attempts"] + 1):
+    async def _remember_revision(self, key: str, context: str, sections: list[Section], findings: list[Finding]):
+        if not findings:
+            await self.revision_history.aset(key, None)
+            return
+        await self.revision_history.aset(key, history_entry(context, sections, attribute_findings(findings, sections)))
+
+    async def _analyze_revision(self, revision: Revision, report: RuleReport, profile: str,
+                                history_key: str, context: str) -> str:
+        sections = revision.sections
+        changed = [sections[i] for i in revision.changed]
+        self.metrics.inc("normobot_revision_sections_total", len(changed), state="changed")
+        self.metrics.inc("normobot_revision_sections_total", len(sections) - len(changed), state="reused")
+        semaphore = asyncio.Semaphore(CONFIG["chunk_workers"])
+        chunks = make_chunks([(section.title, section.text) for section in changed], CONFIG["chunk_max_chars"])
+        responses = await asyncio.gather(*(
+            self._chunk_request(titles, chunk, report, profile, semaphore) for titles, chunk in chunks
+        ))
+
+        groups = []
+        unparsed = []
+        failed = 0
+        for response in responses:
+            if self._is_llm_failure(response):
+                failed += 1
+                continue
+            found = parse_findings(response)
+            if found:
+                groups.append(found)
+            elif response:
+                unparsed.append(response)
+        if responses and failed == len(responses):
+            return responses[0]
+
+        current = merge_findings(*groups)
+        delta = compare_findings(revision.previous, current)
+        reused = [finding for group in revision.reused for finding in group]
+        parts = [
+            format_delta(Delta(delta.resolved, reused + delta.still_open, delta.new), len(changed), len(sections)),
+            *unparsed,
+        ]
+        if failed:
+            parts.append(f"Внимание: {failed} из {len(responses)} частей документа проверить не удалось. Повторите запрос позже.")
+        else:
+            findings = list(revision.reused)
+            for i, group in zip(revision.changed, attribute_findings(current, changed)):
+                findings[i] = group
+            await self.revision_history.aset(history_key, history_entry(context, sections, findings))
+        return "\n\n".join(parts)
+
+    @staticmethod
+    def _is_llm_failure(response: str) -> bool:
+        return response.startswith(LLM_FAILURE_PREFIX) or response == LLM_UNRECOGNIZED_MESSAGE
+
+    async def _cached_request(self, messages: list[dict], key: str, semaphore: asyncio.Semaphore) -> str:
+        cached = await self.analysis_cache.aget(key)
+        if cached is not None:
+            return cached
+        async with semaphore:
+            response = await self._llm_request(messages)
+        if not self._is_llm_failure(response):
+            await self.analysis_cache.aset(key, response)
+        return response
+
+    def _chunk_request(self, titles: list[str], chunk: str, report: RuleReport, profile: str,
+                       semaphore: asyncio.Semaphore):
+        return self._cached_request(
+            analysis_messages(chunk, profile, structure_checked=True, parameters_checked=report.parameters_checked,
+                              standards=[status.describe() for status in check_references(chunk)], titles=titles),
+            content_key(normalize_text(chunk), PROMPT_VERSION, get_index().version, CONFIG["llm_model"], "chunk",
+                        profile, str(report.parameters_checked)),
+            semaphore,
+        )
+
+    async def _analyze_chunked(self, text: str, report: RuleReport, profile: str) -> tuple[str, bool]:
+        sections = split_sections(text)
+        chunks = make_chunks(sections, CONFIG["chunk_max_chars"])
+        semaphore = asyncio.Semaphore(CONFIG["chunk_workers"])
+
+        requests = []
+        if not report.structure_checked:
+            titles = [title for title, _ in sections]
+            requests.append(self._cached_request(
+                outline_messages(titles),
+                content_key("\n".join(titles), PROMPT_VERSION, CONFIG["llm_model"], "outline"),
+                semaphore,
+            ))
+        for titles, chunk in chunks:
+            requests.append(self._chunk_request(titles, chunk, report, profile, semaphore))
+        responses = await asyncio.gather(*requests)
+
+        groups = []
+        unparsed = []
+        failed = 0
+        for response in responses:
+            if self._is_llm_failure(response):
+                failed += 1
+                continue
+            found = parse_findings(response)
+            if found:
+                groups.append(found)
+            elif response:
+                unparsed.append(response)
+        if failed == len(responses):
+            return responses[0], False
+        parts = [format_findings(merge_findings(*groups)), *unparsed]
+        if failed:
+            parts.append(f"Внимание: {failed} из {len(responses)} частей документа проверить не удалось. Повторите запрос позже.")
+        return "\n\n".join(part for part in parts if part), failed == 0
+
+    async def _llm_request(self, messages: list[dict], progress: ProgressMessage | None = None) -> str:
+        self.metrics.observe("normobot_prompt_chars", sum(len(message["content"]) for message in messages), SIZE_BUCKETS)
+        for role, tokens in message_tokens(messages).items():
+            self.metrics.observe("normobot_prompt_tokens", tokens, TOKEN_BUCKETS, role=role)
+
+        async def call(route: Route) -> str:
+            if progress is not None:
+                progress.reset()
+                return await self._llm_stream(route, messages, progress)
+            response = await asyncio.to_thread(route.create, messages)
+            if isinstance(response, dict):
+                return response.get("choices", [{}])[0].get("message", {}).get("content", "").strip()
+            elif isinstance(response, str):
+                return response.strip()
+            else:
+                return LLM_UNRECOGNIZED_MESSAGE
+
+        try:
+            async with self.llm_slots:
+                return await self.llm_pool.run(call, hedge=progress is None,
+                                               mode="stream" if progress is not None else "plain")
+        except Exception as e:
+            self.metrics.inc("normobot_llm_failures_total")
+            return f"{LLM_FAILURE_PREFIX}: {str(e)}\n{traceback.format_exc()}"
+
+    async def _llm_stream(self, route: Route, messages: list[dict], progress: ProgressMessage) -> str:
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        finished = object()
+        stopped = False
+
+        def produce():
             try:
-                async with asyncio.timeout(CONFIG["llm_timeout"]):
-                    response = await asyncio.to_thread(
-                        g4f.ChatCompletion.create,
-                        model=model,
-                        messages=[{"role": "user", "content": prompt}]
-                    )
-                    if isinstance(response, dict):
-                        return response.get("choices", [{}])[0].get("message", {}).get("content", "").strip()
-                    elif isinstance(response, str):
-                        return response.strip()
-                    else:
-                        return "Ответ LLM не распознан."
+                for chunk in route.create(messages, stream=True):
+                    if stopped:
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, chunk)
             except Exception as e:
-                if attempt < CONFIG["retry_attempts"]:
-                    await asyncio.sleep(CONFIG["retry_interval"])
-                else:
-                    return f"Не удалось получить ответ от LLM: {str(e)}\n{traceback.format_exc()}"
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, finished)
 
-    async def send_analysis(self, update: Update, analysis: str):
-        if len(analysis) <= CONFIG["max_message_length"]:
-            await update.message.reply_text(analysis, parse_mode="Markdown")
-        else:
-            pdf_path = "/tmp/analysis.pdf"
-            self.create_pdf(analysis, pdf_path)
-            await update.message.reply_text(
-                f"Ответ слишком длинный ({len(analysis)} символов), отправляю в виде файла."
-            )
-            with open(pdf_path, "rb") as f:
-                await update.message.reply_document(f)
-            os.remove(pdf_path)
-
-    def create_pdf(self, text: str, path: str):
+        producer = asyncio.ensure_future(asyncio.to_thread(produce))
+        parts = []
+        try:
+            while (item := await queue.get()) is not finished:
+                if isinstance(item, Exception):
+                    raise item
+                # Помимо текста провайдеры g4f могут отдавать служебные объекты
+                if isinstance(item, str) and item:
+                    parts.append(item)
+                    await progress.feed(item)
+        finally:
+            # При таймауте или ошибке поток дочитывает генератор только до следующего фрагмента
+            stopped = True
+        await producer
+        return "".join(parts).strip()
+
+    async def send_analysis(self, update: Update, analysis: str, progress: ProgressMessage | None = None):
+        with self.metrics.timer("send", format="text" if len(analysis) <= CONFIG["max_message_length"] else "pdf"):
+            if len(analysis) <= CONFIG["max_message_length"]:
+                if progress is not None and await progress.finish(analysis):
+                    return
+                await update.message.reply_text(analysis, parse_mode="Markdown")
+            else:
+                pdf = await asyncio.to_thread(self.create_pdf, analysis)
+                await update.message.reply_text(
+                    f"Ответ слишком длинный ({len(analysis)} символов), отправляю в виде файла."
+                )
+                filename = f"analysis_{update.message.chat_id}_{update.message.message_id}.pdf"
+                await update.message.reply_document(pdf, filename=filename)
+
+    def create_pdf(self, text: str, table: list[list[str]] | None = None,
+                   column_widths: list[float] | None = None) -> bytes:
+        from pdf_report import render_pdf
         try:
             font_path = os.path.join(os.path.dirname(__file__), "times.ttf")
             font_bold_path = os.path.join(os.path.dirname(__file__), "timesbd.ttf")
-            if not os.path.exists(font_path) or not os.path.exists(font_bold_path):
-                raise FileNotFoundError("Шрифты Times New Roman не найдены")
-            pdfmetrics.registerFont(TTFont("TimesNewRoman", font_path))
-            pdfmetrics.registerFont(TTFont("TimesNewRoman-Bold", font_bold_path))
-            c = canvas.Canvas(path, pagesize=letter)
-            width, height = letter
-            margin = 40
-            line_height = 15
-            max_width = width - 2 * margin
-            c.setFont("TimesNewRoman", 12)
-            y = height - margin
-            for raw_line in text.split("\n"):
-                words = raw_line.split(" ")
-                current = ""
-                for word in words:
-                    test_line = (current + " " + word).strip()
-                    if pdfmetrics.stringWidth(test_line, "TimesNewRoman", 12) > max_width:
-                        c.drawString(margin, y, current)
-                        y -= line_height
-                        current = word
-                        if y < margin:
-                            c.showPage()
-                            c.setFont("TimesNewRoman", 12)
-                            y = height - margin
-                    else:
-                        current = test_line
-                c.drawString(margin, y, current)
-                y -= line_height
-                if y < margin:
-                    c.showPage()
-                    c.setFont("TimesNewRoman", 12)
-                    y = height - margin
-            c.save()
+            buffer = io.BytesIO()
+            with self.metrics.timer("create_pdf"):
+                render_pdf(text, buffer, font_path, font_bold_path, table, column_widths)
+            return buffer.getvalue()
         except Exception as e:
             raise Exception(f"Ошибка создания PDF: {str(e)}\n{traceback.format_exc()}")
 
+_bot_task = None
+
+
+async def _create_bot() -> NormalControllerBot:
+    started = time.perf_counter()
+    token = os.getenv("TELEGRAM_BOT_TOKEN")
+    if not token:
+        raise ValueError("Токен Telegram не указан")
+    bot = NormalControllerBot(token)
+    await bot.initialize()
+    print(json.dumps({"message": "Холодный старт: бот инициализирован",
+                      "init_seconds": round(time.perf_counter() - started, 3)}, ensure_ascii=False))
+    return bot
+
+
+async def get_bot() -> tuple[NormalControllerBot, bool]:
+    global _bot_task
+    loop = asyncio.get_running_loop()
+    cold = (
+        _bot_task is None
+        or _bot_task.get_loop() is not loop
+        or (_bot_task.done() and (_bot_task.cancelled() or _bot_task.exception() is not None))
+    )
+    if cold:
+        stale = _bot_task
+        _bot_task = loop.create_task(_create_bot())
+        if stale is not None and stale.done() and not stale.cancelled() and stale.exception() is None:
+            await _shutdown_stale(stale.result())
+    return await _bot_task, cold
+
+
+async def _shutdown_stale(bot: NormalControllerBot):
+    # Экземпляр из прежнего цикла событий: его задачи уже не выполнятся, но HTTP-клиенты Bot API
+    # и пул извлечения остались бы открытыми в тёплом контейнере
+    try:
+        await bot.shutdown()
+    except Exception as e:
+        print(json.dumps({"message": "Ошибка при закрытии прежнего экземпляра бота", "error": repr(e)},
+                         ensure_ascii=False))
+
+
+_job_queue = None
+
+
+def get_job_queue() -> JobQueue:
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue(CONFIG["job_db_path"], CONFIG["job_lease"], CONFIG["job_max_attempts"],
+                              CONFIG["job_retention"])
+    return _job_queue
+
+
 async def main_handler(event, context):
-    steps = []
+    tracer = Tracer(CONFIG["trace_capacity"], CONFIG["trace_level"])
+    bot = None
+    cold = None
     try:
-        steps.append(f"Шаг 1: Получение события (event). Сырые данные event: {json.dumps(event, ensure_ascii=False, indent=2)}")
-        
-        steps.append("Шаг 2: Получение токена Telegram")
-        token = os.getenv("TELEGRAM_BOT_TOKEN")
-        steps.append(f"Шаг 3: Проверка токена. Токен получен: {'<скрыт>' if token else 'None'}")
-        if not token:
-            raise ValueError("Токен Telegram не указан")
-        
-        steps.append("Шаг 4: Инициализация бота")
-        bot = NormalControllerBot(token)
-        steps.append("Шаг 5: Бот создан")
-        
-        steps.append("Шаг 6: Инициализация приложения бота")
-        await bot.initialize()
-        steps.append("Шаг 7: Приложение бота инициализировано")
-        
-        steps.append("Шаг 8: Извлечение тела запроса")
-        body = event.get('body') or event.get('httpRequest', {}).get('body', '') or json.dumps(event, ensure_ascii=False)
-        steps.append(f"Шаг 9: Тело запроса получено. Тип: {type(body)}, содержимое: '{body}'")
-        
-        if not body:
-            raise ValueError(f"Тело запроса отсутствует или пустое: '{body}'")
-        steps.append("Шаг 10: Проверка тела пройдена")
-        
-        steps.append("Шаг 11: Декодирование тела, если байты")
-        if isinstance(body, bytes):
-            body = body.decode('utf-8', errors='ignore')
-            steps.append(f"Шаг 12: Тело декодировано: '{body}'")
-        else:
-            steps.append(f"Шаг 12: Тело уже строка: '{body}'")
-        
-        if not body.strip():
-            raise ValueError("Пустое тело запроса после декодирования")
-        steps.append("Шаг 13: Проверка строки пройдена")
-        
-        steps.append("Шаг 14: Разбор JSON")
-        try:
-            update_data = json.loads(body)
-            steps.append(f"Шаг 15: JSON разобран: {json.dumps(update_data, ensure_ascii=False, indent=2)}")
-        except json.JSONDecodeError as e:
-            raise ValueError(f"Не удалось разобрать JSON: {str(e)}")
-        
-        steps.append("Шаг 16: Проверка JSON")
-        if not isinstance(update_data, dict) or not update_data:
-            raise ValueError(f"JSON не словарь или пустой: {update_data}")
-        steps.append("Шаг 17: JSON валиден")
-        
-        steps.append("Шаг 18: Создание Update")
-        update = Update.de_json(update_data, bot.application.bot)
-        if not update:
-            raise ValueError(f"Не удалось создать Update: {update_data}")
-        steps.append(f"Шаг 19: Update создан: {update}")
-        
-        steps.append("Шаг 20: Обработка обновления")
-        await bot.application.process_update(update)
-        steps.append("Шаг 21: Обновление обработано")
-        
-        steps.append("Шаг 22: Формирование ответа")
+        tracer.event("Событие: %s", event, level=logging.DEBUG)
+        with tracer.span("body"):
+            body = event.get('body') or event.get('httpRequest', {}).get('body', '') or json.dumps(event, ensure_ascii=False)
+            if not body:
+                raise ValueError(f"Тело запроса отсутствует или пустое: '{body}'")
+            if isinstance(body, bytes):
+                body = body.decode('utf-8', errors='ignore')
+            if not body.strip():
+                raise ValueError("Пустое тело запроса после декодирования")
+        tracer.event("Тело запроса: %d символов", len(body))
+        tracer.event("Тело запроса: %s", body, level=logging.DEBUG)
+
+        with tracer.span("parse"):
+            try:
+                update_data = json.loads(body)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Не удалось разобрать JSON: {str(e)}")
+            if not isinstance(update_data, dict) or not update_data:
+                raise ValueError(f"JSON не словарь или пустой: {update_data}")
+
+        if CONFIG["async_jobs"]:
+            with tracer.span("enqueue"):
+                if not isinstance(update_data.get("update_id"), int):
+                    raise ValueError(f"В обновлении нет update_id: {update_data}")
+                queued = get_job_queue().enqueue(update_data["update_id"], body)
+            tracer.event("Обновление %s: %s", update_data["update_id"],
+                         "поставлено в очередь" if queued else "повторная доставка, пропущено")
+            return {'statusCode': 200, 'body': 'OK'}
+
+        with tracer.span("bot"):
+            bot, cold = await get_bot()
+        tracer.event("Бот получен (%s старт)", "холодный" if cold else "тёплый")
+
+        with tracer.span("update"):
+            update = Update.de_json(update_data, bot.application.bot)
+            if not update:
+                raise ValueError(f"Не удалось создать Update: {update_data}")
+        tracer.event("Update: %s", update, level=logging.DEBUG)
+
+        with tracer.span("process", "update_id=%s", update.update_id):
+            await bot.application.process_update(update)
+            bot.update_errors.pop(update.update_id, None)
         return {'statusCode': 200, 'body': 'OK'}
     
     except Exception as e:
-        steps.append(f"Шаг ошибки: Ошибка: {str(e)}")
         return {
             'statusCode': 500,
-            'body': f"Ошибка: {str(e)}\nТрассировка:\n{traceback.format_exc()}\n\nШаги:\n" + "\n".join(steps)
-        }
\ No newline at end of file
+            'body': f"Ошибка: {str(e)}\nТрассировка:\n{traceback.format_exc()}\n\nШаги:\n" + tracer.dump()
+        }
+    finally:
+        print(json.dumps({"message": "Вызов обработан", "cold_start": cold,
+                          "duration_seconds": round(tracer.elapsed(), 3), "spans_ms": tracer.timings(),
+                          "metrics": bot.metrics.snapshot(reset=True) if bot is not None else {}},
+                         ensure_ascii=False))
+
+
+async def worker_handler(event, context):
+    started = time.perf_counter()
+    queue = get_job_queue()
+    bot, cold = await get_bot()
+    processed = failed = 0
+    while time.perf_counter() - started < CONFIG["worker_time_budget"]:
+        job = queue.claim()
+        if job is None:
+            break
+        update_id, payload = job
+        try:
+            update = Update.de_json(json.loads(payload), bot.application.bot)
+            await bot.application.process_update(update)
+            error = bot.update_errors.pop(update_id, None)
+            if error is not None:
+                raise RuntimeError(error)
+            queue.complete(update_id)
+            processed += 1
+        except Exception as e:
+            queue.fail(update_id, f"{e}\n{traceback.format_exc()}")
+            failed += 1
+    queue.purge()
+    result = {"processed": processed, "failed": failed, "queue": queue.stats()}
+    print(json.dumps({"message": "Очередь обработана", "cold_start": cold,
+                      "duration_seconds": round(time.perf_counter() - started, 3), **result,
+                      "metrics": bot.metrics.snapshot(reset=True)}, ensure_ascii=False))
+    return {'statusCode': 200, 'body': json.dumps(result, ensure_ascii=False)}
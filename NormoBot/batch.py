@@ -0,0 +1,134 @@
+import logging
+import os
+import time
+import zipfile
+from datetime import timedelta
+from pathlib import PurePosixPath
+from typing import NamedTuple
+
+from telegram.error import RetryAfter, TelegramError
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_MIME_TYPES = ("application/zip", "application/x-zip-compressed", "application/x-zip")
+COPY_BLOCK = 1024 * 1024
+
+# Столбцы сводной таблицы и их доли ширины страницы
+SUMMARY_HEADER = ["№", "Документ", "Символов", "Замечаний", "Результат"]
+SUMMARY_WIDTHS = [0.5, 4, 1.3, 1.3, 2.4]
+
+
+class ArchiveError(ValueError):
+    """Архив не может быть проверен; текст исключения показывается пользователю."""
+
+
+class BatchItem(NamedTuple):
+    name: str
+    chars: int
+    findings: int | None  # None — замечания не распознаны или документ не проверен
+    report: str  # замечания по документу или текст ошибки
+    status: str
+
+
+def is_archive(mime_type: str | None, file_name: str) -> bool:
+    return mime_type in ARCHIVE_MIME_TYPES or file_name.lower().endswith(".zip")
+
+
+def member_name(info: zipfile.ZipInfo) -> str:
+    """
+    Имя файла в архиве. Имена без флага UTF-8 zipfile читает как cp437,
+    а архиваторы Windows с русской локалью пишут их в cp866.
+    """
+    name = info.filename
+    if not info.flag_bits & 0x800:
+        try:
+            name = name.encode("cp437").decode("cp866")
+        except UnicodeError:
+            pass
+    return name
+
+
+def archive_members(archive: zipfile.ZipFile, max_members: int, max_total_size: int) -> list[zipfile.ZipInfo]:
+    """
+    Документы архива без каталогов и служебных файлов (__MACOSX, скрытые).
+    Лимиты проверяются по центральному каталогу до распаковки: zipfile не читает
+    больше объявленного размера, поэтому архив-«бомба» не распакуется сверх лимита.
+    """
+    members = []
+    for info in archive.infolist():
+        path = PurePosixPath(info.filename)
+        if info.is_dir() or "__MACOSX" in path.parts or path.name.startswith("."):
+            continue
+        members.append(info)
+    if not members:
+        raise ArchiveError("В архиве нет документов.")
+    if len(members) > max_members:
+        raise ArchiveError(f"Файлов в архиве: {len(members)}, за один раз можно проверить не больше {max_members}.")
+    total = sum(info.file_size for info in members)
+    if total > max_total_size:
+        raise ArchiveError(
+            f"Распакованные документы занимают {total // 2**20} МБ, допускается не больше {max_total_size // 2**20} МБ."
+        )
+    return members
+
+
+def unpack_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo, directory: str, index: int, max_size: int) -> str:
+    """
+    Распаковка одного документа во временный файл блоками по COPY_BLOCK. Имя файла
+    строится из номера и расширения: путь из архива на диск не попадает.
+    """
+    if info.flag_bits & 0x1:
+        raise ArchiveError("файл зашифрован")
+    if info.file_size > max_size:
+        raise ArchiveError(f"файл больше {max_size // 2**20} МБ")
+    path = os.path.join(directory, f"{index}{PurePosixPath(info.filename).suffix.lower()}")
+    with archive.open(info) as source, open(path, "wb") as target:
+        while block := source.read(COPY_BLOCK):
+            target.write(block)
+    return path
+
+
+def summary_table(items: list[BatchItem]) -> list[list[str]]:
+    """Сводная таблица для PDF: заголовок и строка на каждый документ."""
+    rows = [SUMMARY_HEADER]
+    for number, item in enumerate(items, 1):
+        findings = "—" if item.findings is None else str(item.findings)
+        rows.append([str(number), item.name, str(item.chars), findings, item.status])
+    return rows
+
+
+def format_batch_report(items: list[BatchItem]) -> str:
+    """Текст сводного отчёта после таблицы: замечания по каждому документу."""
+    checked = sum(1 for item in items if item.findings is not None)
+    total = sum(item.findings or 0 for item in items)
+    parts = [f"Проверено документов: {checked} из {len(items)}, замечаний всего: {total}."]
+    for number, item in enumerate(items, 1):
+        parts.append(f"{number}. {item.name}\n\n{item.report or 'Замечаний не выявлено.'}")
+    return "\n\n\n".join(parts)
+
+
+class BatchProgress:
+    """
+    Ход пакетной проверки в сообщении о статусе: сколько документов проверено
+    и какой завершён последним. Правки не чаще одной в interval секунд, кроме последней.
+    """
+
+    def __init__(self, message, total: int, interval: float):
+        self.message = message
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self._next_edit = 0.0
+
+    async def advance(self, name: str):
+        self.done += 1
+        if self.done < self.total and time.monotonic() < self._next_edit:
+            return
+        self._next_edit = time.monotonic() + self.interval
+        try:
+            await self.message.edit_text(f"Проверено документов: {self.done} из {self.total}. Последний: {name}")
+        except RetryAfter as e:
+            delay = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else e.retry_after
+            self._next_edit = time.monotonic() + max(delay, self.interval)
+        except TelegramError as e:
+            logger.debug(f"Правка сообщения о ходе пакетной проверки не выполнена: {e}")
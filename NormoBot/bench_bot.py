@@ -0,0 +1,486 @@
+"""
+Нагрузочный бенчмарк NormalControllerBot без сети: синтетические обновления Telegram
+проходят через обработчики бота (Application.process_update), запросы к Bot API
+обслуживает подставной транспорт, g4f.ChatCompletion.create заменён заглушкой
+с настраиваемой задержкой.
+
+Сценарии:
+    text      текст ТЗ в сообщении, короткий ответ;
+    document  ТЗ в файлах PDF, DOCX и TXT (UTF-8 и cp1251) разного размера
+              (крупные анализируются по частям);
+    pdf       текст ТЗ в сообщении, длинный ответ отправляется PDF-файлом;
+    archive   ZIP-архив с --archive-docs документами DOCX и TXT, ответ — сводный PDF;
+    webhook   текст ТЗ, по два сообщения на чат, через HTTP-сервер вебхука (webhook.py):
+              проверяется порядок обработки внутри чата, затем сервер останавливается
+              сразу после приёма обновлений и должен доработать все начатые проверки.
+
+Для каждого сценария выводятся перцентили времени от получения обновления до ответа,
+обновлений в секунду и пиковый RSS. Каждый сценарий выполняется в отдельном процессе,
+чтобы пиковый RSS не переходил из одного сценария в другой.
+
+    python bench_bot.py [--scenario text document pdf archive webhook] [--updates 40] [--rate 0]
+                        [--llm-latency 0.5] [--tg-latency 0.02] [--set ключ=значение ...]
+"""
+import argparse
+import ast
+import asyncio
+import io
+import json
+import logging
+import os
+import random
+import socket
+import statistics
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+from xml.sax.saxutils import escape
+
+import aiohttp
+import g4f
+from telegram import Update
+from telegram.ext import Application
+from telegram.request import BaseRequest
+
+import NormoBot
+from bench_pdf import make_report
+from chunking import SECTION_TITLES
+from pdf_report import render_pdf
+from webhook import ChatOrderedProcessor, serve_webhook
+
+SCENARIOS = ("text", "document", "pdf", "archive", "webhook")
+TOKEN = "123456:bench"
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Ответы бота, которые считаются ошибкой обработки обновления
+ERROR_REPLIES = ("Ошибка", "Файл слишком большой", "Сейчас слишком много проверок", NormoBot.LLM_FAILURE_MESSAGE)
+
+_REQUIREMENTS = (
+    "Изделие должно соответствовать требованиям ГОСТ 15.016-2016 и ГОСТ Р 2.105-2019. "
+    "Номинальное напряжение аккумуляторной батареи 24 В, ёмкость не менее 60 А·ч. "
+    "Диапазон рабочих температур от минус 30 до плюс 55 °С. "
+    "Изделие должно выдерживать вибрацию и механические удары по ГОСТ 30631-99. "
+    "Масса изделия не более 25 кг, габаритные размеры не более 400×300×250 мм. "
+    "Средняя наработка на отказ не менее 5000 ч. "
+    "Документация разрабатывается в соответствии с ГОСТ 2.601-2019. "
+).rstrip(". ").split(". ")
+
+
+def make_tz(size: int, seed: int) -> str:
+    """Текст ТЗ с разделами из SECTION_TITLES длиной около size символов."""
+    rng = random.Random(seed)
+    parts = [f"Техническое задание № {seed}\n\n"]
+    length = len(parts[0])
+    number = 0
+    while length < size:
+        title = SECTION_TITLES[number % len(SECTION_TITLES)]
+        number += 1
+        body = ". ".join(rng.choice(_REQUIREMENTS) for _ in range(rng.randint(3, 12)))
+        section = f"{number}. {title}\n{body}.\n\n"
+        parts.append(section)
+        length += len(section)
+    return "".join(parts)[:size]
+
+
+def make_docx(text: str) -> bytes:
+    """Минимальный документ Word: абзац на каждую строку текста."""
+    body = "".join(f"<w:p><w:r><w:t>{escape(line)}</w:t></w:r></w:p>" for line in text.splitlines())
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", '<?xml version="1.0" encoding="UTF-8"?><Types/>')
+        archive.writestr("word/document.xml", (
+            '<?xml version="1.0" encoding="UTF-8"?><w:document xmlns:w='
+            f'"http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>{body}</w:body></w:document>'
+        ))
+    return buffer.getvalue()
+
+
+def peak_rss_mb() -> tuple[float | None, float | None]:
+    """Пиковый RSS процесса и его дочерних процессов (пула извлечения текста) в МБ."""
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None, None
+        return psutil.Process().memory_info().peak_wset / 2**20, None
+    scale = 2**20 if sys.platform == "darwin" else 2**10  # ru_maxrss в байтах на macOS, в КБ в Linux
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return own, children
+
+
+class FakeLLM:
+    """Заглушка g4f.ChatCompletion.create: ответ заданной длины через latency ± jitter секунд."""
+
+    def __init__(self, latency: float, jitter: float, answer_chars: int, stream_chunks: int = 50, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.answer = make_report(answer_chars, seed)
+        self.stream_chunks = stream_chunks
+        self._rng = random.Random(seed)
+        self.calls = 0
+
+    def _delay(self) -> float:
+        return max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+
+    def create(self, model: str, messages: list, stream: bool = False, **kwargs):
+        # Вызывается в рабочем потоке (asyncio.to_thread), поэтому задержка — time.sleep
+        self.calls += 1
+        delay = self._delay()
+        if not stream:
+            time.sleep(delay)
+            return self.answer
+        return self._stream(delay)
+
+    def _stream(self, delay: float):
+        step = max(1, len(self.answer) // self.stream_chunks)
+        pieces = [self.answer[i:i + step] for i in range(0, len(self.answer), step)]
+        for piece in pieces:
+            time.sleep(delay / len(pieces))
+            yield piece
+
+
+class FakeTransport(BaseRequest):
+    """
+    Подставной транспорт Bot API: отвечает на методы, которые вызывает бот,
+    отдаёт содержимое «загруженных» файлов и запоминает отправленные ответы.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.files = {}  # file_path -> содержимое
+        self.replies = {}  # chat_id -> [текст или имя документа]
+        self.requests = 0
+        self._message_id = 10**6
+
+    @property
+    def read_timeout(self) -> float | None:
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _message(self, params: dict, **extra) -> dict:
+        self._message_id += 1
+        chat_id = int(params.get("chat_id", 0))
+        return {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": 1, "is_bot": True, "first_name": "NormoBot"},
+            **extra,
+        }
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None) -> tuple[int, bytes]:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if "/file/bot" in url:
+            return 200, self.files[url.rsplit("/", 1)[-1]]
+
+        endpoint = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data is not None else {}
+        if endpoint == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "NormoBot", "username": "normobot_bench"}
+        elif endpoint == "getFile":
+            file_id = params["file_id"]
+            result = {"file_id": file_id, "file_unique_id": file_id, "file_size": len(self.files[file_id]),
+                      "file_path": file_id}
+        elif endpoint in ("sendMessage", "editMessageText"):
+            self.replies.setdefault(int(params["chat_id"]), []).append(params["text"])
+            result = self._message(params, text=params["text"])
+        elif endpoint == "sendDocument":
+            name, content, mime_type = request_data.multipart_data["document"]
+            self.replies.setdefault(int(params["chat_id"]), []).append(name)
+            result = self._message(params, document={
+                "file_id": name, "file_unique_id": name, "file_name": name,
+                "mime_type": mime_type, "file_size": len(content),
+            })
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode("utf-8")
+
+
+def make_document(text: str, n: int) -> tuple[bytes, str, str]:
+    """Файл с текстом ТЗ: по очереди DOCX, TXT в UTF-8 и TXT в cp1251."""
+    kind = n % 3
+    if kind == 0:
+        return make_docx(text), f"tz_{n}.docx", DOCX_MIME
+    if kind == 1:
+        return text.encode("utf-8"), f"tz_{n}.txt", "text/plain"
+    return text.encode("cp1251", "replace"), f"tz_{n}.txt", "text/plain"
+
+
+def make_archive(count: int, seed: int) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for n in range(count):
+            content, name, _ = make_document(make_tz((5_000, 12_000, 20_000)[n % 3], seed=seed * 1000 + n), n)
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+def make_updates(scenario: str, count: int, transport: FakeTransport, font_path: str, font_bold_path: str,
+                 archive_docs: int = 10) -> list[dict]:
+    """
+    Синтетические обновления сценария; у каждого свой чат, чтобы анализы не ждали друг друга,
+    кроме webhook, где на чат приходится по два сообщения.
+    """
+    updates = []
+    for n in range(count):
+        chat_id = 1000 + (n // 2 if scenario == "webhook" else n)
+        message = {
+            "message_id": n + 1,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Bench"},
+        }
+        if scenario == "archive":
+            file_id = f"zip{n}"
+            transport.files[file_id] = make_archive(archive_docs, seed=n)
+            message["document"] = {
+                "file_id": file_id, "file_unique_id": file_id, "file_name": f"package_{n}.zip",
+                "mime_type": "application/zip", "file_size": len(transport.files[file_id]),
+            }
+        elif scenario in ("text", "pdf", "webhook"):
+            # Длина сообщения Telegram ограничена 4096 символами
+            message["text"] = make_tz(random.Random(n).randint(1000, 4000), seed=n)
+        else:
+            size = (5_000, 20_000, 60_000)[n % 3]
+            text = make_tz(size, seed=n)
+            file_id = f"doc{n}"
+            if n % 4:
+                content, name, mime_type = make_document(text, n)
+            else:
+                buffer = io.BytesIO()
+                render_pdf(text, buffer, font_path, font_bold_path)
+                content, name, mime_type = buffer.getvalue(), f"tz_{n}.pdf", "application/pdf"
+            transport.files[file_id] = content
+            message["document"] = {
+                "file_id": file_id, "file_unique_id": file_id, "file_name": name,
+                "mime_type": mime_type, "file_size": len(content),
+            }
+        updates.append({"update_id": n + 1, "message": message})
+    return updates
+
+
+async def drive(args, scenario: str) -> dict:
+    font_path = args.font or os.path.join(HERE, "times.ttf")
+    font_bold_path = args.font_bold or os.path.join(HERE, "timesbd.ttf")
+    transport = FakeTransport(args.tg_latency)
+    answer_chars = args.long_answer_chars if scenario == "pdf" else args.answer_chars
+    llm = FakeLLM(args.llm_latency, args.llm_jitter, answer_chars)
+
+    bot = NormoBot.NormalControllerBot(TOKEN)
+    processor = ChatOrderedProcessor(NormoBot.CONFIG["max_concurrent_updates"], NormoBot.CONFIG["max_pending_updates"])
+    bot.application = (Application.builder().token(TOKEN).request(transport).get_updates_request(transport)
+                       .concurrent_updates(processor).build())
+    # Порядок, в котором обработчик получает сообщения каждого чата (сценарий webhook)
+    order = {}
+    handle_text = bot.handle_text
+
+    async def ordered_handle_text(update, context):
+        order.setdefault(update.effective_chat.id, []).append(update.update_id)
+        await handle_text(update, context)
+
+    bot.handle_text = ordered_handle_text
+    bot.setup_handlers()
+    application = bot.application
+    if scenario != "webhook":
+        await application.initialize()
+        await application.start()  # без start задачи Application.create_task не отслеживаются
+
+    started = {}
+    finished = {}
+    pending = []
+    loop = asyncio.get_running_loop()
+    tracked = set()
+
+    def track(method):
+        # Сопрограмма создаётся синхронно в обработчике, поэтому future появляется до возврата из него.
+        # Анализ текста проходит через обе обёртки (_run_scheduled_analysis вызывает _run_scheduled),
+        # учитывается внешняя.
+        def wrapper(update, *args):
+            if update.update_id in tracked:
+                return method(update, *args)
+            tracked.add(update.update_id)
+            done = loop.create_future()
+            pending.append(done)
+
+            async def run():
+                try:
+                    await method(update, *args)
+                finally:
+                    finished[update.update_id] = time.perf_counter()
+                    done.set_result(None)
+            return run()
+        return wrapper
+
+    bot._run_scheduled_analysis = track(bot._run_scheduled_analysis)
+    bot._run_scheduled = track(bot._run_scheduled)
+    updates = make_updates(scenario, args.updates, transport, font_path, font_bold_path, args.archive_docs)
+    if scenario == "webhook":
+        return await drive_webhook(bot, updates, llm, transport, tracked, pending, started, finished, order)
+    updates = [Update.de_json(data, application.bot) for data in updates]
+
+    async def feed(update: Update):
+        started[update.update_id] = time.perf_counter()
+        before = len(pending)
+        await application.process_update(update)
+        if len(pending) == before:  # обновление отклонено без анализа
+            finished[update.update_id] = time.perf_counter()
+
+    # Шрифты и PDF: в create_pdf зашиты пути Windows, подставляются шрифты бенчмарка
+    with mock.patch.object(g4f.ChatCompletion, "create", llm.create), \
+            mock.patch.object(NormoBot, "render_pdf",
+                              lambda text, output, _font, _bold, *table: render_pdf(text, output, font_path,
+                                                                                    font_bold_path, *table)):
+        begin = time.perf_counter()
+        feeders = []
+        for update in updates:
+            feeders.append(asyncio.create_task(feed(update)))
+            if args.rate:
+                await asyncio.sleep(1 / args.rate)
+        await asyncio.gather(*feeders)
+        await asyncio.gather(*pending)
+        elapsed = time.perf_counter() - begin
+
+    await application.stop()
+    await application.shutdown()
+    bot.close()
+    return summarize(scenario, elapsed, started, finished, llm, transport)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def drive_webhook(bot, updates: list[dict], llm, transport: FakeTransport, tracked: set, pending: list,
+                        started: dict, finished: dict, order: dict) -> dict:
+    """
+    Сценарий webhook: обновления отправляются POST-запросами в serve_webhook на localhost,
+    как их отправлял бы Telegram. Сразу после приёма всех обновлений сервер получает сигнал
+    остановки; serve_webhook должен вернуться только после завершения всех проверок.
+    Нарушения порядка сообщений в чате и недоработанные проверки считаются ошибками.
+    """
+    port = free_port()
+    stop = asyncio.Event()
+    with mock.patch.object(g4f.ChatCompletion, "create", llm.create):
+        server = asyncio.create_task(serve_webhook(bot.application, "https://bench.invalid", "127.0.0.1", port,
+                                                   "/telegram", "bench-secret", 60, stop))
+        url = f"http://127.0.0.1:{port}/telegram"
+        async with aiohttp.ClientSession(headers={"X-Telegram-Bot-Api-Secret-Token": "bench-secret"}) as session:
+            for _ in range(100):  # ожидание запуска сервера
+                try:
+                    async with session.get(f"http://127.0.0.1:{port}/healthz"):
+                        break
+                except aiohttp.ClientConnectionError:
+                    await asyncio.sleep(0.05)
+            begin = time.perf_counter()
+            for data in updates:
+                started[data["update_id"]] = time.perf_counter()
+                async with session.post(url, json=data) as response:
+                    response.raise_for_status()
+        stop.set()
+        await server
+        elapsed = time.perf_counter() - begin
+    bot.close()
+
+    result = summarize("webhook", elapsed, {key: started[key] for key in finished}, finished, llm, transport)
+    unordered = sum(ids != sorted(ids) for ids in order.values())
+    undrained = len(started) - sum(future.done() for future in pending)
+    result["errors"] += unordered + undrained
+    return result
+
+
+def summarize(scenario: str, elapsed: float, started: dict, finished: dict, llm, transport: FakeTransport) -> dict:
+    latencies = sorted(finished[key] - started[key] for key in started)
+    errors = sum(
+        any(str(reply).startswith(ERROR_REPLIES) for reply in replies)
+        for replies in transport.replies.values()
+    )
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    rss, rss_children = peak_rss_mb()
+    return {
+        "scenario": scenario,
+        "updates": len(latencies),
+        "errors": errors,
+        "llm_calls": llm.calls,
+        "api_requests": transport.requests,
+        "seconds": round(elapsed, 3),
+        "updates_per_second": round(len(latencies) / elapsed, 3),
+        "p50": round(quantiles[49], 3),
+        "p90": round(quantiles[89], 3),
+        "p99": round(quantiles[98], 3),
+        "max": round(latencies[-1], 3),
+        "peak_rss_mb": round(rss, 1) if rss is not None else None,
+        "peak_rss_children_mb": round(rss_children, 1) if rss_children is not None else None,
+    }
+
+
+def run_scenario(args, scenario: str) -> dict:
+    """Точка входа процесса сценария."""
+    logging.getLogger().setLevel(args.log_level)
+    NormoBot.CONFIG.update(cache_db_path=None, retry_interval=0)
+    NormoBot.CONFIG.update(args.set)
+    return asyncio.run(drive(args, scenario))
+
+
+def parse_setting(value: str) -> tuple[str, object]:
+    key, _, raw = value.partition("=")
+    if key not in NormoBot.CONFIG:
+        raise argparse.ArgumentTypeError(f"нет такого ключа CONFIG: {key}")
+    try:
+        return key, ast.literal_eval(raw)
+    except (ValueError, SyntaxError):
+        return key, raw
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк обработчиков NormoBot без сети")
+    parser.add_argument("--scenario", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--updates", type=int, default=40, help="обновлений на сценарий")
+    parser.add_argument("--rate", type=float, default=0, help="обновлений в секунду (0 — все сразу)")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="время ответа заглушки LLM, с")
+    parser.add_argument("--llm-jitter", type=float, default=0.1, help="разброс времени ответа, с")
+    parser.add_argument("--answer-chars", type=int, default=1500, help="длина короткого ответа")
+    parser.add_argument("--long-answer-chars", type=int, default=20000, help="длина ответа в сценарии pdf")
+    parser.add_argument("--archive-docs", type=int, default=10, help="документов в архиве в сценарии archive")
+    parser.add_argument("--tg-latency", type=float, default=0.02, help="задержка запроса к Bot API, с")
+    parser.add_argument("--font", help="путь к times.ttf (по умолчанию — каталог бота)")
+    parser.add_argument("--font-bold", help="путь к timesbd.ttf")
+    parser.add_argument("--set", type=parse_setting, action="append", default=[], metavar="КЛЮЧ=ЗНАЧЕНИЕ",
+                        help="переопределение CONFIG, например --set max_concurrent_analyses=8")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--json", action="store_true", help="вывод результатов в JSON")
+    args = parser.parse_args()
+
+    results = []
+    for scenario in args.scenario:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            results.append(executor.submit(run_scenario, args, scenario).result())
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+    print(f"{'сценарий':>9} {'обновл.':>8} {'ошибок':>7} {'обн./с':>8} {'p50, с':>8} {'p90, с':>8} "
+          f"{'p99, с':>8} {'max, с':>8} {'RSS, МБ':>8} {'RSS извл., МБ':>14}")
+    for r in results:
+        print(f"{r['scenario']:>9} {r['updates']:>8} {r['errors']:>7} {r['updates_per_second']:>8.2f} "
+              f"{r['p50']:>8.3f} {r['p90']:>8.3f} {r['p99']:>8.3f} {r['max']:>8.3f} "
+              f"{r['peak_rss_mb'] or 0:>8.1f} {r['peak_rss_children_mb'] or 0:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
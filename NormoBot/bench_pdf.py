@@ -0,0 +1,81 @@
+"""
+Микробенчмарк вёрстки PDF: прежний перенос строк (ширина всей строки пересчитывается
+на каждое слово) против накопления ширин слов, и полная генерация PDF в память.
+
+    python bench_pdf.py [путь к times.ttf] [путь к timesbd.ttf]
+"""
+import io
+import os
+import random
+import sys
+import time
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfbase import pdfmetrics
+
+from pdf_report import FONT_NAME, FONT_SIZE, MARGIN, register_fonts, render_pdf, wrap_text
+
+SIZES = [10_000, 25_000, 50_000, 100_000, 200_000]
+_WORDS = (
+    "ТЗ аккумуляторной батареи должно содержать номинальное напряжение емкость ток заряда разряда "
+    "ГОСТ 15.016-2016 требования к документации Было Замечание Должно быть указать диапазон рабочих "
+    "температур от минус 30 до плюс 55 °С испытания на вибрацию удар и механические воздействия"
+).split()
+
+
+def make_report(size: int, seed: int = 0) -> str:
+    """Текст, похожий на ответ LLM: замечания с длинными абзацами без переносов."""
+    rng = random.Random(seed)
+    parts = []
+    length = 0
+    while length < size:
+        paragraph = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(20, 400)))
+        block = f"- Было: {paragraph}\n- Замечание: {paragraph[::-1]}\n- Должно быть: {paragraph}\n\n"
+        parts.append(block)
+        length += len(block)
+    return "".join(parts)[:size]
+
+
+def legacy_wrap(text: str, max_width: float) -> list[str]:
+    """Перенос строк из прежней версии create_pdf: квадратичен по длине строки."""
+    lines = []
+    for raw_line in text.split("\n"):
+        current = ""
+        for word in raw_line.split(" "):
+            test_line = (current + " " + word).strip()
+            if pdfmetrics.stringWidth(test_line, FONT_NAME, FONT_SIZE) > max_width:
+                lines.append(current)
+                current = word
+            else:
+                current = test_line
+        lines.append(current)
+    return lines
+
+
+def measure(func, *args) -> float:
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    here = os.path.dirname(os.path.abspath(__file__))
+    font_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(here, "times.ttf")
+    font_bold_path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(here, "timesbd.ttf")
+
+    start = time.perf_counter()
+    register_fonts(font_path, font_bold_path)
+    print(f"Регистрация шрифтов: {time.perf_counter() - start:.3f} с (один раз на процесс)")
+
+    max_width = letter[0] - 2 * MARGIN
+    print(f"{'символов':>10} {'прежний перенос, с':>20} {'новый перенос, с':>18} {'PDF целиком, с':>16} {'мкс/символ':>11}")
+    for size in SIZES:
+        text = make_report(size)
+        legacy = measure(legacy_wrap, text, max_width)
+        current = measure(lambda: list(wrap_text(text, max_width)))
+        full = measure(render_pdf, text, io.BytesIO(), font_path, font_bold_path)
+        print(f"{size:>10} {legacy:>20.3f} {current:>18.3f} {full:>16.3f} {full / size * 1e6:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import re
+
+# Обязательные разделы ТЗ, перечисленные в промпте (ГОСТ 15.016-2016)
+SECTION_TITLES = [
+    "Введение",
+    "Наименование, основание и сроки разработки",
+    "Цель разработки, наименование и обозначение изделия",
+    "Технические требования к изделию",
+    "Требования к сырью и материалам",
+    "Требования к консервации, упаковке и маркировке",
+    "Требования к учебно-тренировочным средствам",
+    "Специальные требования",
+    "Требования к документации",
+    "Этапы выполнения разработки",
+    "Порядок выполнения и приемки этапов разработки",
+    "Примечания и дополнительные указания",
+]
+
+PREAMBLE_TITLE = "Начало документа"
+
+# Начала заголовков разделов: сами заголовки из списка и типовые формулировки подразделов
+_HEADING_STEMS = [
+    "введение", "наименование", "основание", "цель разработки", "технические требования",
+    "требования к", "специальные требования", "этапы", "порядок", "примечания",
+    "дополнительные указания", "общие положения", "общие сведения", "назначение", "область применения",
+]
+_HEADING_RE = re.compile(
+    r"^\s*(?:(?:раздел\s+)?\d+(?:\.\d+)*\.?\s+)?(?:" + "|".join(re.escape(s) for s in _HEADING_STEMS) + r")\b",
+    re.IGNORECASE,
+)
+_MAX_HEADING_LENGTH = 150
+
+
+def is_heading(line: str) -> bool:
+    """Похожа ли строка на заголовок раздела ТЗ."""
+    stripped = line.strip()
+    if not stripped or len(stripped) > _MAX_HEADING_LENGTH:
+        return False
+    # «Наименование изделия: АКБ-1» — это поле, а не заголовок
+    if ":" in stripped.rstrip(":"):
+        return False
+    return _HEADING_RE.match(stripped.replace("ё", "е").replace("Ё", "Е")) is not None
+
+
+def split_sections(text: str) -> list[tuple[str, str]]:
+    """Разбиение текста ТЗ на разделы: [(заголовок, текст раздела вместе с заголовком)]."""
+    sections = []
+    title = PREAMBLE_TITLE
+    lines = []
+    for line in text.splitlines(keepends=True):
+        if is_heading(line):
+            if any(l.strip() for l in lines):
+                sections.append((title, "".join(lines)))
+            title = line.strip().rstrip(":")
+            lines = []
+        lines.append(line)
+    if any(l.strip() for l in lines):
+        sections.append((title, "".join(lines)))
+    return sections
+
+
+def _split_long(text: str, max_chars: int) -> list[str]:
+    """Деление слишком длинного раздела по строкам на куски не длиннее max_chars."""
+    parts = []
+    current = []
+    size = 0
+    for line in text.splitlines(keepends=True):
+        while len(line) > max_chars:
+            if current:
+                parts.append("".join(current))
+                current, size = [], 0
+            # Режем по последнему пробелу, чтобы не разрывать слова
+            cut = line.rfind(" ", 0, max_chars) + 1 or max_chars
+            parts.append(line[:cut])
+            line = line[cut:]
+        if size + len(line) > max_chars and current:
+            parts.append("".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line)
+    if current:
+        parts.append("".join(current))
+    return parts
+
+
+def make_chunks(sections: list[tuple[str, str]], max_chars: int) -> list[tuple[list[str], str]]:
+    """
+    Упаковка соседних разделов в фрагменты не длиннее max_chars.
+    Возвращает [(заголовки разделов фрагмента, текст фрагмента)].
+    """
+    chunks = []
+    titles = []
+    parts = []
+    size = 0
+    for title, body in sections:
+        pieces = _split_long(body, max_chars) if len(body) > max_chars else [body]
+        for piece in pieces:
+            if size + len(piece) > max_chars and parts:
+                chunks.append((titles, "".join(parts)))
+                titles, parts, size = [], [], 0
+            if title not in titles:
+                titles.append(title)
+            parts.append(piece)
+            size += len(piece)
+    if parts:
+        chunks.append((titles, "".join(parts)))
+    return chunks
@@ -0,0 +1,360 @@
+# Извлечение текста из документов ТЗ. Формат определяется по первым байтам файла,
+# затем по MIME-типу и расширению. Все извлекатели читают файл потоком и останавливаются,
+# набрав max_chars символов: остаток документа не распаковывается и не декодируется.
+import codecs
+import re
+import zipfile
+from pathlib import Path
+from typing import BinaryIO, Callable, Iterator, NamedTuple
+from xml.etree import ElementTree
+
+# Сколько байт читается для определения формата и кодировки
+HEAD_SIZE = 64 * 1024
+READ_SIZE = 64 * 1024
+
+
+class Extractor(NamedTuple):
+    name: str
+    mime_types: tuple[str, ...]
+    extensions: tuple[str, ...]
+    sniff: Callable[[bytes], bool] | None  # распознавание по первым байтам файла
+    extract: Callable[[BinaryIO, int], tuple[str, int]] | None  # (поток, max_chars) -> (текст, страниц)
+
+
+EXTRACTORS: list[Extractor] = []
+
+
+def register(extractor: Extractor) -> Extractor:
+    """Добавление извлекателя; при совпадении сигнатуры приоритет у зарегистрированных раньше."""
+    EXTRACTORS.append(extractor)
+    return extractor
+
+
+def detect_format(head: bytes, mime_type: str | None = None, file_name: str = "") -> Extractor | None:
+    """Извлекатель для файла: по сигнатуре в первых байтах, затем по MIME-типу, затем по расширению."""
+    for extractor in EXTRACTORS:
+        if extractor.sniff is not None and extractor.sniff(head):
+            return extractor
+    for extractor in EXTRACTORS:
+        if mime_type in extractor.mime_types:
+            return extractor
+    extension = Path(file_name).suffix.lower()
+    for extractor in EXTRACTORS:
+        if extension in extractor.extensions:
+            return extractor
+    return None
+
+
+def supported_formats() -> str:
+    """Перечень форматов для сообщений пользователю: «PDF, DOCX, ...»."""
+    return ", ".join(extractor.name.upper() for extractor in EXTRACTORS)
+
+
+def _collect(paragraphs: Iterator[str], max_chars: int) -> str:
+    """Абзацы до исчерпания бюджета символов; генератор закрывается, и чтение файла прекращается."""
+    parts = []
+    size = 0
+    for paragraph in paragraphs:
+        parts.append(paragraph)
+        size += len(paragraph) + 1
+        if size >= max_chars:
+            break
+    return "\n".join(parts)[:max_chars]
+
+
+# --- DOCX и ODT: ZIP-архив с XML, разбираемым потоково (iterparse) ---
+
+def _iter_paragraphs(xml: BinaryIO, paragraph_tags: set[str], render: Callable) -> Iterator[str]:
+    """
+    Текст абзацев XML-документа по мере чтения. Вложенные абзацы (надписи, сноски)
+    входят в текст внешнего; разобранные абзацы удаляются из дерева.
+    """
+    depth = 0
+    for event, element in ElementTree.iterparse(xml, events=("start", "end")):
+        if element.tag not in paragraph_tags:
+            continue
+        if event == "start":
+            depth += 1
+            continue
+        depth -= 1
+        if depth == 0:
+            yield render(element)
+            element.clear()
+
+
+def _zip_member(archive: zipfile.ZipFile, name: str, kind: str):
+    try:
+        return archive.open(name)
+    except KeyError:
+        raise ValueError(f"Файл не является документом {kind}: в архиве нет {name}") from None
+
+
+def _zip_pages(archive: zipfile.ZipFile, name: str, pattern: re.Pattern) -> int:
+    """Число страниц из метаданных документа (сохраняет текстовый редактор), иначе 1."""
+    try:
+        with archive.open(name) as f:
+            match = pattern.search(f.read(HEAD_SIZE).decode("utf-8", "replace"))
+    except KeyError:
+        return 1
+    return int(match.group(1)) if match else 1
+
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_DOCX_PAGES_RE = re.compile(r"<Pages>(\d+)</Pages>")
+
+
+def _docx_paragraph(element) -> str:
+    parts = []
+    for node in element.iter():
+        if node.tag == f"{_W}t":
+            parts.append(node.text or "")
+        elif node.tag == f"{_W}tab":
+            parts.append("\t")
+        elif node.tag in (f"{_W}br", f"{_W}cr"):
+            parts.append("\n")
+        elif node.tag == f"{_W}p" and node is not element:
+            parts.append("\n")
+    return "".join(parts)
+
+
+def extract_docx(stream: BinaryIO, max_chars: int) -> tuple[str, int]:
+    """Текст основной части документа Word (word/document.xml), без колонтитулов и сносок."""
+    with zipfile.ZipFile(stream) as archive:
+        pages = _zip_pages(archive, "docProps/app.xml", _DOCX_PAGES_RE)
+        with _zip_member(archive, "word/document.xml", "DOCX") as xml:
+            return _collect(_iter_paragraphs(xml, {f"{_W}p"}, _docx_paragraph), max_chars), pages
+
+
+_TEXT = "{urn:oasis:names:tc:opendocument:xmlns:text:1.0}"
+_ODT_MIMETYPE = b"mimetypeapplication/vnd.oasis.opendocument.text"
+_ODT_PAGES_RE = re.compile(r"page-count=\"(\d+)\"")
+
+
+def _odt_paragraph(element) -> str:
+    parts = [element.text or ""]
+    for child in element:
+        if child.tag == f"{_TEXT}s":
+            parts.append(" " * int(child.get(f"{_TEXT}c", 1)))
+        elif child.tag == f"{_TEXT}tab":
+            parts.append("\t")
+        elif child.tag == f"{_TEXT}line-break":
+            parts.append("\n")
+        elif child.tag in (f"{_TEXT}p", f"{_TEXT}h"):
+            parts.append("\n" + _odt_paragraph(child))
+        else:
+            parts.append(_odt_paragraph(child))
+        parts.append(child.tail or "")
+    return "".join(parts)
+
+
+def extract_odt(stream: BinaryIO, max_chars: int) -> tuple[str, int]:
+    """Текст документа OpenDocument (content.xml)."""
+    with zipfile.ZipFile(stream) as archive:
+        pages = _zip_pages(archive, "meta.xml", _ODT_PAGES_RE)
+        with _zip_member(archive, "content.xml", "ODT") as xml:
+            paragraphs = _iter_paragraphs(xml, {f"{_TEXT}p", f"{_TEXT}h"}, _odt_paragraph)
+            return _collect(paragraphs, max_chars), pages
+
+
+# --- RTF: разбор управляющих слов по мере чтения ---
+
+_RTF_TOKEN_RE = re.compile(
+    r"\\([a-zA-Z]+)(-?\d+)? ?"  # управляющее слово с необязательным числом
+    r"|((?:\\'[0-9a-fA-F]{2})+)"  # байты в кодовой странице документа (кириллица — подряд)
+    r"|\\(.)"  # управляющий символ
+    r"|([{}])"
+    r"|([^\\{}\r\n]+)"
+    r"|[\r\n]+",
+    re.DOTALL,
+)
+# Группы, текст которых не относится к содержимому документа
+_RTF_SKIP = {
+    "fonttbl", "colortbl", "stylesheet", "info", "pict", "object", "header", "headerl", "headerr", "headerf",
+    "footer", "footerl", "footerr", "footerf", "listtable", "listoverridetable", "rsidtbl", "generator",
+    "xmlnstbl", "themedata", "colorschememapping", "datastore", "latentstyles", "fldinst", "bkmkstart",
+    "bkmkend", "revtbl", "pgdsctbl", "mmathPr",
+}
+_RTF_BREAKS = {"par": "\n", "line": "\n", "sect": "\n", "page": "\n", "row": "\n", "cell": "\t", "tab": "\t"}
+_RTF_SYMBOLS = {"~": "\u00a0", "_": "-", "-": "", "\\": "\\", "{": "{", "}": "}", "\n": "\n", "\r": "\n"}
+
+
+class _RtfParser:
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self.parts = []
+        self.size = 0
+        self.codepage = "cp1252"
+        self.pages = 1
+        self.skip = False
+        self.uc = 1
+        self.stack = []
+        self.pending = 0  # символов замены после \uN, которые нужно пропустить
+        self.hex = bytearray()
+        self.group_start = False
+
+    def done(self) -> bool:
+        return self.size >= self.max_chars
+
+    def emit(self, text: str):
+        if self.pending:
+            skipped = min(self.pending, len(text))
+            self.pending -= skipped
+            text = text[skipped:]
+        if text and not self.skip:
+            self.parts.append(text)
+            self.size += len(text)
+
+    def flush_hex(self):
+        if self.hex:
+            text = self.hex.decode(self.codepage, "replace")
+            self.hex.clear()
+            if not self.skip:
+                self.parts.append(text)
+                self.size += len(text)
+
+    def feed(self, data: str):
+        for match in _RTF_TOKEN_RE.finditer(data):
+            word, arg, hex_bytes, symbol, brace, text = match.groups()
+            if hex_bytes is not None:
+                data = bytes.fromhex(hex_bytes.replace("\\'", ""))
+                skipped = min(self.pending, len(data))
+                self.pending -= skipped
+                self.hex += data[skipped:]
+                continue
+            self.flush_hex()
+            group_start, self.group_start = self.group_start, False
+            if brace == "{":
+                self.stack.append((self.skip, self.uc))
+                self.group_start = True
+            elif brace == "}":
+                if self.stack:
+                    self.skip, self.uc = self.stack.pop()
+            elif word is not None:
+                self.control(word, arg, group_start)
+            elif symbol is not None:
+                if symbol == "*" and group_start:
+                    self.skip = True
+                elif symbol in _RTF_SYMBOLS:
+                    self.emit(_RTF_SYMBOLS[symbol])
+            elif text is not None:
+                self.emit(text)
+            if self.done():
+                return
+
+    def control(self, word: str, arg: str | None, group_start: bool):
+        if word == "ansicpg" and arg:
+            self.codepage = f"cp{arg}"
+        elif word == "nofpages" and arg:
+            self.pages = int(arg)
+        elif word == "uc" and arg:
+            self.uc = int(arg)
+        elif word == "u" and arg:
+            code = int(arg)
+            self.emit(chr(code + 65536 if code < 0 else code))
+            self.pending = self.uc
+        elif word in _RTF_SKIP:
+            self.skip = True
+        elif word in _RTF_BREAKS:
+            self.emit(_RTF_BREAKS[word])
+
+    def text(self) -> str:
+        self.flush_hex()
+        return "".join(self.parts)[:self.max_chars]
+
+
+def extract_rtf(stream: BinaryIO, max_chars: int) -> tuple[str, int]:
+    """Текст документа RTF без служебных групп (шрифты, стили, колонтитулы, рисунки)."""
+    parser = _RtfParser(max_chars)
+    carry = ""
+    while not parser.done():
+        block = stream.read(READ_SIZE)
+        # RTF — 7-битный текст; неполное управляющее слово в конце блока разбирается со следующим
+        data = carry + block.decode("latin-1")
+        if not block:
+            parser.feed(data)
+            break
+        cut = data.rfind("\\", max(0, len(data) - 32))
+        while cut > 0 and data[cut - 1] == "\\":
+            cut -= 1
+        carry, data = (data[cut:], data[:cut]) if cut >= 0 else ("", data)
+        parser.feed(data)
+    return parser.text(), parser.pages
+
+
+# --- TXT: кодировка определяется по началу файла и уточняется по ходу чтения ---
+
+_BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+_RUSSIAN_FREQUENT = set("оеаинтсрвлкмдпу")
+
+
+def guess_single_byte(sample: bytes) -> str:
+    """Однобайтовая кириллическая кодировка: cp1251 или koi8-r — та, в которой больше частых строчных букв."""
+    return max(("cp1251", "koi8_r"), key=lambda encoding: sum(
+        char in _RUSSIAN_FREQUENT for char in sample.decode(encoding, "replace")
+    ))
+
+
+def extract_txt(stream: BinaryIO, max_chars: int) -> tuple[str, int]:
+    """
+    Текст файла в UTF-8 (с BOM или без), UTF-16 с BOM, cp1251 или koi8-r. Кодировка
+    определяется по первому блоку с не-ASCII байтами: если он не декодируется как UTF-8,
+    выбирается однобайтовая кириллическая. Пока встречается только ASCII, файл читается
+    как UTF-8; на первом недопустимом блоке чтение начинается заново в определённой кодировке.
+    """
+    head = stream.read(READ_SIZE)
+    encoding = next((name for bom, name in _BOMS if head.startswith(bom)), None)
+    if encoding is None and not head.isascii():
+        try:
+            codecs.getincrementaldecoder("utf-8")().decode(head, False)
+            encoding = "utf-8"
+        except UnicodeDecodeError:
+            encoding = guess_single_byte(head)
+    if encoding is None:
+        try:
+            return _decode(head, stream, "utf-8", "strict", max_chars), 1
+        except UnicodeDecodeError as e:
+            encoding = guess_single_byte(e.object)
+            stream.seek(0)
+            head = stream.read(READ_SIZE)
+    return _decode(head, stream, encoding, "replace", max_chars), 1
+
+
+def _decode(head: bytes, stream: BinaryIO, encoding: str, errors: str, max_chars: int) -> str:
+    decoder = codecs.getincrementaldecoder(encoding)(errors)
+    parts = []
+    size = 0
+    block = head
+    while size < max_chars:
+        final = not block
+        text = decoder.decode(block, final)
+        parts.append(text)
+        size += len(text)
+        if final:
+            break
+        block = stream.read(READ_SIZE)
+    return "".join(parts)[:max_chars]
+
+
+register(Extractor("pdf", ("application/pdf",), (".pdf",), lambda head: head.startswith(b"%PDF"), None))
+register(Extractor(
+    "docx",
+    ("application/vnd.openxmlformats-officedocument.wordprocessingml.document",),
+    (".docx",),
+    lambda head: head.startswith(b"PK\x03\x04") and b"[Content_Types].xml" in head[:64],
+    extract_docx,
+))
+register(Extractor(
+    "odt",
+    ("application/vnd.oasis.opendocument.text",),
+    (".odt",),
+    lambda head: head.startswith(b"PK\x03\x04") and _ODT_MIMETYPE in head[:128],
+    extract_odt,
+))
+register(Extractor(
+    "rtf", ("application/rtf", "text/rtf"), (".rtf",), lambda head: head.startswith(b"{\\rtf"), extract_rtf,
+))
+register(Extractor("txt", ("text/plain",), (".txt",), None, extract_txt))
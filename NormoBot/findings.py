@@ -0,0 +1,62 @@
+import re
+from typing import NamedTuple
+
+
+class Finding(NamedTuple):
+    """Замечание нормоконтроля в формате «Было / Замечание / Должно быть»."""
+    was: str
+    remark: str
+    should: str
+
+
+_FIELD_RE = re.compile(r"^\s*(?:[-*•]\s*)?(?:\*\*)?(Было|Замечание|Должно быть)(?:\*\*)?\s*:\s*(?:\*\*)?\s*(.*)$")
+_NORMALIZE_RE = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def parse_findings(text: str) -> list[Finding]:
+    """Разбор ответа LLM на замечания. Строки вне полей «Было/Замечание/Должно быть» пропускаются."""
+    findings = []
+    current = {}
+    field = None
+    for line in text.splitlines():
+        match = _FIELD_RE.match(line)
+        if match:
+            name, value = match.groups()
+            if name == "Было" and current:
+                findings.append(_to_finding(current))
+                current = {}
+            field = name
+            current[field] = value.strip()
+        elif field and line.strip() and not line.lstrip().startswith("#"):
+            # Продолжение многострочного значения
+            current[field] = f"{current[field]} {line.strip()}".strip()
+        else:
+            field = None
+    if current:
+        findings.append(_to_finding(current))
+    return findings
+
+
+def _to_finding(fields: dict) -> Finding:
+    return Finding(fields.get("Было", ""), fields.get("Замечание", ""), fields.get("Должно быть", ""))
+
+
+def finding_key(finding: Finding) -> str:
+    """Ключ для дедупликации: «Было» и «Замечание» без регистра, пунктуации и лишних пробелов."""
+    return _NORMALIZE_RE.sub(" ", f"{finding.was} {finding.remark}".lower()).strip()
+
+
+def merge_findings(*groups: list[Finding]) -> list[Finding]:
+    """Объединение замечаний с удалением повторов; порядок первого появления сохраняется."""
+    merged = {}
+    for group in groups:
+        for finding in group:
+            merged.setdefault(finding_key(finding), finding)
+    return list(merged.values())
+
+
+def format_findings(findings: list[Finding]) -> str:
+    """Замечания в текстовом формате ответа бота."""
+    return "\n\n".join(
+        f"- Было: {f.was}\n- Замечание: {f.remark}\n- Должно быть: {f.should}" for f in findings
+    )
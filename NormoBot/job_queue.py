@@ -0,0 +1,107 @@
+import sqlite3
+import threading
+import time
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobQueue:
+    """
+    Очередь обновлений Telegram в SQLite для отложенной обработки.
+    Ключ задания — update_id: повторно доставленное обновление не ставится
+    в очередь второй раз, пока запись о нём хранится (retention секунд).
+    Задание, взятое обработчиком и не завершённое за lease секунд, выдаётся снова.
+    """
+
+    def __init__(self, db_path: str, lease: float = 900, max_attempts: int = 2, retention: float = 2 * 24 * 3600):
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retention = retention
+        self._lock = threading.Lock()
+        # Автокоммит: транзакции открываются явно, чтобы выдача задания была атомарной между процессами
+        self._db = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "update_id INTEGER PRIMARY KEY, payload TEXT NOT NULL, status TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, created REAL NOT NULL, updated REAL NOT NULL, error TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)")
+
+    def enqueue(self, update_id: int, payload: str) -> bool:
+        """Постановка обновления в очередь. False, если обновление с таким update_id уже было."""
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO jobs (update_id, payload, status, created, updated) VALUES (?, ?, ?, ?, ?)",
+                (update_id, payload, QUEUED, now, now),
+            )
+            return cursor.rowcount == 1
+
+    def claim(self) -> tuple[int, str] | None:
+        """
+        Следующее задание в порядке поступления (update_id, payload) или None, если очередь пуста.
+        Задание с истёкшей арендой выдаётся снова, только пока не исчерпаны попытки: если обработчик
+        падал или не укладывался в lease max_attempts раз, задание помечается как FAILED.
+        """
+        now = time.time()
+        expired = now - self.lease
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute(
+                    "UPDATE jobs SET status = ?, updated = ?, error = COALESCE(error, ?) "
+                    "WHERE status = ? AND updated < ? AND attempts >= ?",
+                    (FAILED, now, "аренда истекла, попытки исчерпаны", RUNNING, expired, self.max_attempts),
+                )
+                row = self._db.execute(
+                    "SELECT update_id, payload FROM jobs "
+                    "WHERE status = ? OR (status = ? AND updated < ? AND attempts < ?) ORDER BY created LIMIT 1",
+                    (QUEUED, RUNNING, expired, self.max_attempts),
+                ).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE jobs SET status = ?, attempts = attempts + 1, updated = ? WHERE update_id = ?",
+                        (RUNNING, now, row[0]),
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return row
+
+    def complete(self, update_id: int):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, updated = ?, payload = '' WHERE update_id = ?",
+                (DONE, time.time(), update_id),
+            )
+
+    def fail(self, update_id: int, error: str):
+        """Ошибка обработки: задание возвращается в очередь, пока не исчерпаны попытки."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts < ? THEN ? ELSE ? END, updated = ?, error = ? "
+                "WHERE update_id = ?",
+                (self.max_attempts, QUEUED, FAILED, time.time(), error, update_id),
+            )
+
+    def purge(self):
+        """Удаление завершённых записей старше retention."""
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated < ?",
+                (DONE, FAILED, time.time() - self.retention),
+            )
+
+    def stats(self) -> dict:
+        """Число заданий по статусам."""
+        with self._lock:
+            return dict(self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def close(self):
+        with self._lock:
+            self._db.close()
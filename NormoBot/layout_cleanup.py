@@ -0,0 +1,131 @@
+# Очистка извлечённого текста перед анализом: колонтитулы, основная надпись и номера страниц,
+# повторяющиеся на каждой странице, переносы слов и лишние пробелы только увеличивают промпт.
+# Страницы PDF разделены символом перевода страницы (\f, см. pdf_extract.py).
+import re
+import sys
+from collections import Counter
+from typing import NamedTuple
+
+PAGE_BREAK = "\f"
+
+# Строк от верхнего и нижнего края страницы, среди которых ищутся колонтитулы и штамп
+EDGE_LINES = 6
+# Строка у края считается повторяющейся, если встречается не меньше чем на этой доле страниц
+REPEAT_RATIO = 0.5
+# и не меньше чем на стольких страницах
+MIN_REPEAT_PAGES = 3
+
+_DIGITS_RE = re.compile(r"\d+")
+# Номер страницы отдельной строкой («3», «- 3 -») и внутри строки («Лист 3», «стр. 3», «3 из 10»)
+_PAGE_NUMBER_LINE_RE = re.compile(r"[\s\-–—.]*\d+[\s\-–—.]*")
+_PAGE_NUMBER_RE = re.compile(r"\b(?:лист|листов|стр\.?|страница|с\.)\s*\d+|\b\d+\s*(?:из|/)\s*\d+\b", re.IGNORECASE)
+_SPACES_RE = re.compile(r"[ \t\u00a0]+")
+_HYPHEN_RE = re.compile(r"(\w)[-\u00ad]\n[ \t]*(?=[а-яёa-z])")
+_LEADER_RE = re.compile(r"(?:\.[ \t]?){4,}|…{2,}")
+_RULE_RE = re.compile(r"([_=\-])\1{3,}")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+
+class Cleanup(NamedTuple):
+    text: str
+    removed_lines: int  # строк колонтитулов, штампа и номеров страниц
+    joined_hyphens: int
+
+
+def _line_key(line: str) -> str:
+    """
+    Строка без различий в пробелах и номере страницы: маскируются только номера страниц
+    («3», «Лист 3», «3 из 10»), остальной текст, в том числе другие числа, должен совпадать точно.
+    """
+    line = _SPACES_RE.sub(" ", line).strip()
+    if _PAGE_NUMBER_LINE_RE.fullmatch(line):
+        return "#"
+    return _PAGE_NUMBER_RE.sub(lambda match: _DIGITS_RE.sub("#", match.group()), line)
+
+
+def _edges(lines: list[str]) -> list[tuple[int, str]]:
+    """
+    Номера и зоны (top/bottom) непустых строк у краёв страницы. На короткой странице
+    (не больше 2 * EDGE_LINES строк) зоны уменьшаются до четверти строк, чтобы
+    к краям не отнести всю страницу.
+    """
+    filled = [i for i, line in enumerate(lines) if line.strip()]
+    edge = EDGE_LINES if len(filled) > 2 * EDGE_LINES else len(filled) // 4
+    top = filled[:edge]
+    bottom = [i for i in filled[len(filled) - edge:] if i not in top]
+    return [(i, "top") for i in top] + [(i, "bottom") for i in bottom]
+
+
+def strip_repeated_lines(pages: list[str]) -> tuple[list[str], int]:
+    """
+    Удаление строк, которые повторяются у одного края (сверху или снизу) на многих страницах:
+    индекс частот строится по паре (зона, строка с цифрами, заменёнными на #).
+    """
+    if len(pages) < MIN_REPEAT_PAGES:
+        return pages, 0
+    page_lines = [page.split("\n") for page in pages]
+    frequency = Counter()
+    for lines in page_lines:
+        frequency.update({(zone, _line_key(lines[i])) for i, zone in _edges(lines)})
+    threshold = max(MIN_REPEAT_PAGES, REPEAT_RATIO * len(pages))
+    repeated = {key for key, count in frequency.items() if count >= threshold}
+    if not repeated:
+        return pages, 0
+
+    removed = 0
+    result = []
+    for lines in page_lines:
+        drop = {i for i, zone in _edges(lines) if (zone, _line_key(lines[i])) in repeated}
+        removed += len(drop)
+        result.append("\n".join(line for i, line in enumerate(lines) if i not in drop))
+    return result, removed
+
+
+def clean_layout(text: str) -> Cleanup:
+    """
+    Очистка текста документа: повторяющиеся на страницах строки, переносы слов
+    («специфи-\\nкация» -> «спецификация»), отточия оглавления, линии из «_» и «-»,
+    лишние пробелы и пустые строки. Разбиение на строки сохраняется: по нему
+    определяются заголовки разделов.
+    """
+    pages, removed = strip_repeated_lines(text.replace("\r\n", "\n").replace("\r", "\n").split(PAGE_BREAK))
+    text, joined = _HYPHEN_RE.subn(r"\1", "\n".join(pages))
+    text = text.replace("\u00ad", "")
+    text = _LEADER_RE.sub(" ", text)
+    text = _RULE_RE.sub(r"\1\1\1", text)
+    text = "\n".join(_SPACES_RE.sub(" ", line).strip() for line in text.split("\n"))
+    text = _BLANK_LINES_RE.sub("\n\n", text).strip()
+    return Cleanup(text, removed, joined)
+
+
+def main(paths: list[str]):
+    """Размер текста документов до и после очистки: python layout_cleanup.py файл [...]"""
+    import asyncio
+
+    from extractors import HEAD_SIZE, detect_format
+    from pdf_extract import extract_pdf_text
+    from prompts import count_tokens
+
+    for path in paths:
+        with open(path, "rb") as f:
+            extractor = detect_format(f.read(HEAD_SIZE), None, path)
+            f.seek(0)
+            if extractor is None:
+                print(f"{path}: неподдерживаемый формат")
+                continue
+            if extractor.extract is None:
+                text, pages = asyncio.run(extract_pdf_text(path))
+            else:
+                text, pages = extractor.extract(f, sys.maxsize)
+        result = clean_layout(text)
+        before, after = len(text), len(result.text)
+        tokens_before, tokens_after = count_tokens(text), count_tokens(result.text)
+        print(
+            f"{path}: {pages} стр., символов {before} -> {after} (-{100 * (before - after) / max(before, 1):.1f}%), "
+            f"токенов {tokens_before} -> {tokens_after} (-{100 * (tokens_before - tokens_after) / max(tokens_before, 1):.1f}%), "
+            f"удалено строк {result.removed_lines}, склеено переносов {result.joined_hyphens}"
+        )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
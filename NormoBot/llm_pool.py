@@ -0,0 +1,223 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from contextlib import nullcontext
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Меньше замеров — задержка хеджирования по p95 не оценивается
+MIN_LATENCY_SAMPLES = 10
+
+
+class NoRouteAvailable(Exception):
+    """Все маршруты LLM отключены размыкателями."""
+
+
+def g4f_create(**kwargs):
+    """Запрос через g4f; модуль импортируется при первом обращении."""
+    import g4f
+    return g4f.ChatCompletion.create(**kwargs)
+
+
+class CircuitBreaker:
+    """
+    Размыкатель маршрута: после failure_threshold ошибок подряд маршрут не используется
+    reset_timeout секунд, затем пропускается один пробный запрос. Успех пробного
+    запроса восстанавливает маршрут, ошибка снова отключает его.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 60):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        """Можно ли отправить запрос; в полуоткрытом состоянии — только один пробный."""
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self.state = HALF_OPEN
+            self._probing = False
+        if self.state == HALF_OPEN:
+            if self._probing:
+                return False
+            self._probing = True
+        return True
+
+    def release(self):
+        """Запрос отменён без результата: пробный запрос можно отправить снова."""
+        self._probing = False
+
+    def record_success(self):
+        self.state = CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self) -> bool:
+        """Учёт ошибки. True, если маршрут только что отключён."""
+        self.failures += 1
+        self._probing = False
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+            self.state = OPEN
+            self._opened_at = time.monotonic()
+            return True
+        return False
+
+
+class Route:
+    """
+    Модель у конкретного провайдера g4f (provider=None — выбор провайдера g4f)
+    с размыкателем и скользящим окном длительностей успешных запросов.
+    backend заменяется заглушкой с сигнатурой g4f.ChatCompletion.create.
+    """
+
+    def __init__(self, model: str, provider: str | None = None, failure_threshold: int = 3,
+                 reset_timeout: float = 60, window: int = 100, backend=g4f_create):
+        self.model = model
+        self.provider = provider
+        self.name = f"{provider}/{model}" if provider else model
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.backend = backend
+        self._latencies = deque(maxlen=window)
+
+    def create(self, messages: list[dict], stream: bool = False):
+        """Синхронный вызов backend: строка или словарь ответа, при stream=True — генератор фрагментов."""
+        kwargs = {"model": self.model, "messages": messages}
+        if stream:
+            kwargs["stream"] = True
+        if self.provider:
+            kwargs["provider"] = self.provider
+        return self.backend(**kwargs)
+
+    def record_latency(self, seconds: float):
+        self._latencies.append(seconds)
+
+    def p95(self) -> float | None:
+        if len(self._latencies) < MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+class LLMPool:
+    """
+    Пул маршрутов LLM в порядке приоритета. Каждая попытка идёт первым маршрутом
+    с замкнутым размыкателем, ещё не опробованным в этом запросе. Между попытками
+    выдерживается экспоненциальная пауза со случайным разбросом (full jitter).
+    Если все маршруты отключены, запрос сразу завершается ошибкой NoRouteAvailable.
+
+    При hedge=True, если маршрут не ответил за своё p95 (но не раньше hedge_min_delay),
+    тот же запрос отправляется следующему маршруту и берётся первый успешный ответ.
+    """
+
+    def __init__(self, routes: list[Route], attempts: int = 4, timeout: float | None = 120,
+                 backoff_base: float = 1, backoff_max: float = 30,
+                 hedge: bool = False, hedge_min_delay: float = 1, metrics=None):
+        if not routes:
+            raise ValueError("Нужен хотя бы один маршрут LLM")
+        self.routes = routes
+        self.attempts = attempts
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.metrics = metrics
+
+    def _pick(self, exclude=()) -> Route | None:
+        """Первый доступный маршрут; опробованные в этом запросе — только если других нет."""
+        for candidates in ([route for route in self.routes if route not in exclude], self.routes):
+            for route in candidates:
+                if route.breaker.allow():
+                    return route
+        return None
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def health(self) -> dict:
+        """Состояние маршрутов для журнала: размыкатель, ошибки подряд и p95 в секундах."""
+        return {
+            route.name: {"state": route.breaker.state, "failures": route.breaker.failures, "p95": route.p95()}
+            for route in self.routes
+        }
+
+    async def _attempt(self, route: Route, call, labels: dict):
+        started = time.perf_counter()
+        timer = nullcontext() if self.metrics is None else self.metrics.timer("llm_attempt", route=route.name, **labels)
+        try:
+            with timer:
+                async with asyncio.timeout(self.timeout):
+                    result = await call(route)
+        except asyncio.CancelledError:
+            route.breaker.release()
+            raise
+        except Exception:
+            if route.breaker.record_failure():
+                logger.warning(f"Маршрут LLM {route.name} отключён на {route.breaker.reset_timeout} с")
+            raise
+        route.breaker.record_success()
+        route.record_latency(time.perf_counter() - started)
+        return result
+
+    async def _hedged(self, route: Route, call, tried: set, labels: dict):
+        first = asyncio.ensure_future(self._attempt(route, call, labels))
+        tasks = {first}
+        try:
+            p95 = route.p95()
+            if p95 is not None:
+                done, _ = await asyncio.wait(tasks, timeout=max(p95, self.hedge_min_delay))
+                backup = None if done else self._pick(exclude=tried)
+                if backup is not None and backup is not route:
+                    tried.add(backup)
+                    logger.info(f"Маршрут {route.name} не ответил за p95, запрос продублирован в {backup.name}")
+                    if self.metrics is not None:
+                        self.metrics.inc("normobot_llm_hedges_total", route=backup.name)
+                    tasks.add(asyncio.ensure_future(self._attempt(backup, call, labels)))
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Отменяется ожидание проигравшего запроса; поток с вызовом g4f завершится сам
+            for task in tasks:
+                task.cancel()
+
+    async def run(self, call, hedge: bool = True, **labels):
+        """
+        Выполнение call(route) -> ответ с переключением маршрутов и повторами.
+        hedge=False отключает дублирование (например, для потокового ответа).
+        labels добавляются к метке route в гистограмме этапа llm_attempt.
+        """
+        tried = set()
+        error = None
+        for attempt in range(self.attempts):
+            route = self._pick(exclude=tried)
+            if route is None:
+                raise NoRouteAvailable("Все маршруты LLM временно отключены") from error
+            tried.add(route)
+            try:
+                if hedge and self.hedge and len(self.routes) > 1:
+                    return await self._hedged(route, call, tried, labels)
+                return await self._attempt(route, call, labels)
+            except Exception as e:
+                error = e
+                logger.warning(f"Ошибка LLM ({route.name}, попытка {attempt + 1}/{self.attempts}): {e!r}")
+                if attempt + 1 < self.attempts:
+                    if self.metrics is not None:
+                        self.metrics.inc("normobot_llm_retries_total", route=route.name)
+                    await asyncio.sleep(self.backoff(attempt))
+        raise error
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм: длительности в секундах, размеры в байтах/символах и токены
+SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+SIZE_BUCKETS = (1_000, 10_000, 30_000, 100_000, 300_000, 1_000_000, 3_000_000, 10_000_000)
+TOKEN_BUCKETS = (250, 500, 1_000, 2_000, 4_000, 8_000, 16_000, 32_000, 64_000, 128_000)
+
+
+def _snapshot_key(name: str, labels: tuple) -> str:
+    return name + ("{" + ",".join(f"{k}={v}" for k, v in labels) + "}" if labels else "")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(labels: tuple, extra: tuple = ()) -> str:
+    items = [*labels, *extra]
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in items) + "}"
+
+
+class Histogram:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последняя корзина — +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """
+    Счётчики и гистограммы с метками в памяти процесса. Вывод в текстовом
+    формате Prometheus (render) или словарём для журнала (snapshot).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}  # (имя, метки) -> значение
+        self._histograms = {}  # (имя, метки) -> Histogram
+        self._buckets = {}  # имя -> границы корзин
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, buckets: tuple = SECONDS_BUCKETS, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self._buckets.setdefault(name, buckets))
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, stage: str, **labels):
+        """
+        Длительность этапа в гистограмме normobot_stage_seconds с меткой stage
+        и исходом outcome: ok, timeout, cancelled или error.
+        """
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            yield
+        except TimeoutError:
+            outcome = "timeout"
+            raise
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        except BaseException:
+            outcome = "error"
+            raise
+        finally:
+            self.observe("normobot_stage_seconds", time.perf_counter() - started, stage=stage, outcome=outcome, **labels)
+
+    def snapshot(self, reset: bool = False) -> dict:
+        """
+        Значения для структурированного журнала: «имя{метка=значение,...}» -> число
+        для счётчиков и {"count", "sum"} для гистограмм. reset=True обнуляет метрики.
+        """
+        with self._lock:
+            result = {}
+            for (name, labels), value in self._counters.items():
+                result[_snapshot_key(name, labels)] = value
+            for (name, labels), histogram in self._histograms.items():
+                result[_snapshot_key(name, labels)] = {
+                    "count": histogram.count, "sum": round(histogram.sum, 6),
+                }
+            if reset:
+                self._counters.clear()
+                self._histograms.clear()
+        return result
+
+    def render(self) -> str:
+        """Текстовый формат экспозиции Prometheus (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self._counters}):
+                lines.append(f"# TYPE {name} counter")
+                for (key_name, labels), value in sorted(self._counters.items()):
+                    if key_name == name:
+                        lines.append(f"{name}{_label_text(labels)} {value}")
+            for name in sorted({name for name, _ in self._histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (key_name, labels), histogram in sorted(self._histograms.items(), key=lambda item: item[0]):
+                    if key_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip((*histogram.buckets, "+Inf"), histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_label_text(labels, (('le', bound),))} {cumulative}")
+                    lines.append(f"{name}_sum{_label_text(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{_label_text(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+async def serve_metrics(metrics: Metrics, host: str, port: int) -> asyncio.Server:
+    """HTTP-сервер, отдающий метрики в формате Prometheus на любой GET-запрос."""
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            # Запрос не разбирается: дочитываем заголовки и отвечаем
+            while await reader.readline() not in (b"\r\n", b"\n", b""):
+                pass
+            body = metrics.render().encode("utf-8")
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                + f"Content-Length: {len(body)}\r\n".encode("ascii")
+                + b"Connection: close\r\n\r\n"
+                + body
+            )
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            logger.debug(f"Запрос метрик прерван: {e}")
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,223 @@
+"""
+Проверка каталога документов без Telegram (CI, ночные прогоны по архиву ТЗ).
+Используется тот же конвейер, что и в боте: NormalControllerBot.extract_text_from_file ->
+analyze_tz -> create_pdf, с кэшем результатов, пулом процессов извлечения и пулом маршрутов LLM.
+
+Результаты пишутся построчно в JSONL (--output): путь, размер, статус, замечания и время этапов.
+Тот же файл служит манифестом: при повторном запуске файлы, уже проверенные без ошибок
+и с теми же размером и временем изменения, пропускаются, поэтому прерванный прогон продолжается
+с места остановки. Документы проверяются одновременно (--workers) фиксированным числом
+обработчиков из общей очереди, так что память не растёт с числом файлов.
+
+    python normo_cli.py каталог "архив/**/*.pdf" [--output results.jsonl] [--pdf-dir отчёты]
+                        [--workers 8] [--recursive] [--set ключ=значение ...]
+
+Вне Windows для PDF-отчётов укажите шрифты: --set pdf_font_path=times.ttf --set pdf_font_bold_path=timesbd.ttf.
+Код выхода 1, если хотя бы один документ не проверен.
+"""
+import argparse
+import ast
+import asyncio
+import glob
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+
+import NormoBot
+from extractors import EXTRACTORS
+
+logger = logging.getLogger("normo_cli")
+
+SUPPORTED_EXTENSIONS = {extension for extractor in EXTRACTORS for extension in extractor.extensions}
+
+
+def collect_files(patterns: list[str], recursive: bool) -> list[str]:
+    """
+    Файлы для проверки: каталоги просматриваются по расширениям extractors.py
+    (с --recursive — вместе с подкаталогами), остальные аргументы — пути или шаблоны glob.
+    """
+    files = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            candidates = Path(pattern).rglob("*") if recursive else Path(pattern).iterdir()
+            files.update(str(path) for path in candidates
+                         if path.is_file() and path.suffix.lower() in SUPPORTED_EXTENSIONS)
+        else:
+            files.update(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+    return sorted(os.path.abspath(path) for path in files)
+
+
+def file_identity(path: str) -> dict:
+    stat = os.stat(path)
+    return {"path": path, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def load_manifest(output: str) -> dict[str, tuple[int, int]]:
+    """
+    Проверенные без ошибок файлы из прежних прогонов: путь -> (размер, время изменения).
+    Действует последняя запись по файлу; недописанная строка (прогон прерван) пропускается.
+    """
+    done = {}
+    if not os.path.exists(output):
+        return done
+    with open(output, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("status") == "ok":
+                done[record["path"]] = (record["size"], record["mtime_ns"])
+            else:
+                done.pop(record.get("path"), None)
+    return done
+
+
+def pdf_path(pdf_dir: str, path: str) -> str:
+    """Имя отчёта: имя документа и короткий хэш полного пути (одинаковые имена из разных каталогов)."""
+    digest = hashlib.sha256(path.encode()).hexdigest()[:8]
+    return os.path.join(pdf_dir, f"{Path(path).stem}_{digest}.pdf")
+
+
+class Runner:
+    def __init__(self, bot: NormoBot.NormalControllerBot, output, pdf_dir: str | None):
+        self.bot = bot
+        self.output = output
+        self.pdf_dir = pdf_dir
+        self.ok = 0
+        self.errors = 0
+
+    async def check(self, identity: dict) -> dict:
+        """Проверка одного документа; ошибка записывается в результат и не прерывает прогон."""
+        path = identity["path"]
+        record = dict(identity, status="ok", chars=0, rule_findings=[], findings=[], timings={})
+        timings = record["timings"]
+        started = time.perf_counter()
+        try:
+            text = await self.bot.extract_text_from_file(path, "")
+            timings["extract"] = round(time.perf_counter() - started, 3)
+            record["chars"] = len(text)
+            if not text.strip():
+                raise ValueError("текст не извлечён")
+
+            stage = time.perf_counter()
+            result = await self.bot.check_text(text)
+            timings["analyze"] = round(time.perf_counter() - stage, 3)
+            record["rule_findings"] = [finding._asdict() for finding in result.rule_findings]
+            if result.llm_failed:
+                raise RuntimeError(result.report)
+            record["findings"] = [finding._asdict() for finding in result.findings]
+
+            if self.pdf_dir is not None:
+                stage = time.perf_counter()
+                pdf = await asyncio.to_thread(self.bot.create_pdf, result.report or "Замечаний не выявлено.")
+                record["pdf"] = pdf_path(self.pdf_dir, path)
+                with open(record["pdf"], "wb") as f:
+                    f.write(pdf)
+                timings["pdf"] = round(time.perf_counter() - stage, 3)
+        except Exception as e:
+            logger.warning(f"{path}: документ не проверен: {e}")
+            record.update(status="error", error=str(e) or type(e).__name__)
+        timings["total"] = round(time.perf_counter() - started, 3)
+        return record
+
+    def write(self, record: dict):
+        """Запись результата сразу на диск: прерванный прогон не теряет проверенные документы."""
+        self.output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.output.flush()
+        if record["status"] == "ok":
+            self.ok += 1
+        else:
+            self.errors += 1
+
+    async def worker(self, queue: asyncio.Queue, total: int):
+        while True:
+            identity = await queue.get()
+            try:
+                record = await self.check(identity)
+                self.write(record)
+                logger.info(
+                    f"[{self.ok + self.errors}/{total}] {identity['path']}: {record['status']}, "
+                    f"замечаний {len(record['rule_findings']) + len(record['findings'])}, "
+                    f"{record['timings']['total']:.1f} с"
+                )
+            finally:
+                queue.task_done()
+
+    async def run(self, files: list[dict], workers: int):
+        queue = asyncio.Queue()
+        for identity in files:
+            queue.put_nowait(identity)
+        tasks = [asyncio.create_task(self.worker(queue, len(files))) for _ in range(min(workers, len(files)))]
+        try:
+            await queue.join()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def parse_setting(value: str) -> tuple[str, object]:
+    key, _, raw = value.partition("=")
+    if key not in NormoBot.CONFIG:
+        raise argparse.ArgumentTypeError(f"нет такого ключа CONFIG: {key}")
+    try:
+        return key, ast.literal_eval(raw)
+    except (ValueError, SyntaxError):
+        return key, raw
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Нормоконтроль ТЗ в каталоге без Telegram")
+    parser.add_argument("paths", nargs="+", help="каталоги, файлы или шаблоны glob (** — с подкаталогами)")
+    parser.add_argument("--output", default="normobot_results.jsonl", help="JSONL с результатами и манифест прогона")
+    parser.add_argument("--pdf-dir", help="каталог для PDF-отчётов по каждому документу")
+    parser.add_argument("--workers", type=int, default=NormoBot.CONFIG["max_concurrent_analyses"],
+                        help="документов, проверяемых одновременно")
+    parser.add_argument("--recursive", action="store_true", help="просматривать подкаталоги")
+    parser.add_argument("--force", action="store_true", help="проверить заново и уже проверенные файлы")
+    parser.add_argument("--set", type=parse_setting, action="append", default=[], metavar="КЛЮЧ=ЗНАЧЕНИЕ",
+                        help="переопределение CONFIG, например --set rules_only=True")
+    parser.add_argument("--log-level", default="INFO")
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(args.log_level)
+    NormoBot.CONFIG.update(args.set)
+    if args.pdf_dir is not None:
+        os.makedirs(args.pdf_dir, exist_ok=True)
+
+    done = {} if args.force else load_manifest(args.output)
+    files = []
+    skipped = 0
+    for path in collect_files(args.paths, args.recursive):
+        identity = file_identity(path)
+        if done.get(path) == (identity["size"], identity["mtime_ns"]):
+            skipped += 1
+        else:
+            files.append(identity)
+    logger.info(f"Документов к проверке: {len(files)}, пропущено уже проверенных: {skipped}")
+
+    bot = NormoBot.NormalControllerBot(None)
+    started = time.perf_counter()
+    try:
+        with open(args.output, "a", encoding="utf-8") as output:
+            runner = Runner(bot, output, args.pdf_dir)
+            if files:
+                asyncio.run(runner.run(files, max(args.workers, 1)))
+    finally:
+        bot.close()
+    elapsed = time.perf_counter() - started
+    print(
+        f"Проверено: {runner.ok}, ошибок: {runner.errors}, пропущено: {skipped}, "
+        f"время: {elapsed:.1f} с, документов в секунду: {(runner.ok + runner.errors) / max(elapsed, 1e-9):.2f}",
+        file=sys.stderr,
+    )
+    return 1 if runner.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""
+Сборка архива для облачной функции (NormoBot_forYa.zip): NormoBot_forYa.py, все локальные модули,
+которые он импортирует (с их зависимостями), файлы данных, шрифты и requirements.txt.
+
+    python pack_serverless.py [--output NormoBot_forYa.zip]
+
+Модули находятся по import в исходниках, поэтому новый модуль попадает в архив без правки скрипта;
+новый файл данных нужно добавить в DATA_FILES.
+"""
+import argparse
+import ast
+import os
+import sys
+import zipfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ENTRY_POINT = "NormoBot_forYa.py"
+DATA_FILES = [
+    "requirements.txt",
+    "prompt_template.txt",
+    "standards.tsv",
+    "times.ttf",
+    "timesbd.ttf",
+    "timesbi.ttf",
+    "timesi.ttf",
+]
+
+
+def local_imports(path: str) -> set[str]:
+    """Имена модулей каталога бота, импортируемых файлом (включая импорты внутри функций)."""
+    with open(path, encoding="utf-8-sig") as f:
+        tree = ast.parse(f.read(), path)
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.add(node.module.split(".")[0])
+    return {name for name in names if os.path.isfile(os.path.join(HERE, f"{name}.py"))}
+
+
+def runtime_modules(entry_point: str = ENTRY_POINT) -> list[str]:
+    """Файлы .py, нужные точке входа: сама точка входа и транзитивно импортируемые локальные модули."""
+    files = {entry_point}
+    pending = [entry_point]
+    while pending:
+        for name in local_imports(os.path.join(HERE, pending.pop())):
+            module = f"{name}.py"
+            if module not in files:
+                files.add(module)
+                pending.append(module)
+    return sorted(files)
+
+
+def build(output: str) -> list[str]:
+    names = runtime_modules() + DATA_FILES
+    missing = [name for name in names if not os.path.isfile(os.path.join(HERE, name))]
+    if missing:
+        raise FileNotFoundError(f"нет файлов для архива: {', '.join(missing)}")
+    with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name in names:
+            archive.write(os.path.join(HERE, name), name)
+    return names
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Сборка архива облачной функции NormoBot_forYa")
+    parser.add_argument("--output", default=os.path.join(HERE, "NormoBot_forYa.zip"))
+    args = parser.parse_args(argv)
+    names = build(args.output)
+    print(f"{args.output}: {len(names)} файлов", file=sys.stderr)
+    for name in names:
+        print(f"  {name}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+import asyncio
+import contextlib
+import logging
+import math
+import os
+import shutil
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+
+def terminate_pool(executor):
+    """
+    Немедленная остановка пула процессов: задачи из очереди снимаются, рабочие процессы
+    завершаются, не дожидаясь текущих диапазонов. После этого пул не используется.
+    """
+    processes = list((getattr(executor, "_processes", None) or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    for process in processes:
+        process.join(timeout=5)
+
+
+@contextlib.asynccontextmanager
+async def pdf_path(stream, directory: str | None = None):
+    """
+    Путь к PDF на диске для рабочих процессов: им передаётся путь, а не содержимое файла,
+    иначе каждый диапазон страниц копировал бы весь документ через pickle. Файл потока
+    используется как есть, иначе поток один раз копируется во временный файл.
+    """
+    name = getattr(stream, "name", None)
+    if isinstance(name, str) and os.path.isfile(name):
+        yield name
+        return
+    path = await asyncio.to_thread(_spool, stream, directory)
+    try:
+        yield path
+    finally:
+        os.remove(path)
+
+
+def _spool(stream, directory: str | None) -> str:
+    with tempfile.NamedTemporaryFile(suffix=".pdf", dir=directory, delete=False) as f:
+        shutil.copyfileobj(stream, f)
+    return f.name
+
+
+def count_pages(path: str) -> int:
+    """Число страниц PDF."""
+    import PyPDF2
+    with open(path, "rb") as f:
+        return len(PyPDF2.PdfReader(f).pages)
+
+
+def extract_page_range(path: str, start: int, stop: int) -> list[str]:
+    """Текст страниц [start, stop). Выполняется в рабочем процессе, страницы читаются из файла по мере надобности."""
+    import PyPDF2
+    with open(path, "rb") as f:
+        reader = PyPDF2.PdfReader(f)
+        return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def page_ranges(page_count: int, workers: int, min_pages: int) -> list[tuple[int, int]]:
+    """Разбиение страниц на диапазоны: не больше одного на рабочий процесс и не меньше min_pages страниц."""
+    size = max(min_pages, math.ceil(page_count / max(workers, 1)))
+    return [(start, min(start + size, page_count)) for start in range(0, page_count, size)]
+
+
+async def extract_pdf_text(path: str, executor=None, workers: int = 1, min_pages: int = 20,
+                           max_pages: int | None = None, timeout: float | None = None) -> tuple[str, int]:
+    """
+    Извлечение текста PDF вне цикла событий: диапазоны страниц обрабатываются
+    параллельно в executor и склеиваются в исходном порядке.
+    Возвращает текст и полное число страниц документа.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        async with asyncio.timeout(timeout):
+            page_count = await loop.run_in_executor(executor, count_pages, path)
+            pages = page_count
+            if max_pages is not None and page_count > max_pages:
+                logger.warning(f"PDF содержит {page_count} стр., обрабатываются первые {max_pages}")
+                pages = max_pages
+            futures = [
+                loop.run_in_executor(executor, extract_page_range, path, start, stop)
+                for start, stop in page_ranges(pages, workers, min_pages)
+            ]
+            results = await asyncio.gather(*futures)
+    except TimeoutError:
+        # Отмена gather снимает с очереди ещё не начатые диапазоны; уже запущенные занимают рабочие
+        # процессы, пока вызывающий не остановит пул (terminate_pool)
+        logger.error(f"Превышено время извлечения текста из PDF ({timeout} с)")
+        raise
+    # Страницы разделяются символом перевода страницы: по нему layout_cleanup находит колонтитулы
+    return "\f".join(text for chunk in results for text in chunk), page_count
@@ -0,0 +1,166 @@
+import os
+from functools import lru_cache
+from typing import Iterator
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+FONT_NAME = "TimesNewRoman"
+FONT_BOLD_NAME = "TimesNewRoman-Bold"
+FONT_SIZE = 12
+MARGIN = 40
+LINE_HEIGHT = 15
+TABLE_FONT_SIZE = 10
+TABLE_LINE_HEIGHT = 12
+CELL_PADDING = 3
+
+# Ширины слов по шрифту и кеглю; ограничение на случай очень разнообразных текстов
+_WIDTH_TABLE_LIMIT = 100_000
+_width_tables = {}
+
+
+@lru_cache(maxsize=None)
+def register_fonts(font_path: str, font_bold_path: str):
+    """
+    Регистрация шрифтов Times New Roman один раз на процесс: разбор TTF-файлов дорогой,
+    а зарегистрированные шрифты ReportLab хранит глобально.
+    """
+    for path in (font_path, font_bold_path):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Шрифт Times New Roman не найден: {path}")
+    pdfmetrics.registerFont(TTFont(FONT_NAME, font_path))
+    pdfmetrics.registerFont(TTFont(FONT_BOLD_NAME, font_bold_path))
+
+
+def _width_table(font_name: str, font_size: float) -> dict:
+    table = _width_tables.setdefault((font_name, font_size), {})
+    if len(table) > _WIDTH_TABLE_LIMIT:
+        table.clear()
+    return table
+
+
+def word_width(word: str, table: dict, font_name: str, font_size: float) -> float:
+    """Ширина слова; каждое слово измеряется один раз."""
+    width = table.get(word)
+    if width is None:
+        width = table[word] = pdfmetrics.stringWidth(word, font_name, font_size)
+    return width
+
+
+def wrap_text(text: str, max_width: float, font_name: str = FONT_NAME, font_size: float = FONT_SIZE) -> Iterator[str]:
+    """
+    Разбиение текста на строки не шире max_width. Ширина строки накапливается
+    по ширинам слов, поэтому время линейно по длине текста.
+    Слово шире max_width выводится отдельной строкой целиком.
+    Отступы и повторные пробелы (выравнивание блоков «Было/Замечание/Должно быть»)
+    сохраняются: пустые слова между пробелами имеют нулевую ширину. Пробелы в конце строки
+    и в месте переноса отбрасываются, чтобы продолжение строки не начиналось с пробела.
+    """
+    table = _width_table(font_name, font_size)
+    space = word_width(" ", table, font_name, font_size)
+    for raw_line in text.split("\n"):
+        current = []
+        current_width = 0.0
+        wrapped = False
+        for word in raw_line.split(" "):
+            if not word and wrapped and not current:
+                continue
+            width = word_width(word, table, font_name, font_size) if word else 0.0
+            if current and current_width + space + width > max_width:
+                yield " ".join(current).rstrip(" ")
+                wrapped = True
+                current = [word] if word else []
+                current_width = width
+            elif current:
+                current.append(word)
+                current_width += space + width
+            else:
+                current = [word]
+                current_width = width
+        yield " ".join(current).rstrip(" ")
+
+
+def _cell_lines(text: str, max_width: float, font_name: str) -> list[str]:
+    """Строки ячейки таблицы; слово шире столбца (имя файла, обозначение) разбивается по символам."""
+    table = _width_table(font_name, TABLE_FONT_SIZE)
+    lines = []
+    for line in wrap_text(text, max_width, font_name, TABLE_FONT_SIZE):
+        if word_width(line, table, font_name, TABLE_FONT_SIZE) <= max_width:
+            lines.append(line)
+            continue
+        current = ""
+        for char in line:
+            if current and pdfmetrics.stringWidth(current + char, font_name, TABLE_FONT_SIZE) > max_width:
+                lines.append(current)
+                current = ""
+            current += char
+        lines.append(current)
+    return lines
+
+
+def _draw_table(c, rows: list[list[str]], widths: list[float], y: float, page_height: float) -> float:
+    """
+    Таблица с рамками; первая строка — заголовок (полужирный), повторяется на каждой странице.
+    Текст ячеек переносится по ширине столбца. Возвращает координату под таблицей.
+    """
+    header, body = rows[0], rows[1:]
+
+    def layout(row: list[str], font_name: str) -> tuple[list[list[str]], float]:
+        cells = [_cell_lines(str(cell), width - 2 * CELL_PADDING, font_name) for cell, width in zip(row, widths)]
+        return cells, max(map(len, cells)) * TABLE_LINE_HEIGHT + 2 * CELL_PADDING
+
+    def draw(cells: list[list[str]], row_height: float, font_name: str, y: float):
+        c.setFont(font_name, TABLE_FONT_SIZE)
+        x = MARGIN
+        for lines, width in zip(cells, widths):
+            c.rect(x, y - row_height, width, row_height)
+            for i, line in enumerate(lines):
+                c.drawString(x + CELL_PADDING, y - CELL_PADDING - (i + 1) * TABLE_LINE_HEIGHT + 3, line)
+            x += width
+
+    header_cells, header_height = layout(header, FONT_BOLD_NAME)
+    draw(header_cells, header_height, FONT_BOLD_NAME, y)
+    y -= header_height
+    for row in body:
+        cells, row_height = layout(row, FONT_NAME)
+        if y - row_height < MARGIN:
+            c.showPage()
+            y = page_height - MARGIN
+            draw(header_cells, header_height, FONT_BOLD_NAME, y)
+            y -= header_height
+        draw(cells, row_height, FONT_NAME, y)
+        y -= row_height
+    return y
+
+
+def render_pdf(text: str, output, font_path: str, font_bold_path: str,
+               table: list[list[str]] | None = None, column_widths: list[float] | None = None):
+    """
+    Вывод текста в PDF (output — путь или файловый объект) шрифтом Times New Roman с кириллицей.
+    table — строки таблицы перед текстом (первая — заголовок), column_widths — доли ширины
+    столбцов (по умолчанию равные).
+    """
+    register_fonts(font_path, font_bold_path)
+    c = canvas.Canvas(output, pagesize=letter)
+    width, height = letter
+    max_width = width - 2 * MARGIN
+
+    y = height - MARGIN
+    if table:
+        shares = column_widths or [1] * len(table[0])
+        widths = [max_width * share / sum(shares) for share in shares]
+        y = _draw_table(c, table, widths, y, height) - LINE_HEIGHT
+
+    # Здесь можно менять на FONT_BOLD_NAME для заголовков
+    c.setFont(FONT_NAME, FONT_SIZE)
+
+    for line in wrap_text(text, max_width):
+        if y < MARGIN:
+            c.showPage()
+            c.setFont(FONT_NAME, FONT_SIZE)
+            y = height - MARGIN
+        c.drawString(MARGIN, y, line)
+        y -= LINE_HEIGHT
+    c.save()
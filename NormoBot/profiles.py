@@ -0,0 +1,67 @@
+import math
+import re
+from collections import Counter
+from typing import NamedTuple
+
+from rules import normalize
+
+GENERIC = "generic"
+
+# Профиль выбирается, только если его оценка не ниже порога; иначе — общий профиль по ГОСТ 15.016
+MIN_SCORE = 4.0
+
+
+class Profile(NamedTuple):
+    name: str  # префикс блоков профиля в prompt_template.txt
+    title: str
+    subject: str  # предмет разработки в родительном падеже, подставляется в промпт
+    keywords: tuple[str, ...]  # начала слов по нормализованному тексту (нижний регистр, «ё» -> «е»)
+
+
+PROFILES = {profile.name: profile for profile in (
+    Profile(
+        "battery", "Аккумуляторные батареи", "аккумуляторной батареи для электроавтомобиля",
+        ("аккумулятор", "акб", "батаре", "электромобил", "электроавтомобил", "литий", "свинцово-кислот",
+         "электролит", "катод", "анод", "bms", "емкост", "заряд", "разряд", "ампер-час", "а·ч",
+         "элементов питания", "терморегулир", "напряжени"),
+    ),
+    Profile(
+        "electrical", "Электроустановки", "электроустановки (системы электроснабжения)",
+        ("электроустановк", "электроснабжени", "электроприемник", "электропроводк", "пуэ", "щит",
+         "распределительн", "кабел", "заземлени", "зануле", "молниезащит", "трансформатор", "подстанци",
+         "выключател", "узо", "освещени", "замыкани", "реле", "нку", "напряжени"),
+    ),
+    Profile(
+        "software", "Программное обеспечение", "программного обеспечения (автоматизированной системы)",
+        ("программ", "интерфейс", "пользовател", "баз данн", "субд", "алгоритм", "api", "сервер",
+         "клиент", "авторизац", "аутентификац", "веб", "web", "исходн текст", "еспд",
+         "автоматизированн систем", "информационн систем", "гост 34.", "гост 19."),
+    ),
+    Profile(GENERIC, "Общий профиль (ГОСТ 15.016-2016)", "изделия", ()),
+)}
+
+# Вес ключевого слова по аналогии с IDF: слово, общее для нескольких профилей, различает их слабее
+_DOCUMENT_FREQUENCY = Counter(word for profile in PROFILES.values() for word in set(profile.keywords))
+_KEYWORD_PROFILES = sum(1 for profile in PROFILES.values() if profile.keywords)
+_IDF = {word: 1 + math.log(_KEYWORD_PROFILES / count) for word, count in _DOCUMENT_FREQUENCY.items()}
+
+# Один проход по тексту: ключевые слова всех профилей в одном выражении, длинные — первыми
+_KEYWORD_RE = re.compile(r"\b(?:" + "|".join(map(re.escape, sorted(_IDF, key=len, reverse=True))) + ")")
+
+
+def score_profiles(text: str) -> dict[str, float]:
+    """Оценки профилей: сумма (1 + ln tf) * idf по найденным ключевым словам профиля."""
+    frequencies = Counter(_KEYWORD_RE.findall(normalize(text)))
+    return {
+        profile.name: round(sum(
+            (1 + math.log(frequencies[word])) * _IDF[word] for word in profile.keywords if frequencies[word]
+        ), 3)
+        for profile in PROFILES.values() if profile.keywords
+    }
+
+
+def classify(text: str) -> tuple[str, dict[str, float]]:
+    """Профиль предметной области ТЗ и оценки всех профилей (для журнала)."""
+    scores = score_profiles(text)
+    name, score = max(scores.items(), key=lambda item: item[1], default=(GENERIC, 0.0))
+    return (name if score >= MIN_SCORE else GENERIC), scores
@@ -0,0 +1,139 @@
+# Промпт нормоконтроля ТЗ. Текст хранится в prompt_template.txt и загружается один раз
+# при импорте. Постоянные инструкции отправляются системным сообщением, одинаковым для всех
+# ТЗ одного профиля предметной области (провайдеры могут кэшировать такой префикс),
+# в сообщении пользователя — только документ и сведения, которые зависят от него.
+import math
+import os
+import re
+from functools import lru_cache
+
+from chunking import SECTION_TITLES
+from profiles import GENERIC, PROFILES
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompt_template.txt")
+
+_VERSION_RE = re.compile(r"#\s*version:\s*(\S+)")
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def load_template(path: str = TEMPLATE_PATH) -> tuple[str, dict[str, str]]:
+    """Версия и блоки шаблона: «# version: N», комментарии «#» до первого блока, блоки «@@ имя»."""
+    version = None
+    blocks = {}
+    name = None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if name is None:
+                if match := _VERSION_RE.match(line):
+                    version = match.group(1)
+                if not line.startswith("@@ "):
+                    continue
+            if line.startswith("@@ "):
+                name = line[3:].strip()
+                blocks[name] = []
+            else:
+                blocks[name].append(line)
+    if version is None:
+        raise ValueError(f"В шаблоне промпта {path} нет строки версии")
+    return version, {name: "".join(lines).strip("\n") for name, lines in blocks.items()}
+
+
+# Версия шаблона входит в ключ кэша: при изменении текста промпта её нужно увеличить
+PROMPT_VERSION, _BLOCKS = load_template()
+assert all(f"{name}.parameters" in _BLOCKS for name in PROFILES), "У каждого профиля должен быть блок parameters"
+
+_OUTLINE_SYSTEM = _BLOCKS["outline_system"].format(required="\n".join(f"- {title}" for title in SECTION_TITLES))
+
+
+@lru_cache(maxsize=None)
+def system_prompt(profile: str = GENERIC, structure_checked: bool = False, parameters_checked: bool = False) -> str:
+    """
+    Системное сообщение анализа ТЗ для профиля предметной области (profiles.py):
+    общие инструкции и чек-листы только этого профиля, без блоков, которые уже проверены
+    локальными правилами. Каждый вариант собирается один раз.
+    """
+    subject = PROFILES[profile].subject
+    parameters = f"{profile}.parameters"
+    if parameters_checked and f"{profile}.parameters_checked" in _BLOCKS:
+        parameters = f"{profile}.parameters_checked"
+    names = (
+        "head",
+        f"{profile}.standards_list",
+        "sections_checked" if structure_checked else "sections",
+        "content_header",
+        "standards",
+        "content_intro",
+        parameters,
+        f"{profile}.checklist",
+        "footer",
+    )
+    return "\n\n".join(_BLOCKS[name].format(subject=subject) for name in names if name in _BLOCKS)
+
+
+def user_prompt(text: str, standards: list[str] = (), titles: list[str] | None = None) -> str:
+    """
+    Сообщение пользователя: текст ТЗ (или фрагмента с разделами titles) и сведения
+    о стандартах из справочника, которые передаются модели как проверенные факты.
+    """
+    parts = []
+    if titles is not None:
+        parts.append(_BLOCKS["chunk"].format(titles=", ".join(titles)))
+    if standards:
+        parts.append(_BLOCKS["standards_checked"].format(standards="\n".join(f"- {line}" for line in standards)))
+    parts.append(_BLOCKS["document"].format(text=text))
+    return "\n\n".join(parts)
+
+
+def analysis_messages(text: str, profile: str = GENERIC, structure_checked: bool = False,
+                      parameters_checked: bool = False, standards: list[str] = (),
+                      titles: list[str] | None = None) -> list[dict]:
+    """Сообщения запроса анализа ТЗ: постоянное для профиля системное первым, затем документ."""
+    return [
+        {"role": "system", "content": system_prompt(profile, structure_checked, parameters_checked)},
+        {"role": "user", "content": user_prompt(text, standards, titles)},
+    ]
+
+
+def outline_messages(titles: list[str]) -> list[dict]:
+    """Сообщения проверки структуры длинного ТЗ по перечню заголовков разделов."""
+    return [
+        {"role": "system", "content": _OUTLINE_SYSTEM},
+        {"role": "user", "content": _BLOCKS["outline_user"].format(outline="\n".join(titles))},
+    ]
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    """Токенизатор tiktoken, если он установлен; иначе None."""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text: str) -> int:
+    """
+    Число токенов текста: точно при установленном tiktoken, иначе оценка
+    (слово — по токену на каждые 4 символа, знак препинания — отдельный токен).
+    """
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return sum(math.ceil(len(token) / 4) for token in _TOKEN_RE.findall(text))
+
+
+@lru_cache(maxsize=64)
+def _cached_count(text: str) -> int:
+    return count_tokens(text)
+
+
+def message_tokens(messages: list[dict]) -> dict[str, int]:
+    """Токены запроса по ролям; подсчёт для системных сообщений кэшируется."""
+    counts = {}
+    for message in messages:
+        role = message["role"]
+        content = message["content"]
+        tokens = _cached_count(content) if role == "system" else count_tokens(content)
+        counts[role] = counts.get(role, 0) + tokens
+    return counts
@@ -0,0 +1,150 @@
+import re
+from typing import NamedTuple
+
+from chunking import split_sections
+from findings import Finding, finding_key, format_findings
+from tiered_cache import content_key, normalize_text
+
+_WORD_RE = re.compile(r"\w{4,}")
+_NORMALIZE_RE = re.compile(r"[\W_]+")
+_NUMBER_RE = re.compile(r"\w*\d\w*")
+
+# Замечание к изменённому разделу считается прежним, если слова «Было» совпадают не меньше чем на эту долю,
+# а числа и обозначения (слова с цифрами) — полностью
+SAME_FINDING_SIMILARITY = 0.5
+
+
+class Section(NamedTuple):
+    title: str
+    text: str
+    hash: str
+
+
+class Revision(NamedTuple):
+    """План повторной проверки: какие разделы проверять заново и что взять из предыдущей."""
+    sections: list[Section]
+    changed: list[int]  # номера изменённых и новых разделов
+    reused: list[list[Finding]]  # замечания по разделам; у изменённых — пустые
+    previous: list[Finding]  # прежние замечания к изменённым и удалённым разделам
+
+
+class Delta(NamedTuple):
+    resolved: list[Finding]
+    still_open: list[Finding]
+    new: list[Finding]
+
+
+def split_revision_sections(text: str) -> list[Section]:
+    """Разделы ТЗ с хэшем нормализованного текста (пробелы и переносы строк не влияют)."""
+    return [Section(title, body, content_key(normalize_text(body))) for title, body in split_sections(text)]
+
+
+def _normalize(text: str) -> str:
+    return _NORMALIZE_RE.sub(" ", text.lower().replace("ё", "е")).strip()
+
+
+def _words(text: str) -> set[str]:
+    return set(_WORD_RE.findall(_normalize(text)))
+
+
+def attribute_findings(findings: list[Finding], sections: list[Section]) -> list[list[Finding]]:
+    """
+    Распределение замечаний по разделам: замечание относится к разделу, в тексте которого есть
+    цитата «Было», иначе — к разделу, с которым у «Было» больше всего общих слов
+    (при равенстве — у «Было» и «Замечания» вместе).
+    """
+    section_texts = [f" {_normalize(section.text)} " for section in sections]
+    section_words = [set(_WORD_RE.findall(text)) for text in section_texts]
+    result = [[] for _ in sections]
+    for finding in findings:
+        quote = _normalize(finding.was)
+        quote_words = set(_WORD_RE.findall(quote))
+        context = quote_words | _words(finding.remark)
+        best = max(range(len(sections)), key=lambda i: (
+            bool(quote) and f" {quote} " in section_texts[i],
+            len(quote_words & section_words[i]),
+            len(context & section_words[i]),
+        ))
+        result[best].append(finding)
+    return result
+
+
+def history_entry(context: str, sections: list[Section], findings: list[list[Finding]]) -> dict:
+    """Запись истории чата (сериализуется в JSON для TieredCache)."""
+    return {
+        "context": context,
+        "sections": [
+            {"title": section.title, "hash": section.hash, "findings": [list(f) for f in section_findings]}
+            for section, section_findings in zip(sections, findings)
+        ],
+    }
+
+
+def plan_revision(entry: dict | None, context: str, sections: list[Section], min_unchanged: float) -> Revision | None:
+    """
+    План повторной проверки по записи истории. None, если это не новая редакция того же ТЗ:
+    истории нет, она получена с другим промптом, справочником, моделью или профилем (context),
+    либо без изменений осталось меньше min_unchanged разделов.
+    """
+    if not entry or entry.get("context") != context:
+        return None
+    previous = {}
+    for section in entry["sections"]:
+        previous.setdefault(section["hash"], []).append([Finding(*f) for f in section["findings"]])
+
+    changed = []
+    reused = []
+    for i, section in enumerate(sections):
+        # Одинаковые разделы сопоставляются по порядку: каждый прежний используется один раз
+        candidates = previous.get(section.hash)
+        if candidates:
+            reused.append(candidates.pop(0))
+        else:
+            changed.append(i)
+            reused.append([])
+    if len(sections) - len(changed) < min_unchanged * len(sections):
+        return None
+    stale = [finding for groups in previous.values() for group in groups for finding in group]
+    return Revision(sections, changed, reused, stale)
+
+
+def _similar(a: Finding, b: Finding) -> bool:
+    if finding_key(a) == finding_key(b):
+        return True
+    was_a, was_b = _normalize(a.was), _normalize(b.was)
+    if set(_NUMBER_RE.findall(was_a)) != set(_NUMBER_RE.findall(was_b)):
+        return False
+    words_a, words_b = set(_WORD_RE.findall(was_a)), set(_WORD_RE.findall(was_b))
+    if not words_a or not words_b:
+        return False
+    return len(words_a & words_b) / len(words_a | words_b) >= SAME_FINDING_SIMILARITY
+
+
+def compare_findings(previous: list[Finding], current: list[Finding]) -> Delta:
+    """Сравнение прежних и новых замечаний к изменённым разделам."""
+    remaining = list(previous)
+    still_open = []
+    new = []
+    for finding in current:
+        match = next((i for i, old in enumerate(remaining) if _similar(old, finding)), None)
+        if match is None:
+            new.append(finding)
+        else:
+            remaining.pop(match)
+            still_open.append(finding)
+    return Delta(remaining, still_open, new)
+
+
+def format_delta(delta: Delta, changed: int, total: int) -> str:
+    """Отчёт о повторной проверке: исправленные, новые и оставшиеся замечания."""
+    parts = [
+        f"Повторная проверка: изменено разделов — {changed} из {total}. "
+        "Заново проверены только они, замечания к остальным разделам взяты из предыдущей проверки."
+    ]
+    for title, findings in (("Исправлено", delta.resolved), ("Новые замечания", delta.new),
+                            ("Остаются", delta.still_open)):
+        if findings:
+            parts.append(f"{title} ({len(findings)}):\n\n{format_findings(findings)}")
+    if not delta.new and not delta.still_open:
+        parts.append("Открытых замечаний нет.")
+    return "\n\n".join(parts)
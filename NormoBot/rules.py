@@ -0,0 +1,128 @@
+import re
+from typing import NamedTuple
+
+from chunking import SECTION_TITLES
+from findings import Finding
+from standards import CANCELLED, REPLACED, StandardStatus, find_references, get_index
+
+# Шаблоны обязательных разделов (по нормализованному тексту: нижний регистр, «ё» -> «е»).
+# Раздел «Требования к учебно-тренировочным средствам» необязателен и не проверяется.
+_SECTION_PATTERNS = {
+    "Введение": r"введение",
+    "Наименование, основание и сроки разработки": r"основани\w* (?:для )?(?:выполнения )?разработки|наименование,? основание",
+    "Цель разработки, наименование и обозначение изделия": r"цел[иья]\w* разработки|назначение изделия",
+    "Технические требования к изделию": r"технические требования",
+    "Требования к сырью и материалам": r"требования к (?:сырью|материалам|исходным материалам)",
+    "Требования к консервации, упаковке и маркировке": r"требования к (?:консервации|упаковке|маркировке)",
+    "Специальные требования": r"специальные требования|требования (?:к |по )?(?:безопасности|экологи)",
+    "Требования к документации": r"требования к (?:документации|документам|технической документации)",
+    "Этапы выполнения разработки": r"этапы (?:выполнения )?(?:разработки|работ)",
+    "Порядок выполнения и приемки этапов разработки": r"порядок (?:выполнения и )?(?:приемки|сдачи)",
+    "Примечания и дополнительные указания": r"примечани|дополнительные указания",
+}
+assert set(_SECTION_PATTERNS) <= set(SECTION_TITLES)
+
+# Параметры АКБ, которые должны быть указаны: шаблон, описание для «Было», пример для «Должно быть»
+_PARAMETER_RULES = {
+    "voltage": (r"номинальн\w* напряжени", "номинальном напряжении",
+                "Указать номинальное напряжение батареи и элемента, например: «Номинальное напряжение — 400 В (3,6 В на элемент)»"),
+    "capacity": (r"\bемкост", "емкости",
+                 "Указать емкость, например: «Номинальная емкость — 150 А·ч»"),
+    "discharge": (r"ток\w* (?:\w+ )?разряд|разрядн\w* ток", "токе разряда",
+                  "Указать: «Ток разряда — 120 А, максимальный пиковый ток — 150 А»"),
+    "charge": (r"ток\w* (?:\w+ )?заряд|зарядн\w* ток", "токе заряда",
+               "Указать номинальный и максимальный ток заряда, например: «Ток заряда — 50 А, максимальный — 100 А»"),
+    "temperature": (r"(?:рабоч\w*|эксплуатац\w*) (?:\w+ )?температур|температур\w* (?:\w+ )?(?:эксплуатац|работ)|диапазон\w* (?:\w+ )?температур",
+                    "диапазоне рабочих температур",
+                    "Указать диапазон рабочих температур, например: «от минус 30 до плюс 55 °С»"),
+}
+
+# Профиль (profiles.py), для которого проверяются параметры АКБ
+PARAMETER_PROFILE = "battery"
+
+# Один проход по тексту: все шаблоны объединены в одно выражение с именованными группами.
+# Группы обёрнуты в опережающую проверку, чтобы совпадения могли перекрываться
+# («специальные требования к документации» засчитывает оба раздела).
+_INDEX_RE = re.compile("|".join(
+    [f"(?=(?P<s{i}>{pattern}))" for i, pattern in enumerate(_SECTION_PATTERNS.values())]
+    + [f"(?=(?P<p_{name}>{pattern}))" for name, (pattern, _, _) in _PARAMETER_RULES.items()]
+))
+_SECTION_GROUPS = {f"s{i}": title for i, title in enumerate(_SECTION_PATTERNS)}
+
+
+class RuleReport(NamedTuple):
+    """Результат локальной проверки и признаки того, какие блоки промпта уже покрыты."""
+    findings: list[Finding]
+    structure_checked: bool
+    parameters_checked: bool
+    standards: list[StandardStatus]  # ссылки, проверенные по справочнику нормативных документов
+
+
+def normalize(text: str) -> str:
+    return text.lower().replace("ё", "е")
+
+
+def run_rules(text: str, structure_min_chars: int = 1500, profile: str | None = None) -> RuleReport:
+    """
+    Детерминированная проверка ТЗ за один проход: отсутствующие обязательные разделы,
+    ссылки на ГОСТ без года, заменённые и отменённые стандарты (по справочнику standards.tsv)
+    и неуказанные параметры АКБ.
+    Структура проверяется только у документов не короче structure_min_chars, параметры АКБ —
+    только у ТЗ с профилем battery: упоминание батареи в ТЗ на электроустановку их не требует.
+    """
+    normalized = normalize(text)
+    found = {match.lastgroup for match in _INDEX_RE.finditer(normalized)}
+    findings = []
+
+    structure_checked = len(text) >= structure_min_chars
+    if structure_checked:
+        for group, title in _SECTION_GROUPS.items():
+            if group not in found:
+                findings.append(Finding(
+                    f"В документе отсутствует раздел «{title}»",
+                    f"Согласно ГОСТ 15.016-2016, ТЗ должно включать раздел «{title}»",
+                    f"Добавить раздел «{title}»",
+                ))
+
+    index = get_index()
+    standards = []
+    for reference in find_references(text):
+        if reference.year is None:
+            if not reference.is_gost:
+                continue
+            current = index.current_edition(reference)
+            findings.append(Finding(
+                f"Указан {reference.designation}",
+                "Обозначение стандарта приведено без года утверждения, поэтому нельзя однозначно определить применяемую редакцию",
+                f"Указать {current}" if current
+                else f"Указать полное обозначение с годом утверждения, например: «{reference.designation}-<год>»",
+            ))
+            continue
+        status = index.resolve(reference)
+        if status is None:
+            continue
+        standards.append(status)
+        if status.status == REPLACED:
+            findings.append(Finding(
+                f"Указан {status.designation}",
+                f"{status.designation} устарел и заменен {status.successor}. Необходимо использовать актуальную версию стандарта",
+                f"Обновить ссылку на {status.successor}",
+            ))
+        elif status.status == CANCELLED:
+            findings.append(Finding(
+                f"Указан {status.designation}",
+                f"{status.designation} отменен без замены",
+                "Исключить ссылку или указать действующий нормативный документ",
+            ))
+
+    parameters_checked = profile == PARAMETER_PROFILE
+    if parameters_checked:
+        for name, (_, description, example) in _PARAMETER_RULES.items():
+            if f"p_{name}" not in found:
+                findings.append(Finding(
+                    f"Отсутствует информация о {description} аккумулятора",
+                    "Параметр обязателен для определения эксплуатационных характеристик АКБ (ГОСТ 15.016-2016, раздел технических требований)",
+                    example,
+                ))
+
+    return RuleReport(findings, structure_checked, parameters_checked, standards)
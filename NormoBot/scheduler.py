@@ -0,0 +1,90 @@
+import asyncio
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Очередь анализов переполнена."""
+
+
+class AnalysisScheduler:
+    """
+    Планировщик анализов: не больше max_concurrent одновременно, не больше
+    одного выполняющегося анализа на чат, остальные ждут в общей FIFO-очереди
+    длиной не больше max_queue.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self._running = 0
+        self._busy_chats = set()
+        self._waiting = deque()  # (chat_id, future)
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiting)
+
+    def _acquire(self, chat_id):
+        self._running += 1
+        self._busy_chats.add(chat_id)
+
+    def _release(self, chat_id):
+        self._running -= 1
+        self._busy_chats.discard(chat_id)
+        self._dispatch()
+
+    def _dispatch(self):
+        """Запуск ожидающих в порядке очереди, пропуская чаты с уже выполняющимся анализом."""
+        for item in list(self._waiting):
+            if self._running >= self.max_concurrent:
+                break
+            chat_id, future = item
+            if chat_id in self._busy_chats:
+                continue
+            self._waiting.remove(item)
+            self._acquire(chat_id)
+            future.set_result(None)
+
+    async def run(self, chat_id, job, on_queued=None, on_admitted=None):
+        """
+        Выполнение job() с учётом лимитов. on_admitted() вызывается, как только анализ
+        занял слот или место в очереди (порядок анализов одного чата определяется этим моментом).
+        Если анализ не может начаться сразу, вызывается on_queued(позиция в очереди, начиная с 1).
+        Бросает QueueFullError, если очередь заполнена.
+        """
+        future = asyncio.get_running_loop().create_future()
+        item = (chat_id, future)
+        self._waiting.append(item)
+        self._dispatch()
+        if not future.done():
+            if len(self._waiting) > self.max_queue:
+                self._waiting.remove(item)
+                raise QueueFullError(f"В очереди уже {self.max_queue} анализов")
+            position = self._waiting.index(item) + 1
+            logger.info(f"Анализ для чата {chat_id} поставлен в очередь, позиция {position}")
+        if on_admitted is not None:
+            on_admitted()
+        try:
+            if not future.done() and on_queued is not None:
+                await on_queued(position)
+            await future
+        except BaseException:
+            if future.done() and not future.cancelled():
+                # Слот уже выдан — вернуть его следующему в очереди
+                self._release(chat_id)
+            else:
+                future.cancel()
+                if item in self._waiting:
+                    self._waiting.remove(item)
+            raise
+        try:
+            return await job()
+        finally:
+            self._release(chat_id)
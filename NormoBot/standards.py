@@ -0,0 +1,161 @@
+import os
+import re
+from array import array
+from functools import lru_cache
+from typing import NamedTuple
+
+INDEX_PATH = os.path.join(os.path.dirname(__file__), "standards.tsv")
+
+ACTIVE = "active"
+REPLACED = "replaced"
+CANCELLED = "cancelled"
+_STATUSES = (ACTIVE, REPLACED, CANCELLED)
+
+# Ссылки на нормативные документы за один проход:
+# ГОСТ, ГОСТ Р, ГОСТ Р ИСО, НПБ, СП — год через дефис («ГОСТ 2.105-95»),
+# часть номера через дефис берётся, только если за ней следует год («ГОСТ IEC 61439-1-2013»);
+# ISO и IEC — год через двоеточие («ISO 12405-1:2011»).
+REFERENCE_RE = re.compile(
+    r"\b(?:"
+    r"(?P<national>ГОСТ(?:\s+[РP])?(?:\s+(?:ISO|ИСО|IEC|МЭК|EN|ЕН)(?:/(?:IEC|МЭК))?)?|НПБ|СП)\s+"
+    r"(?P<number>\d+(?:\.\d+)*(?:-\d+(?=\s*[-–—]\s*\d{4}(?!\d)))?)"
+    r"(?:\s*[-–—]\s*(?P<year>\d{4}|\d{2})(?!\d))?"
+    r"|(?P<international>(?:ISO|ИСО|IEC|МЭК)(?:/(?:IEC|МЭК))?)\s+"
+    r"(?P<part>\d+(?:-\d+)*)(?:\s*:\s*(?P<edition>\d{4})(?!\d))?"
+    r")"
+)
+
+_ALIASES = {"ИСО": "ISO", "МЭК": "IEC", "ЕН": "EN", "P": "Р"}
+_ALIAS_RE = re.compile(r"\b(?:ИСО|МЭК|ЕН|P)\b")
+_SEPARATOR_RE = re.compile(r"\s*([-–—:/])\s*")
+
+
+def designation_key(designation: str) -> str:
+    """Ключ обозначения: единое написание пробелов, тире и префиксов («ГОСТ Р ИСО» = «ГОСТ Р ISO»)."""
+    key = " ".join(designation.upper().split())
+    key = _SEPARATOR_RE.sub(lambda m: "-" if m.group(1) in "–—" else m.group(1), key)
+    return _ALIAS_RE.sub(lambda m: _ALIASES[m.group(0)], key)
+
+
+class Reference(NamedTuple):
+    """Ссылка на нормативный документ в тексте."""
+    designation: str  # как в тексте, с нормализованными пробелами
+    key: str  # ключ полного обозначения
+    base: str  # ключ обозначения без года
+    year: str | None
+    is_gost: bool
+
+
+def find_references(text: str) -> list[Reference]:
+    """Все ссылки на нормативные документы в порядке появления (без повторов)."""
+    references = {}
+    for match in REFERENCE_RE.finditer(text):
+        if match.group("national"):
+            base = f"{match.group('national')} {match.group('number')}"
+            year = match.group("year")
+            is_gost = match.group("national").startswith("ГОСТ")
+        else:
+            base = f"{match.group('international')} {match.group('part')}"
+            year = match.group("edition")
+            is_gost = False
+        designation = " ".join(match.group(0).split())
+        key = designation_key(designation)
+        references.setdefault(key, Reference(designation, key, designation_key(base), year, is_gost))
+    return list(references.values())
+
+
+class StandardStatus(NamedTuple):
+    """Сведения справочника о документе, на который ссылается ТЗ."""
+    designation: str  # как в тексте
+    status: str
+    successor: str  # действующая редакция для заменённого документа, иначе ""
+
+    def describe(self) -> str:
+        if self.status == REPLACED:
+            return f"{self.designation} — заменён {self.successor}"
+        if self.status == CANCELLED:
+            return f"{self.designation} — отменён без замены"
+        return f"{self.designation} — действует"
+
+
+class StandardsIndex:
+    """
+    Справочник нормативных документов: статус и действующая замена.
+    Обозначения хранятся в кортеже, статусы и ссылки на замену — в компактных
+    массивах; поиск по обозначению — один запрос к словарю.
+    """
+
+    def __init__(self, version: str, designations: list[str], statuses: list[str], successors: list[str]):
+        self.version = version
+        self._designations = tuple(designations)
+        self._rows = {designation_key(d): i for i, d in enumerate(designations)}
+        self._statuses = array("b", (_STATUSES.index(s) for s in statuses))
+        self._successors = array("i", (self._rows[designation_key(s)] if s else -1 for s in successors))
+        # Цепочки замен разворачиваются заранее: ГОСТ 2.601-2006 -> 2.601-2013 -> 2.601-2019
+        active = _STATUSES.index(ACTIVE)
+        for row, successor in enumerate(self._successors):
+            for _ in range(len(self._successors)):  # защита от циклов в данных
+                if successor < 0 or self._statuses[successor] == active or self._successors[successor] < 0:
+                    break
+                successor = self._successors[successor]
+            self._successors[row] = successor
+        # Действующая редакция по обозначению без года: «ГОСТ 2.105» -> «ГОСТ 2.105-2019»
+        self._current = {}
+        for key, row in self._rows.items():
+            if self._statuses[row] == active:
+                self._current[re.sub(r"(?:-\d{2}|-\d{4}|:\d{4})$", "", key)] = row
+
+    def __len__(self) -> int:
+        return len(self._designations)
+
+    @classmethod
+    def load(cls, path: str = INDEX_PATH) -> "StandardsIndex":
+        """Чтение справочника: строки «обозначение<TAB>статус[<TAB>замена]», комментарии с «#»."""
+        version = ""
+        designations, statuses, successors = [], [], []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.rstrip("\n")
+                if line.startswith("#"):
+                    if line[1:].strip().startswith("version:"):
+                        version = line.split(":", 1)[1].strip()
+                    continue
+                if not line.strip():
+                    continue
+                fields = line.split("\t")
+                designations.append(fields[0].strip())
+                statuses.append(fields[1].strip())
+                successors.append(fields[2].strip() if len(fields) > 2 else "")
+        return cls(version, designations, statuses, successors)
+
+    def resolve(self, reference: Reference) -> StandardStatus | None:
+        """Статус документа по ссылке с годом; None, если документа нет в справочнике."""
+        row = self._rows.get(reference.key)
+        if row is None:
+            return None
+        status = _STATUSES[self._statuses[row]]
+        successor = self._successors[row]
+        return StandardStatus(reference.designation, status, self._designations[successor] if successor >= 0 else "")
+
+    def current_edition(self, reference: Reference) -> str | None:
+        """Действующая редакция документа, на который сослались без года."""
+        row = self._current.get(reference.base)
+        return self._designations[row] if row is not None else None
+
+
+@lru_cache(maxsize=1)
+def get_index() -> StandardsIndex:
+    """Справочник загружается при первом обращении и дальше используется из памяти."""
+    return StandardsIndex.load()
+
+
+def check_references(text: str) -> list[StandardStatus]:
+    """Статусы документов из справочника, на которые ссылается текст (ссылки с годом)."""
+    index = get_index()
+    statuses = []
+    for reference in find_references(text):
+        if reference.year is not None:
+            status = index.resolve(reference)
+            if status is not None:
+                statuses.append(status)
+    return statuses
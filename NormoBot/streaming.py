@@ -0,0 +1,72 @@
+import logging
+import time
+from datetime import timedelta
+
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+logger = logging.getLogger(__name__)
+
+
+class ProgressMessage:
+    """
+    Сообщение о ходе проверки, которое постепенно заполняется текстом ответа
+    по мере генерации. Правки не чаще одной в interval секунд (лимиты Telegram).
+    """
+
+    cursor = " ▌"
+
+    def __init__(self, message, interval: float, max_length: int):
+        self.message = message
+        self.interval = interval
+        self.max_length = max_length
+        self.overflowed = False
+        self._parts = []
+        self._length = 0
+        self._next_edit = 0.0
+
+    def reset(self):
+        """Сброс накопленного текста (повторная попытка запроса к LLM)."""
+        self._parts = []
+        self._length = 0
+        self.overflowed = False
+
+    async def feed(self, chunk: str):
+        """Очередной фрагмент ответа LLM."""
+        self._parts.append(chunk)
+        self._length += len(chunk)
+        if self.overflowed:
+            return
+        if self._length + len(self.cursor) > self.max_length:
+            # Дальше ответ уйдёт PDF-файлом, промежуточные правки не нужны
+            self.overflowed = True
+            await self._edit("Ответ получается длинным, пришлю его PDF-файлом, когда проверка завершится...")
+            return
+        if time.monotonic() >= self._next_edit:
+            await self._edit("".join(self._parts) + self.cursor)
+
+    async def finish(self, text: str) -> bool:
+        """Замена сообщения итоговым ответом. False, если отредактировать сообщение не удалось."""
+        try:
+            await self.message.edit_text(text, parse_mode="Markdown")
+            return True
+        except BadRequest:
+            # Частичная или некорректная разметка — показываем как обычный текст
+            try:
+                await self.message.edit_text(text)
+                return True
+            except TelegramError as e:
+                logger.warning(f"Не удалось показать итоговый ответ в сообщении: {e}")
+                return False
+        except TelegramError as e:
+            logger.warning(f"Не удалось показать итоговый ответ в сообщении: {e}")
+            return False
+
+    async def _edit(self, text: str):
+        self._next_edit = time.monotonic() + self.interval
+        try:
+            await self.message.edit_text(text)
+        except RetryAfter as e:
+            delay = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else e.retry_after
+            self._next_edit = time.monotonic() + max(delay, self.interval)
+        except TelegramError as e:
+            logger.debug(f"Промежуточная правка сообщения не выполнена: {e}")
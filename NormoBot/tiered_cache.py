@@ -0,0 +1,199 @@
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+def normalize_text(text: str) -> str:
+    """Нормализация текста для ключа кэша: схлопывание пробельных символов."""
+    return " ".join(text.split())
+
+
+def content_key(*parts: str) -> str:
+    """SHA-256 от набора строк (части разделяются нулевым байтом)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class TieredCache:
+    """
+    Двухуровневый кэш: LRU в памяти и необязательный уровень в SQLite,
+    переживающий перезапуск. Значения должны сериализоваться в JSON.
+    Из цикла событий используются aget/aset: память проверяется сразу, а запросы к SQLite
+    выполняются в потоке. Память и база защищены разными блокировками, поэтому попадание
+    в память не ждёт медленного диска.
+    """
+
+    # Вытеснение на диске выполняется не на каждой записи, а раз в N записей
+    _trim_every = 32
+
+    def __init__(self, namespace: str, max_entries: int = 256, db_path: str | None = None,
+                 ttl: float | None = None, max_disk_entries: int = 5000):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._db = None
+        if db_path:
+            try:
+                self._db = sqlite3.connect(db_path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS cache ("
+                    "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                    "created REAL NOT NULL, accessed REAL NOT NULL, "
+                    "PRIMARY KEY (namespace, key))"
+                )
+                self._db.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (namespace, accessed)")
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Не удалось открыть дисковый кэш {db_path}: {e}")
+                self._db = None
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl is not None and now - created > self.ttl
+
+    def get(self, key: str):
+        """Значение по ключу или None. Попадание на диске поднимается в память."""
+        now = time.time()
+        value = self._get_memory(key, now)
+        return self._get_disk(key, now) if value is _MISSING else value
+
+    async def aget(self, key: str):
+        """get() для цикла событий: чтение SQLite выполняется в потоке."""
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is not _MISSING:
+            return value
+        if self._db is None:
+            return self._get_disk(key, now)
+        return await asyncio.to_thread(self._get_disk, key, now)
+
+    def set(self, key: str, value):
+        """Сохранение значения в обоих уровнях."""
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+        self._set_disk(key, value, now)
+
+    async def aset(self, key: str, value):
+        """set() для цикла событий: значение сразу доступно в памяти, запись в SQLite выполняется в потоке."""
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+        if self._db is not None:
+            await asyncio.to_thread(self._set_disk, key, value, now)
+
+    def _get_memory(self, key: str, now: float):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, value = entry
+                if not self._expired(created, now):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._memory[key]
+        return _MISSING
+
+    def _get_disk(self, key: str, now: float):
+        value = _MISSING
+        created = now
+        with self._db_lock:
+            if self._db is not None:
+                try:
+                    row = self._db.execute(
+                        "SELECT value, created FROM cache WHERE namespace = ? AND key = ?",
+                        (self.namespace, key),
+                    ).fetchone()
+                    if row is not None:
+                        value_json, created = row
+                        if not self._expired(created, now):
+                            self._db.execute(
+                                "UPDATE cache SET accessed = ? WHERE namespace = ? AND key = ?",
+                                (now, self.namespace, key),
+                            )
+                            self._db.commit()
+                            value = json.loads(value_json)
+                        else:
+                            self._db.execute("DELETE FROM cache WHERE namespace = ? AND key = ?",
+                                             (self.namespace, key))
+                            self._db.commit()
+                except sqlite3.Error as e:
+                    logger.error(f"Ошибка чтения дискового кэша: {e}")
+
+        with self._lock:
+            if value is _MISSING:
+                self.misses += 1
+                return None
+            self._remember(key, created, value)
+            self.hits += 1
+            self.disk_hits += 1
+            return value
+
+    def _set_disk(self, key: str, value, now: float):
+        with self._db_lock:
+            if self._db is None:
+                return
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO cache (namespace, key, value, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                    (self.namespace, key, json.dumps(value, ensure_ascii=False), now, now),
+                )
+                self._writes += 1
+                if self._writes % self._trim_every == 0:
+                    self._trim_disk(now)
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка записи в дисковый кэш: {e}")
+
+    def _remember(self, key: str, created: float, value):
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _trim_disk(self, now: float):
+        """Удаление просроченных записей и самых давно использованных сверх лимита."""
+        if self.ttl is not None:
+            self._db.execute("DELETE FROM cache WHERE namespace = ? AND created < ?", (self.namespace, now - self.ttl))
+        self._db.execute(
+            "DELETE FROM cache WHERE namespace = ? AND key IN ("
+            "SELECT key FROM cache WHERE namespace = ? ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.namespace, self.namespace, self.max_disk_entries),
+        )
+
+    def stats(self) -> dict:
+        """Счётчики попаданий и промахов."""
+        with self._lock:
+            return {
+                "namespace": self.namespace,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_entries": len(self._memory),
+            }
+
+    def close(self):
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,79 @@
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import NamedTuple
+
+
+class TraceRecord(NamedTuple):
+    offset: float  # секунды от создания трассировки
+    name: str | None  # имя шага; None для отдельного события
+    duration: float | None
+    level: int
+    message: str
+    args: tuple
+    error: BaseException | None
+
+    def format(self) -> str:
+        try:
+            text = self.message % self.args if self.args else self.message
+        except (TypeError, ValueError):
+            text = f"{self.message} {self.args!r}"
+        parts = [f"+{self.offset:.3f} с [{logging.getLevelName(self.level)}]"]
+        if self.name is not None:
+            parts.append(f"{self.name} ({self.duration:.3f} с)")
+        if text:
+            parts.append(text)
+        if self.error is not None:
+            parts.append(f"ошибка: {self.error!r}")
+        return " ".join(parts)
+
+
+class Tracer:
+    """
+    Трассировка обработки одного запроса: шаги с длительностью и события
+    в кольцевом буфере на capacity записей. Сообщения форматируются только
+    при выводе (dump), записи ниже level не сохраняются, но длительность шагов
+    учитывается всегда и доступна как метрики (timings).
+    """
+
+    def __init__(self, capacity: int = 64, level: int | str = logging.INFO):
+        self.level = logging.getLevelName(level) if isinstance(level, str) else level
+        self._records = deque(maxlen=capacity)
+        self._timings = {}
+        self._started = time.perf_counter()
+
+    def enabled(self, level: int) -> bool:
+        return level >= self.level
+
+    def event(self, message: str, *args, level: int = logging.INFO):
+        """Событие без длительности; message % args вычисляется только при выводе."""
+        if level >= self.level:
+            self._records.append(TraceRecord(time.perf_counter() - self._started, None, None, level, message, args, None))
+
+    @contextmanager
+    def span(self, name: str, message: str = "", *args, level: int = logging.INFO):
+        """Шаг обработки. Шаг, завершившийся исключением, записывается независимо от level."""
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            self._timings[name] = self._timings.get(name, 0.0) + duration
+            if level >= self.level or error is not None:
+                self._records.append(TraceRecord(start - self._started, name, duration, level, message, args, error))
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._started
+
+    def timings(self) -> dict[str, float]:
+        """Суммарная длительность каждого шага в миллисекундах."""
+        return {name: round(duration * 1000, 3) for name, duration in self._timings.items()}
+
+    def dump(self) -> str:
+        """Записи буфера в текстовом виде (для вывода при ошибке)."""
+        return "\n".join(record.format() for record in self._records)
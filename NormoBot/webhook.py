@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import signal
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application, BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class ChatOrderedProcessor(BaseUpdateProcessor):
+    """
+    Параллельная обработка обновлений с сохранением порядка внутри чата: обновления разных чатов
+    выполняются одновременно (не больше max_concurrent), обновления одного чата — по очереди
+    в порядке поступления. max_pending ограничивает все принятые обновления, включая ожидающие
+    своей очереди в чате, чтобы один чат с потоком сообщений не занимал все слоты обработки.
+    """
+
+    def __init__(self, max_concurrent: int, max_pending: int):
+        super().__init__(max(max_pending, max_concurrent))
+        self._running = asyncio.BoundedSemaphore(max_concurrent)
+        self._chats = {}  # chat_id -> [asyncio.Lock, число обновлений чата в обработке]
+
+    async def do_process_update(self, update: object, coroutine):
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            async with self._running:
+                await coroutine
+            return
+        entry = self._chats.setdefault(chat.id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0], self._running:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chats[chat.id]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
+def webhook_app(application: Application, path: str, secret: str | None) -> web.Application:
+    """
+    aiohttp-приложение вебхука: POST path кладёт обновление в application.update_queue и сразу
+    отвечает 200, обработка идёт в Application (см. ChatOrderedProcessor); GET /healthz — проверка.
+    """
+    async def receive(request: web.Request) -> web.Response:
+        if secret is not None and request.headers.get(SECRET_HEADER) != secret:
+            return web.Response(status=403)
+        try:
+            update = Update.de_json(await request.json(), application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Некорректное обновление в запросе вебхука: {e}")
+            return web.Response(status=400)
+        await application.update_queue.put(update)
+        return web.Response()
+
+    async def health(request: web.Request) -> web.Response:
+        return web.Response(text="ok")
+
+    server = web.Application()
+    server.router.add_post(path, receive)
+    server.router.add_get("/healthz", health)
+    return server
+
+
+async def serve_webhook(application: Application, url: str, host: str, port: int, path: str,
+                        secret: str | None, shutdown_timeout: float, stop: asyncio.Event | None = None):
+    """
+    Работа бота через вебхук до SIGINT/SIGTERM (или stop). При остановке сервер перестаёт
+    принимать запросы (Telegram повторит доставку после перезапуска), затем Application.stop
+    дорабатывает принятые обновления и задачи create_task — начатые и ожидающие в очереди
+    проверки, но не дольше shutdown_timeout секунд.
+    """
+    if stop is None:
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except NotImplementedError:
+                pass  # Windows: Ctrl+C отменяет задачу asyncio.run, остановка идёт через finally
+
+    runner = web.AppRunner(webhook_app(application, path, secret), access_log=None)
+    await application.initialize()
+    if application.post_init is not None:
+        await application.post_init(application)
+    await application.start()
+    try:
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        await application.bot.set_webhook(url.rstrip("/") + path, secret_token=secret,
+                                          allowed_updates=Update.ALL_TYPES)
+        logger.info(f"Вебхук {url.rstrip('/')}{path} принимает обновления на {host}:{port}")
+        await stop.wait()
+    finally:
+        logger.info("Остановка: новые обновления не принимаются, дорабатываются начатые проверки")
+        await runner.cleanup()
+        try:
+            await asyncio.wait_for(application.stop(), shutdown_timeout)
+        except TimeoutError:
+            logger.warning(f"Проверки не завершились за {shutdown_timeout} с и будут прерваны")
+        if application.post_stop is not None:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown is not None:
+            await application.post_shutdown(application)
+        logger.info("Бот остановлен")